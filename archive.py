@@ -0,0 +1,132 @@
+import argparse
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import Table, delete, func, insert, literal, literal_column, or_, select, union_all, update
+from sqlmodel import Session
+
+import db as database
+import rollups
+from db import env_int
+from models import Booking, PaymentModel, Service, ChangeLog, BookingArchive, PaymentArchive, ServiceArchive
+
+# Архивация истории: брони, выехавшие раньше горизонта, вместе с их платежами и услугами
+# переносятся в *_archive (INSERT ... SELECT + DELETE). Каждая пачка — отдельная короткая
+# транзакция; строки выбираются с SKIP LOCKED, поэтому работа не ждёт и не держит рабочие записи.
+# В журнале изменений (changes.py) удаления при переносе помечаются как archive, а не delete.
+#
+#   python archive.py run --horizon-days 730 --batch-size 1000 --pause-ms 50
+#   python archive.py status
+#
+# Чтение с архивом — параметр include_archived у /guests/{id}/bookings, /guests/{id}/services,
+# /bookings/{id} и /bookings/{id}/payments; отчёты (rollups.py) учитывают архив всегда.
+ARCHIVE_HORIZON_DAYS = env_int("ARCHIVE_HORIZON_DAYS", 730)
+ARCHIVE_BATCH_SIZE = env_int("ARCHIVE_BATCH_SIZE", 1000)
+# Брони в этих статусах не переносятся, даже если дата выезда за горизонтом
+OPEN_STATUSES = {"checked_in"}
+ARCHIVES = {
+    Booking.__table__.name: BookingArchive,
+    PaymentModel.__table__.name: PaymentArchive,
+    Service.__table__.name: ServiceArchive,
+}
+ARCHIVED = "archive"
+
+
+# Строки модели без архива или вместе с ним (UNION ALL); колонки — как у row_query
+def history_query(model, criteria: Callable[[Table], object], include_archived: bool = False):
+    live = model.__table__
+    if not include_archived:
+        return select(*live.c).where(criteria(live)).order_by(live.c.id)
+    archive = ARCHIVES[live.name]
+    return union_all(
+        select(*live.c).where(criteria(live)),
+        select(*(archive.c[column.name] for column in live.c)).where(criteria(archive)),
+    ).order_by(literal_column("id"))
+
+
+def archived_row(session: Session, model, object_id: int):
+    live = model.__table__
+    archive = ARCHIVES[live.name]
+    return session.execute(select(*(archive.c[column.name] for column in live.c))
+                           .where(archive.c.id == object_id)).first()
+
+
+def move_rows(session: Session, table: Table, criteria, now: datetime) -> List[int]:
+    archive = ARCHIVES[table.name]
+    columns = [column.name for column in table.c]
+    session.execute(insert(archive).from_select(columns + ["archived_at"],
+                                                select(*table.c, literal(now)).where(criteria)))
+    return list(session.execute(delete(table).where(criteria).returning(table.c.id)).scalars())
+
+
+# Одна пачка: платежи и услуги броней, затем сами брони. Возвращает число строк по таблицам
+def archive_batch(session: Session, cutoff: date, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    booking = Booking.__table__
+    ids = list(session.execute(
+        select(booking.c.id)
+        .where(booking.c.check_out_date < cutoff,
+               or_(booking.c.status == None, booking.c.status.not_in(OPEN_STATUSES)))
+        .order_by(booking.c.check_out_date, booking.c.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars())
+    if not ids:
+        return {}
+    rollups.lock(session)  # пересчёт итогов не должен увидеть строки между таблицами
+    last_seq = session.execute(select(func.max(ChangeLog.seq))).scalar() or 0
+    now = datetime.utcnow()
+    moved = {}
+    for table, column in ((PaymentModel.__table__, "booking_id"), (Service.__table__, "booking_id"), (booking, "id")):
+        moved[table.name] = move_rows(session, table, table.c[column].in_(ids), now)
+    for table_name, row_ids in moved.items():
+        if row_ids:
+            session.execute(update(ChangeLog)
+                            .where(ChangeLog.seq > last_seq, ChangeLog.table_name == table_name,
+                                   ChangeLog.row_id.in_(row_ids), ChangeLog.op == "delete")
+                            .values(op=ARCHIVED))
+    session.commit()
+    return {table_name: len(row_ids) for table_name, row_ids in moved.items()}
+
+
+def run(horizon_days: int = ARCHIVE_HORIZON_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+        pause: float = 0.0, today: date = None) -> Dict[str, int]:
+    cutoff = (today or date.today()) - timedelta(days=horizon_days)
+    totals = {name: 0 for name in ARCHIVES}
+    with Session(database.engine) as session:
+        while True:
+            moved = archive_batch(session, cutoff, batch_size)
+            if not moved:
+                return totals
+            for name, count in moved.items():
+                totals[name] += count
+            if pause:
+                time.sleep(pause)
+
+
+def status() -> Dict[str, tuple]:
+    with Session(database.engine) as session:
+        return {name: (session.execute(select(func.count()).select_from(archive.metadata.tables[name])).scalar(),
+                       session.execute(select(func.count()).select_from(archive)).scalar())
+                for name, archive in ARCHIVES.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Архивация завершённых броней")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--horizon-days", type=int, default=ARCHIVE_HORIZON_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--pause-ms", type=int, default=0)
+    args = parser.parse_args()
+    if args.command == "run":
+        started = time.perf_counter()
+        totals = run(args.horizon_days, args.batch_size, args.pause_ms / 1000)
+        print(", ".join(f"{name}: {count}" for name, count in totals.items()),
+              f"in {time.perf_counter() - started:.1f}s")
+    else:
+        for name, (live, archived) in status().items():
+            print(f"{name}: {live} live, {archived} archived")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+from typing import List, Optional
+from datetime import date
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from sqlalchemy.exc import IntegrityError
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import db as database
+from db import get_async_session
+from models import Guest, RoomModel, Booking, PaymentModel, Service, Administrator
+from pagination import build_query, DEFAULT_LIMIT, MAX_LIMIT, STREAM_BATCH
+from fastjson import dumps, row_dict, rows_response
+from availability import availability_index
+from schedule import schedule_index, reserved_slot, SCHEDULE_FIELDS
+from rollups import (
+    refresh_rollups, booking_ranges, payment_ranges, room_ranges, booking_stay, payment_day,
+    BOOKING_FIELDS, PAYMENT_FIELDS, ROOM_FIELDS,
+)
+from cache import room_cache, MISSING
+from pricing import price_booking, check_stay_update
+from payments import (
+    set_payment_status, refresh_payment_status, payment_booking_ids, transaction_exists, transaction_archived,
+    PAYMENT_STATUS_FIELDS,
+)
+from writes import async_update_returning, async_delete_returning, to_model
+from archive import history_query, archived_row
+from holds import confirming_hold
+from schemas import (
+    GuestCreate, GuestUpdate, RoomCreate, RoomUpdate, BookingCreate, BookingUpdate,
+    PaymentCreate, PaymentUpdate, ServiceCreate, ServiceUpdate,
+)
+
+# Асинхронные версии CRUD-маршрутов (AsyncSession + asyncpg).
+# Подключаются в main.py при USE_ASYNC_DB=1 раньше синхронных и перекрывают их;
+# в схеме OpenAPI остаются синхронные описания с теми же параметрами и моделями.
+# Идентификаторы объявлены как {id:int}, чтобы не перехватывать /bookings/details и т.п.
+router = APIRouter(include_in_schema=False)
+
+# Общие помощники
+
+async def get_or_404(db: AsyncSession, model, object_id: int, name: str):
+    obj = await db.get(model, object_id)
+    if not obj:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    return obj
+
+async def create_object(db: AsyncSession, model, data):
+    obj = model(**data.dict())
+    db.add(obj)
+    await db.commit()
+    await db.refresh(obj)
+    return obj
+
+# Изменение и удаление одним выражением с RETURNING (см. writes.py)
+async def update_object(db: AsyncSession, model, object_id: int, data, name: str):
+    obj = await async_update_returning(db, model, object_id, data.dict(exclude_unset=True))
+    if not obj:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    return obj
+
+async def delete_object(db: AsyncSession, model, object_id: int, name: str):
+    if not await async_delete_returning(db, model, object_id):
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    return {"message": f"{name} deleted successfully"}
+
+# Списки отдаются быстрым путём из fastjson.py: строки курсора сразу в JSON
+async def fetch_page(db: AsyncSession, query, limit: int):
+    rows = (await db.exec(query.limit(limit))).all()
+    headers = {}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = str(rows[-1].id)
+    return rows_response(rows, headers=headers)
+
+async def list_or_404(db: AsyncSession, query, name: str):
+    rows = (await db.execute(query)).all()
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"{name} not found")
+    return rows_response(rows)
+
+# NDJSON через серверный курсор в собственной асинхронной сессии
+def stream_ndjson(query):
+    async def generate():
+        async with AsyncSession(database.async_engine) as session:
+            result = await session.stream(query.execution_options(yield_per=STREAM_BATCH))
+            async for partition in result.partitions():
+                yield b"".join(dumps(row_dict(row)) + b"\n" for row in partition)
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+#Guests
+@router.get("/guests", response_model=List[Guest])
+async def get_all_guests(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                         after: Optional[int] = None,
+                         stream: bool = False,
+                         db: AsyncSession = Depends(get_async_session)):
+    query = build_query(Guest, after=after, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return await fetch_page(db, query, limit)
+
+@router.get("/guests/{guest_id:int}", response_model=Guest)
+async def get_guest(guest_id: int, db: AsyncSession = Depends(get_async_session)):
+    return await get_or_404(db, Guest, guest_id, "Guest")
+
+@router.post("/guests", response_model=Guest)
+async def create_guest(guest_data: GuestCreate, db: AsyncSession = Depends(get_async_session)):
+    return await create_object(db, Guest, guest_data)
+
+@router.put("/guests/{guest_id:int}", response_model=Guest)
+async def update_guest(guest_id: int, guest_data: GuestUpdate, db: AsyncSession = Depends(get_async_session)):
+    return await update_object(db, Guest, guest_id, guest_data, "Guest")
+
+@router.delete("/guests/{guest_id:int}")
+async def delete_guest(guest_id: int, db: AsyncSession = Depends(get_async_session)):
+    return await delete_object(db, Guest, guest_id, "Guest")
+
+@router.get("/guests/{guest_id:int}/bookings", response_model=List[Booking])
+async def get_bookings_by_guest(guest_id: int, include_archived: bool = False,
+                                db: AsyncSession = Depends(get_async_session)):
+    query = history_query(Booking, lambda table: table.c.guest_id == guest_id, include_archived)
+    return await list_or_404(db, query, "Bookings")
+
+@router.get("/guests/{guest_id:int}/services", response_model=List[Service])
+async def get_services_by_guest(guest_id: int, include_archived: bool = False,
+                                db: AsyncSession = Depends(get_async_session)):
+    query = history_query(Service, lambda table: table.c.guest_id == guest_id, include_archived)
+    return await list_or_404(db, query, "Services")
+
+# Bookings
+@router.get("/bookings", response_model=List[Booking])
+async def get_all_bookings(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                           after: Optional[int] = None,
+                           status: Optional[str] = None,
+                           guest_id: Optional[int] = None,
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None,
+                           stream: bool = False,
+                           db: AsyncSession = Depends(get_async_session)):
+    query = build_query(Booking, after=after, status=status, guest_id=guest_id,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return await fetch_page(db, query, limit)
+
+@router.get("/bookings/{booking_id:int}", response_model=Booking)
+async def get_booking(booking_id: int, include_archived: bool = False, db: AsyncSession = Depends(get_async_session)):
+    booking = await db.get(Booking, booking_id)
+    if not booking and include_archived:
+        booking = to_model(Booking, await db.run_sync(archived_row, Booking, booking_id))
+    if not booking:
+        raise HTTPException(status_code=404, detail="Booking not found")
+    return booking
+
+# Пересчёт дневных итогов (rollups.py) синхронным кодом внутри AsyncSession
+async def refresh_days(db: AsyncSession, ranges):
+    await db.run_sync(refresh_rollups, ranges)
+
+# Нарушение ограничения booking_no_overlap (PostgreSQL, SQLSTATE 23P01) -> 409
+async def booking_conflict(db: AsyncSession, error: IntegrityError):
+    await db.rollback()
+    if getattr(error.orig, "sqlstate", None) == "23P01" or getattr(error.orig, "pgcode", None) == "23P01":
+        raise HTTPException(status_code=409, detail="Room is already booked for these dates")
+    raise error
+
+@router.post("/bookings", response_model=Booking)
+async def create_booking(booking_data: BookingCreate, manual_price: bool = False,
+                         db: AsyncSession = Depends(get_async_session)):
+    room = await cached_room(db, booking_data.room_id) if booking_data.room_id and not manual_price else None
+    values = price_booking(booking_data.dict(), room, manual_price)
+    with confirming_hold(values):
+        booking = Booking(**values)
+        db.add(booking)
+        try:
+            await db.commit()
+        except IntegrityError as error:
+            await booking_conflict(db, error)
+        await db.refresh(booking)
+        availability_index.upsert(booking)
+    await refresh_days(db, [booking_stay(booking)])
+    return booking
+
+@router.put("/bookings/{booking_id:int}", response_model=Booking)
+async def update_booking(booking_id: int, booking_data: BookingUpdate, db: AsyncSession = Depends(get_async_session)):
+    await db.run_sync(check_stay_update, booking_id, booking_data.dict(exclude_unset=True))
+    changed = BOOKING_FIELDS & booking_data.dict(exclude_unset=True).keys()
+    ranges = await db.run_sync(booking_ranges, [booking_id]) if changed else None
+    try:
+        booking = await update_object(db, Booking, booking_id, booking_data, "Booking")
+    except IntegrityError as error:
+        await booking_conflict(db, error)
+    availability_index.upsert(booking)
+    if "total_price" in booking_data.dict(exclude_unset=True):
+        statuses = await db.run_sync(refresh_payment_status, [booking.id])
+        booking.payment_status = statuses.get(booking.id, booking.payment_status)
+    if ranges is not None:
+        await refresh_days(db, ranges + [booking_stay(booking)])
+    return booking
+
+@router.delete("/bookings/{booking_id:int}")
+async def delete_booking(booking_id: int, db: AsyncSession = Depends(get_async_session)):
+    ranges = await db.run_sync(booking_ranges, [booking_id])
+    result = await delete_object(db, Booking, booking_id, "Booking")
+    availability_index.remove(booking_id)
+    await refresh_days(db, ranges)
+    return result
+
+@router.get("/bookings/{booking_id:int}/payments", response_model=List[PaymentModel])
+async def get_payments_by_booking(booking_id: int, include_archived: bool = False,
+                                  db: AsyncSession = Depends(get_async_session)):
+    query = history_query(PaymentModel, lambda table: table.c.booking_id == booking_id, include_archived)
+    return await list_or_404(db, query, "Payments")
+
+# Rooms (через тот же room_cache, что и синхронные маршруты)
+@router.get("/rooms", response_model=List[RoomModel])
+async def get_available_rooms(db: AsyncSession = Depends(get_async_session)):
+    rooms = room_cache.get(("active",))
+    if rooms is MISSING:
+        rooms = (await db.exec(select(RoomModel).where(RoomModel.is_active == True).order_by(RoomModel.id))).all()
+        db.expunge_all()
+        rooms = tuple(rooms)
+        room_cache.set(("active",), rooms)
+    return rooms
+
+async def cached_room(db: AsyncSession, room_id: int):
+    room = room_cache.get(("room", room_id))
+    if room is MISSING:
+        room = await db.get(RoomModel, room_id)
+        if room:
+            db.expunge(room)
+            room_cache.set(("room", room_id), room)
+    return room
+
+@router.get("/rooms/{room_id:int}", response_model=RoomModel)
+async def get_room(room_id: int, db: AsyncSession = Depends(get_async_session)):
+    room = await cached_room(db, room_id)
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room
+
+@router.post("/rooms", response_model=RoomModel)
+async def create_room(room_data: RoomCreate, db: AsyncSession = Depends(get_async_session)):
+    room = await create_object(db, RoomModel, room_data)
+    room_cache.invalidate()
+    return room
+
+@router.put("/rooms/{room_id:int}", response_model=RoomModel)
+async def update_room(room_id: int, room_data: RoomUpdate, db: AsyncSession = Depends(get_async_session)):
+    room = await update_object(db, RoomModel, room_id, room_data, "Room")
+    room_cache.invalidate()
+    if ROOM_FIELDS & room_data.dict(exclude_unset=True).keys():
+        await refresh_days(db, await db.run_sync(room_ranges, room_id))
+    return room
+
+@router.delete("/rooms/{room_id:int}")
+async def delete_room(room_id: int, db: AsyncSession = Depends(get_async_session)):
+    ranges = await db.run_sync(room_ranges, room_id)
+    result = await delete_object(db, RoomModel, room_id, "Room")
+    room_cache.invalidate()
+    await refresh_days(db, ranges)
+    return result
+
+# Services
+@router.get("/services", response_model=List[Service])
+async def get_all_services(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                           after: Optional[int] = None,
+                           status: Optional[str] = None,
+                           guest_id: Optional[int] = None,
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None,
+                           stream: bool = False,
+                           db: AsyncSession = Depends(get_async_session)):
+    query = build_query(Service, after=after, status=status, guest_id=guest_id,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return await fetch_page(db, query, limit)
+
+@router.get("/services/{service_id:int}", response_model=Service)
+async def get_service(service_id: int, db: AsyncSession = Depends(get_async_session)):
+    return await get_or_404(db, Service, service_id, "Service")
+
+@router.post("/services", response_model=Service)
+async def create_service(service_data: ServiceCreate, db: AsyncSession = Depends(get_async_session)):
+    with reserved_slot(service_data.dict()):
+        service = await create_object(db, Service, service_data)
+        schedule_index.upsert(service)
+    return service
+
+@router.put("/services/{service_id:int}", response_model=Service)
+async def update_service(service_id: int, service_data: ServiceUpdate, db: AsyncSession = Depends(get_async_session)):
+    values = service_data.dict(exclude_unset=True)
+    merged = {}
+    if SCHEDULE_FIELDS & values.keys():
+        current = await get_or_404(db, Service, service_id, "Service")
+        merged = {**current.dict(), **values}
+    with reserved_slot(merged, service_id):
+        service = await update_object(db, Service, service_id, service_data, "Service")
+        schedule_index.upsert(service)
+    return service
+
+@router.delete("/services/{service_id:int}")
+async def delete_service(service_id: int, db: AsyncSession = Depends(get_async_session)):
+    result = await delete_object(db, Service, service_id, "Service")
+    schedule_index.remove(service_id)
+    return result
+
+# Payments
+@router.get("/payments", response_model=List[PaymentModel])
+async def get_all_payments(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                           after: Optional[int] = None,
+                           status: Optional[str] = None,
+                           date_from: Optional[date] = None,
+                           date_to: Optional[date] = None,
+                           stream: bool = False,
+                           db: AsyncSession = Depends(get_async_session)):
+    query = build_query(PaymentModel, after=after, status=status,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return await fetch_page(db, query, limit)
+
+@router.get("/payments/{payment_id:int}", response_model=PaymentModel)
+async def get_payment(payment_id: int, db: AsyncSession = Depends(get_async_session)):
+    return await get_or_404(db, PaymentModel, payment_id, "Payment")
+
+async def payment_conflict(db: AsyncSession, error: IntegrityError, transaction_id: Optional[str]):
+    await db.rollback()
+    if await db.run_sync(transaction_exists, transaction_id):
+        raise HTTPException(status_code=409, detail="Payment with this transaction_id already exists")
+    raise error
+
+async def check_transaction_free(db: AsyncSession, transaction_id: Optional[str]):
+    if await db.run_sync(transaction_archived, transaction_id):
+        raise HTTPException(status_code=409, detail="Payment with this transaction_id already exists")
+
+@router.post("/payments", response_model=PaymentModel)
+async def create_payment(payment_data: PaymentCreate, db: AsyncSession = Depends(get_async_session)):
+    await check_transaction_free(db, payment_data.transaction_id)
+    payment = PaymentModel(**payment_data.dict())
+    db.add(payment)
+    try:
+        await db.flush()
+        await db.run_sync(set_payment_status, [payment.booking_id])
+        await db.commit()
+    except IntegrityError as error:
+        await payment_conflict(db, error, payment_data.transaction_id)
+    await db.refresh(payment)
+    await refresh_days(db, [payment_day(payment)])
+    return payment
+
+@router.put("/payments/{payment_id:int}", response_model=PaymentModel)
+async def update_payment(payment_id: int, payment_data: PaymentUpdate, db: AsyncSession = Depends(get_async_session)):
+    values = payment_data.dict(exclude_unset=True)
+    await check_transaction_free(db, values.get("transaction_id"))
+    ranges = await db.run_sync(payment_ranges, [payment_id]) if PAYMENT_FIELDS & values.keys() else None
+    booking_ids = (await db.run_sync(payment_booking_ids, [payment_id])
+                   if PAYMENT_STATUS_FIELDS & values.keys() else None)
+    try:
+        payment = await update_object(db, PaymentModel, payment_id, payment_data, "Payment")
+    except IntegrityError as error:
+        await payment_conflict(db, error, values.get("transaction_id"))
+    if booking_ids is not None:
+        await db.run_sync(refresh_payment_status, booking_ids + [payment.booking_id])
+    if ranges is not None:
+        await refresh_days(db, ranges + [payment_day(payment)])
+    return payment
+
+@router.delete("/payments/{payment_id:int}")
+async def delete_payment(payment_id: int, db: AsyncSession = Depends(get_async_session)):
+    ranges = await db.run_sync(payment_ranges, [payment_id])
+    booking_ids = await db.run_sync(payment_booking_ids, [payment_id])
+    result = await delete_object(db, PaymentModel, payment_id, "Payment")
+    await db.run_sync(refresh_payment_status, booking_ids)
+    await refresh_days(db, ranges)
+    return result
+
+# Administrators
+@router.get("/administrators", response_model=List[Administrator])
+async def get_all_administrators(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                                 after: Optional[int] = None,
+                                 stream: bool = False,
+                                 db: AsyncSession = Depends(get_async_session)):
+    query = build_query(Administrator, after=after, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return await fetch_page(db, query, limit)
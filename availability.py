@@ -0,0 +1,143 @@
+import os
+import threading
+from bisect import bisect_left
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from models import Booking
+
+# Статусы, при которых бронь не занимает номер
+INACTIVE_STATUSES = {"cancelled", "canceled"}
+# Индекс держит брони, выезд по которым не раньше чем AVAILABILITY_HISTORY_DAYS назад;
+# запросы на более ранние даты идут в БД. db импортирует этот модуль через миграции
+# (rollups), поэтому настройка читается без env_int, а db импортируется в функции
+AVAILABILITY_HISTORY_DAYS = int(os.getenv("AVAILABILITY_HISTORY_DAYS") or 0)
+
+
+# Занятость одного номера: брони и отсортированные непересекающиеся блоки [начало, конец)
+class RoomTimeline:
+    def __init__(self):
+        self.bookings: Dict[int, Tuple[date, date]] = {}
+        self.starts: List[date] = []
+        self.ends: List[date] = []
+
+    # Пересобрать блоки после изменения (пересекающиеся старые брони сливаются)
+    def rebuild(self):
+        starts, ends = [], []
+        for start, end in sorted(self.bookings.values()):
+            if ends and start <= ends[-1]:
+                ends[-1] = max(ends[-1], end)
+            else:
+                starts.append(start)
+                ends.append(end)
+        self.starts, self.ends = starts, ends
+
+    # Свободен ли номер на [check_in, check_out): один бинарный поиск
+    def is_free(self, check_in: date, check_out: date) -> bool:
+        idx = bisect_left(self.starts, check_out)
+        return idx == 0 or self.ends[idx - 1] <= check_in
+
+
+# Индекс занятости по всем номерам; живёт в памяти процесса
+class AvailabilityIndex:
+    def __init__(self):
+        self.rooms: Dict[int, RoomTimeline] = {}
+        self.booking_rooms: Dict[int, int] = {}
+        self.since: Optional[date] = None
+        self.lock = threading.Lock()
+
+    # Загрузить действующие брони с выездом от горизонта одним запросом: прошлые брони
+    # на свободу номеров с этого дня уже не влияют
+    def load(self, session: Session, today: Optional[date] = None):
+        since = (today or date.today()) - timedelta(days=AVAILABILITY_HISTORY_DAYS)
+        rows = session.exec(
+            select(Booking.id, Booking.room_id, Booking.check_in_date,
+                   Booking.check_out_date, Booking.status)
+            .where(Booking.room_id != None, Booking.check_out_date >= since)
+        ).all()
+        with self.lock:
+            self.rooms.clear()
+            self.booking_rooms.clear()
+            self.since = since
+            for booking_id, room_id, check_in, check_out, status in rows:
+                if status in INACTIVE_STATUSES:
+                    continue
+                timeline = self.rooms.setdefault(room_id, RoomTimeline())
+                timeline.bookings[booking_id] = (check_in, check_out)
+                self.booking_rooms[booking_id] = room_id
+            for timeline in self.rooms.values():
+                timeline.rebuild()
+
+    def _remove(self, booking_id: int):
+        room_id = self.booking_rooms.pop(booking_id, None)
+        if room_id is not None:
+            timeline = self.rooms[room_id]
+            timeline.bookings.pop(booking_id, None)
+            timeline.rebuild()
+
+    # Добавить или обновить бронь после коммита
+    def upsert(self, booking: Booking):
+        with self.lock:
+            self._remove(booking.id)
+            if booking.room_id is None or booking.status in INACTIVE_STATUSES:
+                return
+            timeline = self.rooms.setdefault(booking.room_id, RoomTimeline())
+            timeline.bookings[booking.id] = (booking.check_in_date, booking.check_out_date)
+            self.booking_rooms[booking.id] = booking.room_id
+            timeline.rebuild()
+
+    def remove(self, booking_id: int):
+        with self.lock:
+            self._remove(booking_id)
+
+    def is_free(self, room_id: int, check_in: date, check_out: date) -> bool:
+        timeline = self.rooms.get(room_id)
+        return timeline is None or timeline.is_free(check_in, check_out)
+
+    # Бронь, пересекающая диапазон с этого дня, выезжает позже него — значит, она в индексе
+    def covers(self, check_in: date) -> bool:
+        return self.since is not None and check_in >= self.since
+
+    # Отобрать свободные номера из переданных id
+    def free_rooms(self, room_ids: List[int], check_in: date, check_out: date) -> List[int]:
+        return self.free_rooms_batch(room_ids, [(check_in, check_out)])[0]
+
+    # Пакетный режим для календаря: много диапазонов за один вызов; диапазоны
+    # до горизонта индекса проверяются по БД
+    def free_rooms_batch(self, room_ids: List[int],
+                         ranges: List[Tuple[date, date]]) -> List[List[int]]:
+        with self.lock:
+            result = [
+                [room_id for room_id in room_ids if self.is_free(room_id, check_in, check_out)]
+                if self.covers(check_in) else None
+                for check_in, check_out in ranges
+            ]
+        return [free if free is not None else free_rooms_from_db(room_ids, check_in, check_out)
+                for free, (check_in, check_out) in zip(result, ranges)]
+
+
+availability_index = AvailabilityIndex()
+
+
+# Свободные номера на прошедшие даты: пересекающиеся действующие брони из БД
+def free_rooms_from_db(room_ids: List[int], check_in: date, check_out: date) -> List[int]:
+    import db as database
+
+    if not room_ids:
+        return []
+    with Session(database.engine) as session:
+        busy = set(session.exec(
+            select(Booking.room_id)
+            .where(Booking.room_id.in_(room_ids), Booking.check_in_date < check_out,
+                   Booking.check_out_date > check_in,
+                   or_(Booking.status == None, Booking.status.not_in(INACTIVE_STATUSES)))
+        ).all())
+    return [room_id for room_id in room_ids if room_id not in busy]
+
+
+# Отбор номеров по вместимости; max_guests не задан — ограничения нет
+def fits_guests(max_guests: Optional[int], guests: Optional[int]) -> bool:
+    return guests is None or max_guests is None or max_guests >= guests
@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+# Сравнение сериализации списков: прежний путь (ORM-объекты + response_model,
+# проверка и сериализация Pydantic в FastAPI) против быстрого пути fastjson.py
+# (строки курсора -> orjson). Оба приложения отдают одинаковый JSON.
+#
+#   python bench_serialization.py --rows 5000 --repeat 20
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк JSON-сериализации списков")
+    parser.add_argument("--rows", type=int, default=5000, help="строк в ответе")
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args()
+
+
+def timed(client, path: str, repeat: int):
+    client.get(path)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return response, samples[len(samples) // 2]
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from fastapi import FastAPI, Depends
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, select
+    import db
+    import seed
+    from main import get_db
+    from models import Booking
+    from fastjson import row_query, rows_response
+
+    db.create_db_and_tables()
+    seed.generate(rooms=max(args.rows // 150, 1), guests=1000, years=1, occupancy=0.8,
+                  services_per_stay=0, seed=1)
+
+    app = FastAPI()
+
+    @app.get("/orm", response_model=List[Booking])
+    def orm_path(session: Session = Depends(get_db)):
+        return session.exec(select(Booking).order_by(Booking.id).limit(args.rows)).all()
+
+    @app.get("/fast", response_model=List[Booking])
+    def fast_path(session: Session = Depends(get_db)):
+        return rows_response(session.exec(row_query(Booking).limit(args.rows)).all())
+
+    with TestClient(app) as client:
+        orm_response, orm_time = timed(client, "/orm", args.repeat)
+        fast_response, fast_time = timed(client, "/fast", args.repeat)
+
+    if json.loads(orm_response.content) != json.loads(fast_response.content):
+        sys.exit("responses differ")
+    rows = len(json.loads(fast_response.content))
+    print(f"rows per response: {rows}")
+    print(f"orm + response_model: {orm_time * 1000:8.1f} ms")
+    print(f"fast rows + orjson:   {fast_time * 1000:8.1f} ms  ({orm_time / fast_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
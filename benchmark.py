@@ -0,0 +1,213 @@
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+# Нагрузочный прогон приложения из main.py: смесь запросов, перцентили задержки,
+# число SQL-запросов на вызов. Результат пишется в JSON и сравнивается с эталоном.
+#
+#   python benchmark.py --requests 2000 --output bench.json
+#   python benchmark.py --baseline bench.json   # код выхода 1 при регрессии
+#
+# Без --database-url поднимается временная SQLite и заполняется генератором из seed.py.
+
+DEFAULT_MIX = "list=25,get=25,create=10,availability=20,details=20"
+TODAY = date(2026, 1, 1)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк эндпоинтов Hotel API")
+    parser.add_argument("--database-url", help="DSN; по умолчанию временная SQLite")
+    parser.add_argument("--no-generate", action="store_true", help="не заполнять базу (уже заполнена)")
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--guests", type=int, default=2000)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="доли сценариев, например list=50,get=50")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p95, доля")
+    return parser.parse_args()
+
+
+# Перцентиль по ближайшему рангу
+def percentile(sorted_values, share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(share * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        self.lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args):
+        with self.lock:
+            self.count += 1
+
+
+class Scenarios:
+    def __init__(self, client, rng: random.Random, ids: dict):
+        self.client = client
+        self.rng = rng
+        self.ids = ids
+
+    def list(self):
+        path = self.rng.choice(["/guests", "/bookings", "/payments", "/services"])
+        return self.client.get(path, params={"limit": 100})
+
+    def get(self):
+        kind, ids = self.rng.choice([("guests", self.ids["guest"]), ("bookings", self.ids["booking"]),
+                                     ("rooms", self.ids["room"])])
+        return self.client.get(f"/{kind}/{self.rng.choice(ids)}")
+
+    def create(self):
+        check_in = TODAY + timedelta(days=self.rng.randint(400, 2000))
+        return self.client.post("/bookings", json={
+            "guest_id": self.rng.choice(self.ids["guest"]),
+            "room_id": self.rng.choice(self.ids["room"]),
+            "check_in_date": check_in.isoformat(),
+            "check_out_date": (check_in + timedelta(days=self.rng.randint(1, 7))).isoformat(),
+            "status": "confirmed",
+            "total_price": "100.00",
+            "guests_count": 1,
+        })
+
+    def availability(self):
+        check_in = TODAY + timedelta(days=self.rng.randint(-200, 150))
+        return self.client.get("/rooms/availability", params={
+            "from": check_in.isoformat(),
+            "to": (check_in + timedelta(days=self.rng.randint(1, 7))).isoformat(),
+            "guests": self.rng.randint(1, 3),
+        })
+
+    def details(self):
+        return self.client.get("/bookings/details", params={"limit": 100,
+                                                            "after": self.rng.choice(self.ids["booking"])})
+
+
+def parse_mix(mix: str):
+    names, weights = [], []
+    for part in mix.split(","):
+        name, weight = part.split("=")
+        names.append(name.strip())
+        weights.append(float(weight))
+    return names, weights
+
+
+def run(args):
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from fastapi.testclient import TestClient
+    from sqlmodel import Session, select
+    import db
+    import main
+    import seed
+    from models import Guest, RoomModel, Booking
+
+    db.create_db_and_tables()
+    if not args.no_generate:
+        seed.generate(args.rooms, args.guests, args.years, 0.75, 0.5, args.seed, today=TODAY)
+    with Session(db.engine) as session:
+        ids = {
+            "guest": session.exec(select(Guest.id)).all(),
+            "room": session.exec(select(RoomModel.id)).all(),
+            "booking": session.exec(select(Booking.id)).all(),
+        }
+
+    counter = QueryCounter(db.engine)
+    rng = random.Random(args.seed)
+    names, weights = parse_mix(args.mix)
+    results = {name: {"latencies": [], "queries": 0, "errors": 0} for name in names}
+
+    with TestClient(main.app) as client:
+        scenarios = Scenarios(client, rng, ids)
+        for _ in range(args.warmup):
+            getattr(scenarios, rng.choices(names, weights)[0])()
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            name = rng.choices(names, weights)[0]
+            queries_before = counter.count
+            start = time.perf_counter()
+            response = getattr(scenarios, name)()
+            elapsed = time.perf_counter() - start
+            result = results[name]
+            result["latencies"].append(elapsed)
+            result["queries"] += counter.count - queries_before
+            if response.status_code >= 400:
+                result["errors"] += 1
+        total = time.perf_counter() - started
+
+    report = {
+        "config": {"database": db.engine.dialect.name, "rooms": args.rooms, "guests": args.guests,
+                   "years": args.years, "requests": args.requests, "mix": args.mix, "seed": args.seed},
+        "throughput_rps": round(args.requests / total, 1),
+        "endpoints": {},
+    }
+    for name, result in results.items():
+        latencies = sorted(result["latencies"])
+        count = len(latencies)
+        if not count:
+            continue
+        report["endpoints"][name] = {
+            "count": count,
+            "errors": result["errors"],
+            "throughput_rps": round(count / sum(latencies), 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "queries_per_request": round(result["queries"] / count, 2),
+        }
+    return report
+
+
+# Регрессии относительно эталона: рост p95 сверх допуска или больше SQL-запросов
+def compare(report: dict, baseline: dict, tolerance: float):
+    problems = []
+    for name, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if not previous:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            problems.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if current["queries_per_request"] > previous["queries_per_request"]:
+            problems.append(f"{name}: queries {previous['queries_per_request']} -> {current['queries_per_request']}")
+    return problems
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2, ensure_ascii=False)
+    print(f"throughput: {report['throughput_rps']} req/s")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:>13}: p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+              f"p99 {stats['p99_ms']:>8} ms  queries {stats['queries_per_request']}")
+    if args.baseline:
+        with open(args.baseline) as source:
+            problems = compare(report, json.load(source), args.tolerance)
+        for problem in problems:
+            print("REGRESSION", problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+import codecs
+import csv
+import io
+import json
+import queue
+import threading
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, select
+
+import db as database
+from models import Guest, Booking, PaymentModel
+from schemas import GuestCreate, BookingImport, PaymentCreate, PaymentIngest
+from availability import availability_index
+from payments import ingest_batch, set_payment_status
+import rollups
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+COPY_NULL = "\\N"
+COPY_PUT_TIMEOUT = 1
+
+# Массовая загрузка и выгрузка: CSV или NDJSON построчно из тела запроса,
+# проверка пачками, вставка многострочным INSERT (executemany SQLAlchemy) или COPY (PostgreSQL).
+# Ячейки CSV с переводом строки внутри кавычек не поддерживаются.
+router = APIRouter()
+
+
+# Строки тела запроса по мере поступления, без чтения всего файла в память.
+# Декодер инкрементальный: многобайтовый символ может прийти разрезанным между чанками
+async def iter_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decode(decoder, chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    buffer += decode(decoder, b"", final=True)
+    if buffer.strip():
+        yield buffer
+
+
+def decode(decoder, chunk: bytes, final: bool = False) -> str:
+    try:
+        return decoder.decode(chunk, final)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Request body is not valid UTF-8")
+
+
+# Записи из CSV (первая строка — заголовок) или NDJSON; пустые ячейки CSV -> None
+async def iter_records(request: Request):
+    is_csv = "csv" in request.headers.get("content-type", "")
+    header = None
+    async for line in iter_lines(request):
+        if not is_csv:
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield error
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = values
+            continue
+        yield {key: (value if value != "" else None) for key, value in zip(header, values)}
+
+
+def is_postgres(session: Session) -> bool:
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def copy_rows(session: Session, table, columns: List[str], rows: List[dict]):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([COPY_NULL if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    statement = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    dbapi = session.get_bind().dialect.dbapi
+    try:
+        raw_cursor(session).copy_expert(statement, buffer)
+    except dbapi.Error as error:
+        # COPY идёт мимо SQLAlchemy: ошибка драйвера оборачивается в DBAPIError (IntegrityError и т.п.),
+        # как у обычного INSERT, чтобы пачка откатилась и прошла построчно
+        raise DBAPIError.instance(statement, None, error, dbapi.Error) from error
+
+
+def raw_cursor(session: Session):
+    return session.connection().connection.dbapi_connection.cursor()
+
+
+# Пачка целиком в SAVEPOINT; при ошибке БД — построчно, чтобы указать плохие строки
+def load_batch(model, batch: List[tuple], use_copy: bool) -> List[dict]:
+    table = model.__table__
+    columns = [column.name for column in table.columns if column.name != "id"]
+    errors = []
+    with Session(database.engine) as session:
+        rows = [row for _, row in batch]
+        try:
+            with session.begin_nested():
+                if use_copy and is_postgres(session):
+                    copy_rows(session, table, columns, rows)
+                else:
+                    session.execute(insert(table), rows)
+        except DBAPIError:
+            for number, row in batch:
+                try:
+                    with session.begin_nested():
+                        session.execute(insert(table), [row])
+                except DBAPIError as error:
+                    errors.append({"row": number, "error": str(error.orig).strip()})
+        session.commit()
+    return errors
+
+
+# Пачка и обработка её записанных строк (on_batch) в одном потоке пула
+def load_and_apply(model, batch: List[tuple], use_copy: bool, on_batch) -> List[dict]:
+    errors = load_batch(model, batch, use_copy)
+    if on_batch is not None:
+        failed = {error["row"] for error in errors}
+        rows = [row for number, row in batch if number not in failed]
+        if rows:
+            on_batch(rows)
+    return errors
+
+
+# on_batch(rows) получает строки каждой записанной пачки: по ним пересчитывается то,
+# что от них зависит, — только затронутые брони и дни, а не вся таблица
+async def bulk_import(request: Request, model, schema, use_copy: bool, on_batch=None):
+    inserted = 0
+    errors = []
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        batch_errors = await run_in_threadpool(load_and_apply, model, list(batch), use_copy, on_batch)
+        inserted += len(batch) - len(batch_errors)
+        errors.extend(batch_errors)
+        batch.clear()
+
+    number = 0
+    async for record in iter_records(request):
+        number += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            data = schema(**record)
+            obj = model(**data.dict())
+            batch.append((number, {column.name: getattr(obj, column.name)
+                                   for column in model.__table__.columns if column.name != "id"}))
+        except (ValidationError, ValueError, TypeError) as error:
+            errors.append({"row": number, "error": str(error)})
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    errors.sort(key=lambda item: item["row"])
+    return {
+        "received": number,
+        "inserted": inserted,
+        "failed": len(errors),
+        "errors": errors[:MAX_REPORTED_ERRORS],
+    }
+
+
+@router.post("/guests/bulk")
+async def bulk_create_guests(request: Request, copy: bool = False):
+    return await bulk_import(request, Guest, GuestCreate, copy)
+
+
+@router.post("/bookings/bulk")
+async def bulk_create_bookings(request: Request, copy: bool = False):
+    report = await bulk_import(request, Booking, BookingImport, copy, on_batch=refresh_booking_days)
+    if report["inserted"]:
+        await run_in_threadpool(reload_availability)
+    return report
+
+
+@router.post("/payments/bulk")
+async def bulk_create_payments(request: Request, copy: bool = False):
+    return await bulk_import(request, PaymentModel, PaymentCreate, copy, on_batch=refresh_payments)
+
+
+# Идемпотентная загрузка платежей шлюза (повтор callback-ов после сбоя): повторы по
+# transaction_id пропускаются, каждая пачка — одна транзакция вместе со статусом оплаты броней
+@router.post("/payments/ingest")
+async def ingest_payments(request: Request):
+    report = {"received": 0, "inserted": 0, "duplicates": 0, "failed": 0, "bookings_updated": 0}
+    errors = []
+    batch = []
+
+    async def flush():
+        result = await run_in_threadpool(ingest_batch, list(batch))
+        for key in ("inserted", "duplicates", "bookings_updated"):
+            report[key] += result[key]
+        errors.extend(result["errors"])
+        batch.clear()
+
+    async for record in iter_records(request):
+        report["received"] += 1
+        try:
+            if isinstance(record, Exception):
+                raise record
+            payment = PaymentModel(**PaymentIngest(**record).dict())
+            batch.append((report["received"], {column.name: getattr(payment, column.name)
+                                               for column in PaymentModel.__table__.columns if column.name != "id"}))
+        except (ValidationError, ValueError, TypeError) as error:
+            errors.append({"row": report["received"], "error": str(error)})
+        if len(batch) >= BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    errors.sort(key=lambda item: item["row"])
+    report["failed"] = len(errors)
+    report["errors"] = errors[:MAX_REPORTED_ERRORS]
+    return report
+
+
+def reload_availability():
+    with Session(database.engine) as session:
+        availability_index.load(session)
+
+
+# Итоги пересчитываются по дням загруженных строк, как после записи одной брони или платежа;
+# полная пересборка — только python rollups.py rebuild
+def refresh_booking_days(rows: List[dict]):
+    with Session(database.engine) as session:
+        rollups.refresh_rollups(session, [rollups.stay_range(row["check_in_date"], row["check_out_date"])
+                                          for row in rows])
+
+
+def refresh_payments(rows: List[dict]):
+    with Session(database.engine) as session:
+        set_payment_status(session, booking_ids=[row["booking_id"] for row in rows])
+        session.commit()
+        rollups.refresh_rollups(session, [rollups.payment_range(row["paid_at"]) for row in rows])
+
+
+# Выгрузка
+
+class ExportCancelled(Exception):
+    pass
+
+
+# Запись COPY в очередь: put с таймаутом, чтобы поток заметил отключение клиента
+# и не висел на полной очереди
+class QueueWriter:
+    def __init__(self, chunks: queue.Queue, stop: threading.Event):
+        self.chunks = chunks
+        self.stop = stop
+
+    def write(self, data):
+        put(self.chunks, self.stop, data.encode("utf-8") if isinstance(data, str) else data)
+
+
+def put(chunks: queue.Queue, stop: threading.Event, item):
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=COPY_PUT_TIMEOUT)
+            return
+        except queue.Full:
+            pass
+    raise ExportCancelled()
+
+
+# COPY ... TO STDOUT в отдельном потоке; очередь ограничена, чтобы не копить выгрузку в памяти.
+# Если клиент отключился, генератор закрывается: поток останавливается, COPY отменяется на сервере
+def copy_to_chunks(table):
+    # Явный список колонок: в таблице могут быть служебные колонки, которых нет в модели
+    columns = ", ".join(column.name for column in table.columns)
+    chunks: queue.Queue = queue.Queue(maxsize=64)
+    stop = threading.Event()
+    done = object()
+    failure = []
+    connection = database.engine.raw_connection()
+
+    def run():
+        try:
+            cursor = connection.cursor()
+            cursor.copy_expert(f"COPY (SELECT {columns} FROM {table.name} ORDER BY id) TO STDOUT WITH CSV HEADER",
+                               QueueWriter(chunks, stop))
+        except ExportCancelled:
+            pass
+        except Exception as error:
+            if not stop.is_set():
+                failure.append(error)
+        finally:
+            try:
+                put(chunks, stop, done)
+            except ExportCancelled:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        if failure:
+            raise failure[0]
+    finally:
+        if thread.is_alive():
+            stop.set()
+            connection.driver_connection.cancel()
+            thread.join(COPY_PUT_TIMEOUT * 2)
+        if thread.is_alive():
+            # поток так и не вышел из COPY — соединение в пул не возвращается
+            connection.invalidate()
+        else:
+            connection.close()
+
+
+# Запасной путь без COPY (например, SQLite): серверный курсор и csv.writer
+def select_to_chunks(model):
+    columns = [column.name for column in model.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    with Session(database.engine) as session:
+        result = session.execute(select(model.__table__).order_by(model.__table__.c.id)
+                                 .execution_options(yield_per=BATCH_SIZE))
+        for partition in result.partitions():
+            for row in partition:
+                writer.writerow(row)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_csv(model, filename: str):
+    if database.engine.dialect.name == "postgresql":
+        chunks = copy_to_chunks(model.__table__)
+    else:
+        chunks = select_to_chunks(model)
+    return StreamingResponse(chunks, media_type="text/csv",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'})
+
+
+@router.get("/guests/export")
+def export_guests():
+    return export_csv(Guest, "guests")
+
+
+@router.get("/bookings/export")
+def export_bookings():
+    return export_csv(Booking, "bookings")
+
+
+@router.get("/payments/export")
+def export_payments():
+    return export_csv(PaymentModel, "payments")
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from db import env_int
+
+# Кэш в памяти процесса: TTL и вытеснение давно неиспользуемых записей (LRU)
+ROOM_CACHE_TTL = env_int("ROOM_CACHE_TTL", 300)
+ROOM_CACHE_SIZE = env_int("ROOM_CACHE_SIZE", 1024)
+# Шина инвалидации между воркерами: "local" или "file:/путь/к/файлу"
+ROOM_CACHE_BUS = os.getenv("ROOM_CACHE_BUS", "local")
+
+MISSING = object()
+
+
+# Шина инвалидации: publish() после записи, changed() — были ли сбросы в других процессах
+class InvalidationBus:
+    def publish(self):
+        pass
+
+    def changed(self) -> bool:
+        return False
+
+
+# Один процесс: сбрасывать кэш достаточно локально
+class LocalBus(InvalidationBus):
+    pass
+
+
+# Общий файл-метка для нескольких воркеров на одной машине: запись меняет mtime,
+# остальные процессы замечают это одним os.stat при обращении к кэшу
+class FileBus(InvalidationBus):
+    def __init__(self, path: str):
+        self.path = path
+        self.seen = self.version()
+
+    def version(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def publish(self):
+        with open(self.path, "a"):
+            pass
+        os.utime(self.path, ns=(time.time_ns(), time.time_ns()))
+        self.seen = self.version()
+
+    def changed(self) -> bool:
+        current = self.version()
+        if current != self.seen:
+            self.seen = current
+            return True
+        return False
+
+
+def make_bus(spec: str) -> InvalidationBus:
+    if spec.startswith("file:"):
+        return FileBus(spec[len("file:"):])
+    return LocalBus()
+
+
+class TTLCache:
+    def __init__(self, name: str, maxsize: int, ttl: float, bus: Optional[InvalidationBus] = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.bus = bus or LocalBus()
+        self.items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Растёт при каждом сбросе: загрузка, начатая до сброса, не кладёт устаревшее значение
+        self.generation = 0
+
+    def get(self, key: Hashable) -> Any:
+        now = time.monotonic()
+        with self.lock:
+            if self.bus.changed():
+                self.items.clear()
+                self.generation += 1
+            item = self.items.get(key)
+            if item is None or item[0] < now:
+                if item is not None:
+                    del self.items[key]
+                self.misses += 1
+                return MISSING
+            self.items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    # Прочитать из кэша или загрузить; None (не найдено) не кэшируется
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is MISSING:
+            generation = self.generation
+            value = loader()
+            if value is not None:
+                self.set(key, value, generation)
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.items.clear()
+            self.generation += 1
+        self.bus.publish()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"name": self.name, "size": len(self.items), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+    def metric_lines(self):
+        stats = self.stats()
+        return [
+            "# TYPE cache_hits_total counter",
+            f'cache_hits_total{{cache="{self.name}"}} {stats["hits"]}',
+            "# TYPE cache_misses_total counter",
+            f'cache_misses_total{{cache="{self.name}"}} {stats["misses"]}',
+            "# TYPE cache_evictions_total counter",
+            f'cache_evictions_total{{cache="{self.name}"}} {stats["evictions"]}',
+            "# TYPE cache_entries gauge",
+            f'cache_entries{{cache="{self.name}"}} {stats["size"]}',
+        ]
+
+
+# Каталог номеров: список активных ("active",) и номера по ("room", id).
+# Любое изменение номеров сбрасывает кэш целиком — список зависит от всех номеров.
+room_cache = TTLCache("rooms", ROOM_CACHE_SIZE, ROOM_CACHE_TTL, make_bus(ROOM_CACHE_BUS))
@@ -0,0 +1,230 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, text, tuple_
+from sqlmodel import Session, select
+
+import db as database
+from db import env_int
+from fastjson import dumps, dicts_response
+from models import Guest, Administrator, RoomModel, Booking, PaymentModel, Service, ChangeLog
+
+# Лента изменений для внешних систем вместо опроса полных таблиц. Каждую вставку, изменение
+# и удаление строки записывает триггер БД в change_log (так учитываются и UPDATE ... RETURNING,
+# и COPY, и миграции); удаление остаётся в журнале как tombstone (op=delete, а при переносе
+# в архив archive.py — op=archive: строка не удалена, а ушла в историю). Клиент хранит курсор
+# "txid:seq" из ответа (начало — since=0):
+#
+#   GET /changes?since=0&limit=500               # страница, затем since=<cursor>
+#   GET /changes?since=<cursor>&wait=30          # long-poll: ответ при первом изменении
+#   GET /changes?since=<cursor>&stream=true      # SSE; при переподключении — Last-Event-ID
+#
+# Журнал старше CHANGE_RETENTION_DAYS удаляет python changes.py prune; потребитель,
+# отставший сильнее, пропустит удаления и должен пересинхронизироваться целиком.
+
+TRACKED_MODELS = {model.__tablename__: model for model in (Guest, Administrator, RoomModel, Booking, PaymentModel, Service)}
+# Колонки, которые не уходят во внешние системы
+HIDDEN_COLUMNS = {"administrator": {"password_hash"}}
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+MAX_WAIT_SECONDS = 60
+POLL_INTERVAL = env_int("CHANGES_POLL_MS", 1000) / 1000
+SSE_HEARTBEAT_SECONDS = 15
+CHANGE_RETENTION_DAYS = env_int("CHANGE_RETENTION_DAYS", 30)
+LOOKUP_CHUNK = 500
+UPSERT, DELETE = "upsert", "delete"
+
+router = APIRouter()
+
+POSTGRES_FUNCTION = """
+CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO change_log (table_name, row_id, op, changed_at, txid)
+        VALUES (TG_TABLE_NAME, OLD.id, 'delete', now() AT TIME ZONE 'utc', txid_current());
+        RETURN OLD;
+    END IF;
+    INSERT INTO change_log (table_name, row_id, op, changed_at, txid)
+    VALUES (TG_TABLE_NAME, NEW.id, 'upsert', now() AT TIME ZONE 'utc', txid_current());
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def install_triggers(conn):
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(POSTGRES_FUNCTION))
+        for table in TRACKED_MODELS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_log ON {table}"))
+            conn.execute(text(f"CREATE TRIGGER {table}_change_log AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                              f"FOR EACH ROW EXECUTE FUNCTION log_change()"))
+        return
+    for table in TRACKED_MODELS:
+        for event, row, op in (("INSERT", "NEW", UPSERT), ("UPDATE", "NEW", UPSERT), ("DELETE", "OLD", DELETE)):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {table}_change_log_{event.lower()}"))
+            conn.execute(text(
+                f"CREATE TRIGGER {table}_change_log_{event.lower()} AFTER {event} ON {table} "
+                f"BEGIN INSERT INTO change_log (table_name, row_id, op, changed_at, txid) "
+                f"VALUES ('{table}', {row}.id, '{op}', CURRENT_TIMESTAMP, 0); END"
+            ))
+
+
+# Уже существующие строки попадают в журнал один раз, чтобы since=0 давал полный снимок
+def backfill(conn):
+    for table in TRACKED_MODELS:
+        conn.execute(text(f"INSERT INTO change_log (table_name, row_id, op, changed_at, txid) "
+                          f"SELECT '{table}', id, '{UPSERT}', :now, 0 FROM {table} ORDER BY id"),
+                     {"now": datetime.utcnow()})
+
+
+def table_columns(table_name: str):
+    hidden = HIDDEN_COLUMNS.get(table_name, set())
+    return [column for column in TRACKED_MODELS[table_name].__table__.columns if column.name not in hidden]
+
+
+def current_rows(session: Session, table_name: str, ids: List[int]) -> dict:
+    table = TRACKED_MODELS[table_name].__table__
+    rows = {}
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        query = select(*table_columns(table_name)).where(table.c.id.in_(ids[start:start + LOOKUP_CHUNK]))
+        rows.update((row.id, dict(row._mapping)) for row in session.exec(query))
+    return rows
+
+
+Cursor = Tuple[int, int]
+
+
+def parse_cursor(value: Optional[str]) -> Cursor:
+    txid, _, seq = (value or "0").partition(":")
+    try:
+        return (int(txid), int(seq)) if seq else (0, int(txid))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def format_cursor(cursor: Cursor) -> str:
+    return f"{cursor[0]}:{cursor[1]}"
+
+
+# В PostgreSQL seq выдаются до коммита, поэтому порядок seq — не порядок коммитов.
+# Журнал читается в порядке (txid, seq) и только до xmin снимка: транзакции с меньшим
+# txid уже завершены, а всё, что закоммитится позже, получит (txid, seq) больше курсора.
+# Граница берётся до чтения журнала; в SQLite записи идут строго по очереди — без границы
+def visible_horizon(session: Session) -> Optional[int]:
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    return session.exec(text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+
+# Страница изменений после курсора since: по каждой строке — последнее изменение в странице
+# с текущими данными; строка, которой уже нет, отдаётся как удаление
+def read_changes(session: Session, since: Cursor, limit: int, tables: Optional[List[str]] = None) -> dict:
+    horizon = visible_horizon(session)
+    query = (select(ChangeLog).where(tuple_(ChangeLog.txid, ChangeLog.seq) > tuple_(*since))
+             .order_by(ChangeLog.txid, ChangeLog.seq).limit(limit))
+    if horizon is not None:
+        query = query.where(ChangeLog.txid < horizon)
+    if tables:
+        query = query.where(ChangeLog.table_name.in_(tables))
+    entries = session.exec(query).all()
+    latest = {}
+    for entry in entries:
+        latest.pop((entry.table_name, entry.row_id), None)
+        latest[(entry.table_name, entry.row_id)] = entry
+    data = {}
+    for table_name in {entry.table_name for entry in latest.values()}:
+        ids = [entry.row_id for entry in latest.values() if entry.table_name == table_name and entry.op == UPSERT]
+        data[table_name] = current_rows(session, table_name, ids) if ids else {}
+    changes = []
+    for entry in latest.values():
+        row = data[entry.table_name].get(entry.row_id) if entry.op == UPSERT else None
+        changes.append({
+            "cursor": format_cursor((entry.txid, entry.seq)), "seq": entry.seq,
+            "table": entry.table_name, "id": entry.row_id,
+            "op": DELETE if entry.op == UPSERT and row is None else entry.op,
+            "changed_at": entry.changed_at, "data": row,
+        })
+    return {
+        "changes": changes,
+        "cursor": format_cursor((entries[-1].txid, entries[-1].seq) if entries else since),
+        "has_more": len(entries) == limit,
+    }
+
+
+def fetch_changes(since: Cursor, limit: int, tables: Optional[List[str]]) -> dict:
+    with Session(database.engine) as session:
+        return read_changes(session, since, limit, tables)
+
+
+def parse_tables(tables: Optional[str]) -> Optional[List[str]]:
+    if not tables:
+        return None
+    names = [name.strip() for name in tables.split(",") if name.strip()]
+    unknown = [name for name in names if name not in TRACKED_MODELS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return names
+
+
+async def sse_events(since: Cursor, limit: int, tables: Optional[List[str]]):
+    heartbeat = time.monotonic()
+    while True:
+        page = await run_in_threadpool(fetch_changes, since, limit, tables)
+        for change in page["changes"]:
+            yield b"id: " + change["cursor"].encode() + b"\nevent: change\ndata: " + dumps(change) + b"\n\n"
+        if page["cursor"] != format_cursor(since):
+            since = parse_cursor(page["cursor"])
+            yield b"id: " + page["cursor"].encode() + b"\nevent: cursor\ndata: {}\n\n"
+            heartbeat = time.monotonic()
+        elif time.monotonic() - heartbeat >= SSE_HEARTBEAT_SECONDS:
+            yield b": keepalive\n\n"
+            heartbeat = time.monotonic()
+        if not page["has_more"]:
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+@router.get("/changes")
+async def get_changes(since: str = "0",
+                      limit: int = Query(CHANGES_LIMIT, ge=1, le=MAX_CHANGES_LIMIT),
+                      tables: Optional[str] = None,
+                      wait: int = Query(0, ge=0, le=MAX_WAIT_SECONDS),
+                      stream: bool = False,
+                      last_event_id: Optional[str] = Header(None)):
+    names = parse_tables(tables)
+    cursor = parse_cursor(since)
+    if stream:
+        start = parse_cursor(last_event_id) if last_event_id else cursor
+        return StreamingResponse(sse_events(start, limit, names), media_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache"})
+    deadline = time.monotonic() + wait
+    while True:
+        page = await run_in_threadpool(fetch_changes, cursor, limit, names)
+        if page["changes"] or page["cursor"] != format_cursor(cursor) or time.monotonic() >= deadline:
+            return dicts_response(page)
+        await asyncio.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+
+def prune(session: Session, days: int = CHANGE_RETENTION_DAYS) -> int:
+    result = session.execute(delete(ChangeLog).where(ChangeLog.changed_at < datetime.utcnow() - timedelta(days=days)))
+    session.commit()
+    return result.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал изменений")
+    parser.add_argument("command", choices=["prune"])
+    parser.add_argument("--days", type=int, default=CHANGE_RETENTION_DAYS)
+    args = parser.parse_args()
+    with Session(database.engine) as session:
+        print(f"deleted {prune(session, args.days)} change log entries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+from typing import Optional
+from datetime import date
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from sqlmodel import Session, select
+
+from models import Guest, RoomModel, Booking, PaymentModel, Service
+from pagination import apply_filters
+
+# Детали бронирований одним запросом: join гостя и номера,
+# суммы платежей и число услуг — коррелированными подзапросами по booking_id
+def booking_details_query(after: Optional[int] = None, status: Optional[str] = None,
+                          guest_id: Optional[int] = None, date_from: Optional[date] = None,
+                          date_to: Optional[date] = None):
+    paid_total = (
+        select(func.coalesce(func.sum(PaymentModel.amount), 0))
+        .where(PaymentModel.booking_id == Booking.id)
+        .scalar_subquery()
+    )
+    services_count = (
+        select(func.count(Service.id))
+        .where(Service.booking_id == Booking.id)
+        .scalar_subquery()
+    )
+    query = (
+        select(
+            Booking.id.label("booking_id"),
+            Booking.guest_id,
+            Guest.first_name,
+            Guest.last_name,
+            Booking.room_id,
+            RoomModel.number.label("room_number"),
+            Booking.check_in_date,
+            Booking.check_out_date,
+            Booking.status,
+            Booking.total_price,
+            paid_total.label("paid_total"),
+            services_count.label("services_count"),
+        )
+        .select_from(Booking)
+        .outerjoin(Guest, Guest.id == Booking.guest_id)
+        .outerjoin(RoomModel, RoomModel.id == Booking.room_id)
+        .order_by(Booking.id)
+    )
+    return apply_filters(query, Booking, after=after, status=status, guest_id=guest_id,
+                         date_from=date_from, date_to=date_to)
+
+# Строка проекции -> словарь ответа (формат поля guest как раньше)
+def booking_details_row(row):
+    return {
+        "booking_id": row.booking_id,
+        "guest_id": row.guest_id,
+        "guest": f"{row.first_name} {row.last_name}" if row.guest_id is not None else None,
+        "room_id": row.room_id,
+        "room_number": row.room_number,
+        "check_in_date": row.check_in_date,
+        "check_out_date": row.check_out_date,
+        "status": row.status,
+        "total_price": row.total_price,
+        "paid_total": row.paid_total,
+        "services_count": row.services_count,
+    }
+
+# Связи брони, которые нужны вместе с ней: номер — join в том же запросе,
+# платежи — одним IN-запросом на все брони. Общая стратегия для API и request.py
+BOOKING_OPTIONS = (joinedload(Booking.room), selectinload(Booking.payments))
+
+# Профиль гостя: гость, брони с номерами и платежами, услуги — 4 запроса
+# при любом числе броней (гость, брони + номера, платежи, услуги)
+PROFILE_OPTIONS = (
+    selectinload(Guest.bookings).options(*BOOKING_OPTIONS),
+    selectinload(Guest.services),
+)
+
+
+def load_guest_profile(session: Session, guest_id: int) -> Optional[Guest]:
+    return session.exec(select(Guest).where(Guest.id == guest_id).options(*PROFILE_OPTIONS)).first()
+
+
+# Загруженный профиль -> словарь ответа; брони и услуги по времени, новые первыми
+def guest_profile_dict(guest: Guest) -> dict:
+    bookings = sorted(guest.bookings, key=lambda booking: (booking.check_in_date, booking.id), reverse=True)
+    services = sorted(guest.services, key=lambda service: (service.service_time or service.created_at, service.id),
+                      reverse=True)
+    return {
+        **guest.model_dump(),
+        "bookings": [
+            {
+                **booking.model_dump(),
+                "room": booking.room.model_dump() if booking.room else None,
+                "payments": [payment.model_dump() for payment in sorted(booking.payments, key=lambda p: p.id)],
+            }
+            for booking in bookings
+        ],
+        "services": [service.model_dump() for service in services],
+    }
@@ -0,0 +1,62 @@
+from decimal import Decimal
+from typing import Iterable
+
+from fastapi import Response
+from sqlmodel import select
+
+try:
+    import orjson
+except ImportError:  # без orjson — тот же формат через стандартный json
+    orjson = None
+    import json
+
+# Быстрый путь ответа для списков: строки курсора (без ORM-объектов и без
+# повторной проверки Pydantic) сразу в JSON-байты. Формат совпадает с response_model:
+# Decimal — строкой ("150.00"), даты — ISO 8601. Эндпоинты сохраняют response_model,
+# поэтому схема OpenAPI не меняется; возвращённый Response FastAPI не перепроверяет.
+
+
+def decimal_as_str(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+# Для ответов без response_model, где Decimal исторически отдавался числом
+def decimal_as_float(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def stdlib_default(default):
+    def encode(value):
+        if hasattr(value, "isoformat"):
+            return value.isoformat()
+        return default(value)
+    return encode
+
+
+def dumps(data, default=decimal_as_str) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=default)
+    return json.dumps(data, default=stdlib_default(default), ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+
+# Запрос колонок таблицы вместо ORM-сущности: строки приходят кортежами
+def row_query(model):
+    return select(*model.__table__.columns).order_by(model.id)
+
+
+def row_dict(row) -> dict:
+    return dict(row._mapping)
+
+
+def rows_response(rows: Iterable, default=decimal_as_str, headers: dict = None) -> Response:
+    return Response(dumps([row_dict(row) for row in rows], default=default),
+                    media_type="application/json", headers=headers)
+
+
+def dicts_response(items: list, default=decimal_as_str, headers: dict = None) -> Response:
+    return Response(dumps(items, default=default), media_type="application/json", headers=headers)
@@ -0,0 +1,288 @@
+import heapq
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from fastapi import HTTPException
+
+from availability import availability_index, INACTIVE_STATUSES
+from db import env_int
+
+# Удержание номера на время оформления: POST /holds закрепляет номер и даты на TTL секунд,
+# POST /bookings с hold_id подтверждает удержание. Пересекающиеся удержания и брони
+# отклоняются проверкой в памяти, без блокировок в основной БД.
+#
+# HOLD_BACKEND=memory — словарь в процессе (один воркер); HOLD_BACKEND=sqlite — общий файл
+# HOLD_SQLITE_PATH для нескольких воркеров на одной машине. Истёкшие удержания удаляются
+# при обращениях и фоновой задачей раз в HOLD_EVICT_SECONDS.
+HOLD_TTL_SECONDS = env_int("HOLD_TTL_SECONDS", 600)
+MAX_HOLD_TTL_SECONDS = env_int("MAX_HOLD_TTL_SECONDS", 1800)
+HOLD_EVICT_SECONDS = env_int("HOLD_EVICT_SECONDS", 30)
+HOLD_BACKEND = os.getenv("HOLD_BACKEND", "memory")
+HOLD_SQLITE_PATH = os.getenv("HOLD_SQLITE_PATH", "holds.sqlite3")
+
+
+class Hold(NamedTuple):
+    id: str
+    room_id: int
+    check_in: date
+    check_out: date
+    expires_at: float
+    # бронь по удержанию записывается: удержание ещё занимает номер, но второй раз не выдаётся
+    confirming: bool = False
+
+    def overlaps(self, room_id: int, check_in: date, check_out: date) -> bool:
+        return self.room_id == room_id and self.check_in < check_out and check_in < self.check_out
+
+
+def hold_dict(hold: Hold) -> dict:
+    return {"hold_id": hold.id, "room_id": hold.room_id, "check_in": hold.check_in, "check_out": hold.check_out,
+            "expires_at": datetime.utcfromtimestamp(hold.expires_at)}
+
+
+# Хранилище в памяти процесса: удержания по id и по номеру, куча сроков для вытеснения
+class MemoryHoldStore:
+    def __init__(self):
+        self.holds: Dict[str, Hold] = {}
+        self.rooms: Dict[int, Set[str]] = {}
+        self.expiry: List[tuple] = []
+        self.lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self.expiry and self.expiry[0][0] <= now:
+            _, hold_id = heapq.heappop(self.expiry)
+            self._remove(hold_id)
+
+    def _remove(self, hold_id: str) -> Optional[Hold]:
+        hold = self.holds.pop(hold_id, None)
+        if hold is not None:
+            room = self.rooms[hold.room_id]
+            room.discard(hold_id)
+            if not room:
+                del self.rooms[hold.room_id]
+        return hold
+
+    def _conflicts(self, room_id: int, check_in: date, check_out: date) -> List[Hold]:
+        return [self.holds[hold_id] for hold_id in self.rooms.get(room_id, ())
+                if self.holds[hold_id].overlaps(room_id, check_in, check_out)]
+
+    # Новое удержание или None, если номер на эти даты уже удержан
+    def place(self, room_id: int, check_in: date, check_out: date, ttl: int) -> Optional[Hold]:
+        now = time.time()
+        with self.lock:
+            self._evict(now)
+            if self._conflicts(room_id, check_in, check_out):
+                return None
+            hold = Hold(secrets.token_urlsafe(16), room_id, check_in, check_out, now + ttl)
+            self.holds[hold.id] = hold
+            self.rooms.setdefault(room_id, set()).add(hold.id)
+            heapq.heappush(self.expiry, (hold.expires_at, hold.id))
+            return hold
+
+    def get(self, hold_id: str) -> Optional[Hold]:
+        with self.lock:
+            self._evict(time.time())
+            return self.holds.get(hold_id)
+
+    def conflicts(self, room_id: int, check_in: date, check_out: date) -> List[Hold]:
+        with self.lock:
+            self._evict(time.time())
+            return self._conflicts(room_id, check_in, check_out)
+
+    def held_rooms(self, room_ids: List[int], check_in: date, check_out: date) -> Set[int]:
+        with self.lock:
+            self._evict(time.time())
+            return {room_id for room_id in room_ids if self._conflicts(room_id, check_in, check_out)}
+
+    # Забрать удержание под запись брони: атомарно, только одному запросу
+    def take(self, hold_id: str) -> Optional[Hold]:
+        with self.lock:
+            self._evict(time.time())
+            hold = self.holds.get(hold_id)
+            if hold is None or hold.confirming:
+                return None
+            self.holds[hold_id] = hold._replace(confirming=True)
+            return hold
+
+    # Запись брони не удалась — удержание снова доступно
+    def restore(self, hold_id: str):
+        with self.lock:
+            hold = self.holds.get(hold_id)
+            if hold is not None:
+                self.holds[hold_id] = hold._replace(confirming=False)
+
+    def release(self, hold_id: str) -> bool:
+        with self.lock:
+            return self._remove(hold_id) is not None
+
+    def evict(self):
+        with self.lock:
+            self._evict(time.time())
+
+    def count(self) -> int:
+        with self.lock:
+            return len(self.holds)
+
+
+# Общий файл SQLite для воркеров одной машины: проверка и запись — в BEGIN IMMEDIATE,
+# то есть под блокировкой этого файла, а не основной БД
+class SqliteHoldStore:
+    def __init__(self, path: str = HOLD_SQLITE_PATH):
+        self.path = path
+        self.local = threading.local()
+        with self.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS holds (id TEXT PRIMARY KEY, room_id INTEGER NOT NULL, "
+                         "check_in TEXT NOT NULL, check_out TEXT NOT NULL, expires_at REAL NOT NULL, "
+                         "confirming INTEGER NOT NULL DEFAULT 0)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_holds_room ON holds (room_id, check_in)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_holds_expires ON holds (expires_at)")
+
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _hold(row) -> Hold:
+        return Hold(row[0], row[1], date.fromisoformat(row[2]), date.fromisoformat(row[3]), row[4], bool(row[5]))
+
+    def _conflicts(self, conn, room_id: int, check_in: date, check_out: date) -> List[Hold]:
+        rows = conn.execute("SELECT id, room_id, check_in, check_out, expires_at, confirming FROM holds "
+                            "WHERE room_id = ? AND check_in < ? AND check_out > ? AND expires_at > ?",
+                            (room_id, check_out.isoformat(), check_in.isoformat(), time.time())).fetchall()
+        return [self._hold(row) for row in rows]
+
+    def place(self, room_id: int, check_in: date, check_out: date, ttl: int) -> Optional[Hold]:
+        with self.transaction() as conn:
+            if self._conflicts(conn, room_id, check_in, check_out):
+                return None
+            hold = Hold(secrets.token_urlsafe(16), room_id, check_in, check_out, time.time() + ttl)
+            conn.execute("INSERT INTO holds (id, room_id, check_in, check_out, expires_at) VALUES (?, ?, ?, ?, ?)",
+                         (hold.id, room_id, check_in.isoformat(), check_out.isoformat(), hold.expires_at))
+            return hold
+
+    def get(self, hold_id: str) -> Optional[Hold]:
+        row = self.connection().execute(
+            "SELECT id, room_id, check_in, check_out, expires_at, confirming FROM holds "
+            "WHERE id = ? AND expires_at > ?", (hold_id, time.time())).fetchone()
+        return self._hold(row) if row else None
+
+    def conflicts(self, room_id: int, check_in: date, check_out: date) -> List[Hold]:
+        return self._conflicts(self.connection(), room_id, check_in, check_out)
+
+    def held_rooms(self, room_ids: List[int], check_in: date, check_out: date) -> Set[int]:
+        wanted = set(room_ids)
+        rows = self.connection().execute(
+            "SELECT DISTINCT room_id FROM holds WHERE check_in < ? AND check_out > ? AND expires_at > ?",
+            (check_out.isoformat(), check_in.isoformat(), time.time())).fetchall()
+        return {room_id for room_id, in rows if room_id in wanted}
+
+    # Чтение и пометка в одной транзакции: удержание не может истечь или быть снято между ними
+    def take(self, hold_id: str) -> Optional[Hold]:
+        with self.transaction() as conn:
+            row = conn.execute("SELECT id, room_id, check_in, check_out, expires_at, confirming FROM holds "
+                               "WHERE id = ? AND confirming = 0 AND expires_at > ?", (hold_id, time.time())).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE holds SET confirming = 1 WHERE id = ?", (hold_id,))
+        return self._hold(row)
+
+    def restore(self, hold_id: str):
+        self.connection().execute("UPDATE holds SET confirming = 0 WHERE id = ?", (hold_id,))
+
+    def release(self, hold_id: str) -> bool:
+        return self.connection().execute("DELETE FROM holds WHERE id = ?", (hold_id,)).rowcount > 0
+
+    def evict(self):
+        self.connection().execute("DELETE FROM holds WHERE expires_at <= ?", (time.time(),))
+
+    def count(self) -> int:
+        return self.connection().execute("SELECT count(*) FROM holds WHERE expires_at > ?",
+                                         (time.time(),)).fetchone()[0]
+
+
+HOLD_BACKENDS = {"memory": MemoryHoldStore, "sqlite": SqliteHoldStore}
+
+
+def create_store(name: str = HOLD_BACKEND):
+    if name not in HOLD_BACKENDS:
+        raise RuntimeError(f"unknown HOLD_BACKEND {name!r}: expected one of {', '.join(HOLD_BACKENDS)}")
+    return HOLD_BACKENDS[name]()
+
+
+hold_store = create_store()
+
+
+def hold_metric_lines():
+    return ["# TYPE holds_active gauge", f"holds_active {hold_store.count()}"]
+
+
+# Свободные по индексу занятости номера без удержанных другими оформлениями, по диапазонам
+def unheld_rooms(room_ids: List[int], ranges: List[tuple]) -> List[List[int]]:
+    result = []
+    for (check_in, check_out), free in zip(ranges, availability_index.free_rooms_batch(room_ids, ranges)):
+        held = hold_store.held_rooms(free, check_in, check_out)
+        result.append([room_id for room_id in free if room_id not in held] if held else free)
+    return result
+
+
+# Проверка перед записью брони. С hold_id бронь забирает своё удержание (даты и номер
+# должны совпадать), без него — номер не должен быть удержан другим оформлением.
+# В обоих случаях номер должен быть свободен по индексу занятости
+def claim_hold(values: dict) -> Optional[Hold]:
+    hold_id = values.pop("hold_id", None)
+    room_id, check_in, check_out = values.get("room_id"), values["check_in_date"], values["check_out_date"]
+    if room_id is None or check_out <= check_in or values.get("status") in INACTIVE_STATUSES:
+        if hold_id is not None:
+            raise HTTPException(status_code=409, detail="Booking does not match the hold")
+        return None
+    if hold_id is None:
+        if hold_store.conflicts(room_id, check_in, check_out):
+            raise HTTPException(status_code=409, detail="Room is held by another checkout")
+        hold = None
+    else:
+        hold = hold_store.take(hold_id)
+        if hold is None:
+            raise HTTPException(status_code=404, detail="Hold not found")
+        if (hold.room_id, hold.check_in, hold.check_out) != (room_id, check_in, check_out):
+            hold_store.restore(hold.id)
+            raise HTTPException(status_code=409, detail="Booking does not match the hold")
+    if not availability_index.free_rooms([room_id], check_in, check_out):
+        if hold is not None:
+            hold_store.restore(hold.id)
+        raise HTTPException(status_code=409, detail="Room is already booked for these dates")
+    return hold
+
+
+# Запись брони внутри блока: при успехе удержание снимается (бронь уже в индексе занятости),
+# при ошибке — возвращается владельцу
+@contextmanager
+def confirming_hold(values: dict):
+    hold = claim_hold(values)
+    try:
+        yield hold
+    except BaseException:
+        if hold is not None:
+            hold_store.restore(hold.id)
+        raise
+    if hold is not None:
+        hold_store.release(hold.id)
@@ -1,112 +1,153 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Query
 from typing import List, Optional
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from sqlmodel import Session, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
 
-from db import create_db_and_tables, engine
+import db as database
+from db import create_db_and_tables, USE_ASYNC_DB, SCHEMA_BOOTSTRAP, DB_POOL_WARMUP
+from migrations import current_version, latest_version
 from models import Guest, RoomModel, Booking, PaymentModel, Service, Administrator
-
-app = FastAPI(title="Hotel API", version="1.0")
-
-# Создание таблиц при старте
-create_db_and_tables()
+from pagination import build_query, page_response, stream_ndjson, DEFAULT_LIMIT, MAX_LIMIT
+from fastjson import rows_response, dicts_response, decimal_as_float
+from availability import availability_index, fits_guests
+from details import booking_details_query, booking_details_row, load_guest_profile, guest_profile_dict
+from payments import (
+    set_payment_status, refresh_payment_status, payment_booking_ids, transaction_exists, transaction_archived,
+    PAYMENT_STATUS_FIELDS,
+)
+from pricing import pricing_rules, price_booking, check_stay_update, MAX_QUOTES
+from search import search_guests, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from rollups import (
+    refresh_rollups, booking_ranges, payment_ranges, room_ranges, booking_stay, payment_day, report,
+    BOOKING_FIELDS, PAYMENT_FIELDS, ROOM_FIELDS,
+)
+from schedule import (
+    schedule_index, reserved_slot, schedule_row, schedule_from_db, service_duration, SCHEDULE_FIELDS,
+)
+from metrics import setup_metrics, registry
+from cache import room_cache
+from writes import update_returning, delete_returning, bulk_status_returning, to_model
+from archive import history_query, archived_row
+from bulk import router as bulk_router
+from changes import router as changes_router
+from holds import (
+    hold_store, hold_dict, hold_metric_lines, confirming_hold, unheld_rooms,
+    HOLD_TTL_SECONDS, MAX_HOLD_TTL_SECONDS, HOLD_EVICT_SECONDS,
+)
+from schemas import (
+    GuestCreate, GuestUpdate, GuestSearchResult, GuestProfile, RoomCreate, RoomUpdate,
+    BookingCreate, BookingUpdate, HoldCreate,
+    BookingStatusUpdate, BookingStatusResult, AvailabilityBatch, QuoteBatch, FreeSlotsBatch,
+    PaymentCreate, PaymentUpdate, ServiceCreate, ServiceUpdate,
+)
+
+logger = logging.getLogger("hotel.startup")
+
+# Запуск без DDL при импорте: схема создаётся только при SCHEMA_BOOTSTRAP=1,
+# иначе — одна проверка версии. Затем прогрев пула и предзагрузка кэшей.
+def prepare_schema():
+    if SCHEMA_BOOTSTRAP:
+        create_db_and_tables()
+        return
+    version, latest = current_version(database.engine), latest_version()
+    if version == 0:
+        raise RuntimeError("database schema is missing: run `python migrations.py upgrade` "
+                           "or start with SCHEMA_BOOTSTRAP=1")
+    if version < latest:
+        logger.warning("schema version %s is behind %s: run `python migrations.py upgrade` "
+                       "or start with SCHEMA_BOOTSTRAP=1", version, latest)
+
+def warm_pool():
+    if not isinstance(database.engine.pool, QueuePool):
+        return
+    connections = [database.engine.connect() for _ in range(min(DB_POOL_WARMUP, database.engine.pool.size()))]
+    for connection in connections:
+        connection.close()
+
+async def warm_async_pool():
+    connections = [await database.async_engine.connect().start() for _ in range(DB_POOL_WARMUP)]
+    for connection in connections:
+        await connection.close()
+
+def preload_caches():
+    with Session(database.engine) as session:
+        room_cache.set(("active",), load_active_rooms(session))
+        availability_index.load(session)
+        schedule_index.load(session)
+
+# Истёкшие удержания удаляются и при обращениях; фоновая очистка не даёт им копиться
+async def evict_holds():
+    while True:
+        await asyncio.sleep(HOLD_EVICT_SECONDS)
+        try:
+            hold_store.evict()
+        except Exception:
+            logger.exception("hold eviction failed")
+
+STARTUP_STEPS = [("schema", prepare_schema), ("pool", warm_pool), ("preload", preload_caches)]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    timings = {}
+    started = time.perf_counter()
+    for name, step in STARTUP_STEPS:
+        step_started = time.perf_counter()
+        step()
+        timings[name] = time.perf_counter() - step_started
+    if USE_ASYNC_DB:
+        step_started = time.perf_counter()
+        await warm_async_pool()
+        timings["async_pool"] = time.perf_counter() - step_started
+    timings["total"] = time.perf_counter() - started
+    app.state.startup_timings = timings
+    logger.info("startup in %.1f ms (%s)", timings["total"] * 1000,
+                ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items() if name != "total"))
+    evictor = asyncio.create_task(evict_holds())
+    yield
+    evictor.cancel()
+
+def startup_metric_lines():
+    timings = getattr(app.state, "startup_timings", {})
+    return ["# TYPE app_startup_seconds gauge"] + [
+        f'app_startup_seconds{{step="{name}"}} {seconds:.6f}' for name, seconds in timings.items()
+    ]
+
+app = FastAPI(title="Hotel API", version="1.0", lifespan=lifespan)
+
+# Асинхронные CRUD-маршруты регистрируются первыми и перекрывают синхронные
+if USE_ASYNC_DB:
+    from async_routes import router as async_router
+    app.include_router(async_router)
+
+registry.collectors.append(room_cache.metric_lines)
+registry.collectors.append(startup_metric_lines)
+registry.collectors.append(hold_metric_lines)
+
+# Массовая загрузка/выгрузка; /guests/export и т.п. должны идти раньше /guests/{guest_id}
+app.include_router(bulk_router)
+app.include_router(changes_router)
+
+# Метрики Prometheus на /metrics (METRICS_ENABLED=1)
+if USE_ASYNC_DB:
+    setup_metrics(app, database.async_engine.sync_engine, database.engine)
+else:
+    setup_metrics(app, database.engine)
 
 # Зависимости
 
 def get_db():
-    with Session(engine) as session:
+    with Session(database.engine) as session:
         yield session
 
-# Схемы для обновления данных
-
-from pydantic import BaseModel
-from typing import Optional
-from datetime import date, datetime
-from decimal import Decimal
-
-class GuestCreate(BaseModel):
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    email: Optional[str] = None
-    phone_number: Optional[str] = None
-    passport_data: Optional[str] = None
-
-class GuestUpdate(BaseModel):
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    email: Optional[str] = None
-    phone_number: Optional[str] = None
-    passport_data: Optional[str] = None
-
-class RoomCreate(BaseModel):
-    number: str
-    type: Optional[str] = None
-    description: Optional[str] = None
-    price_per_night: Decimal
-    max_guests: Optional[int] = None
-    is_active: bool = True
-
-class RoomUpdate(BaseModel):
-    number: Optional[str] = None
-    type: Optional[str] = None
-    description: Optional[str] = None
-    price_per_night: Optional[Decimal] = None
-    max_guests: Optional[int] = None
-    is_active: Optional[bool] = None
-
-class BookingCreate(BaseModel):
-    guest_id: Optional[int] = None
-    room_id: Optional[int] = None
-    admin_id: Optional[int] = None
-    check_in_date: date
-    check_out_date: date
-    status: Optional[str] = None
-    total_price: Decimal
-    guests_count: Optional[int] = None
-
-class BookingUpdate(BaseModel):
-    guest_id: Optional[int] = None
-    room_id: Optional[int] = None
-    admin_id: Optional[int] = None
-    check_in_date: Optional[date] = None
-    check_out_date: Optional[date] = None
-    status: Optional[str] = None
-    total_price: Optional[Decimal] = None
-    guests_count: Optional[int] = None
-
-class PaymentCreate(BaseModel):
-    booking_id: Optional[int] = None
-    amount: Decimal
-    status: Optional[str] = None
-    payment_method: Optional[str] = None
-    transaction_id: Optional[str] = None
-
-class PaymentUpdate(BaseModel):
-    booking_id: Optional[int] = None
-    amount: Optional[Decimal] = None
-    status: Optional[str] = None
-    payment_method: Optional[str] = None
-    transaction_id: Optional[str] = None
-    paid_at: Optional[datetime] = None
-
-class ServiceCreate(BaseModel):
-    type: Optional[str] = None
-    employee: Optional[str] = None
-    status: Optional[str] = None
-    service_time: Optional[datetime] = None
-    guest_id: Optional[int] = None
-    booking_id: Optional[int] = None
-
-class ServiceUpdate(BaseModel):
-    type: Optional[str] = None
-    employee: Optional[str] = None
-    status: Optional[str] = None
-    service_time: Optional[datetime] = None
-    guest_id: Optional[int] = None
-    booking_id: Optional[int] = None
-
 # Основные эндпоинты
 
 @app.get("/")
@@ -115,8 +156,29 @@ def read_root():
 
 #Guests 
 @app.get("/guests", response_model=List[Guest])
-def get_all_guests(db: Session = Depends(get_db)):
-    return db.exec(select(Guest)).all()
+def get_all_guests(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                   after: Optional[int] = None,
+                   stream: bool = False,
+                   db: Session = Depends(get_db)):
+    query = build_query(Guest, after=after, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return page_response(db, query, limit)
+
+# Поиск гостей по имени, email, телефону или паспорту; объявлен раньше /guests/{guest_id}
+@app.get("/guests/search", response_model=List[GuestSearchResult])
+def search_guests_endpoint(q: str = Query(..., min_length=2, max_length=100),
+                           limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+                           db: Session = Depends(get_db)):
+    return dicts_response(search_guests(db, q, limit))
+
+# Профиль гостя одним ответом вместо /guests/{id}, /bookings, /services и платежей по каждой брони
+@app.get("/guests/{guest_id}/profile", response_model=GuestProfile)
+def get_guest_profile(guest_id: int, db: Session = Depends(get_db)):
+    guest = load_guest_profile(db, guest_id)
+    if not guest:
+        raise HTTPException(status_code=404, detail="Guest not found")
+    return dicts_response(guest_profile_dict(guest))
 
 @app.get("/guests/{guest_id}", response_model=Guest)
 def get_guest(guest_id: int, db: Session = Depends(get_db)):
@@ -135,91 +197,246 @@ def create_guest(guest_data: GuestCreate, db: Session = Depends(get_db)):
 
 @app.put("/guests/{guest_id}", response_model=Guest)
 def update_guest(guest_id: int, guest_data: GuestUpdate, db: Session = Depends(get_db)):
-    guest = db.get(Guest, guest_id)
+    guest = update_returning(db, Guest, guest_id, guest_data.dict(exclude_unset=True))
     if not guest:
         raise HTTPException(status_code=404, detail="Guest not found")
-    
-    guest_data_dict = guest_data.dict(exclude_unset=True)
-    for key, value in guest_data_dict.items():
-        setattr(guest, key, value)
-    
-    db.add(guest)
-    db.commit()
-    db.refresh(guest)
     return guest
 
 @app.delete("/guests/{guest_id}")
 def delete_guest(guest_id: int, db: Session = Depends(get_db)):
-    guest = db.get(Guest, guest_id)
-    if not guest:
+    if not delete_returning(db, Guest, guest_id):
         raise HTTPException(status_code=404, detail="Guest not found")
-    
-    db.delete(guest)
-    db.commit()
     return {"message": "Guest deleted successfully"}
 
 # Bookings
+# Нарушение ограничения booking_no_overlap (PostgreSQL, SQLSTATE 23P01) -> 409
+def booking_conflict(db: Session, error: IntegrityError):
+    db.rollback()
+    if getattr(error.orig, "pgcode", None) == "23P01":
+        raise HTTPException(status_code=409, detail="Room is already booked for these dates")
+    raise error
+
 @app.get("/bookings", response_model=List[Booking])
-def get_all_bookings(db: Session = Depends(get_db)):
-    return db.exec(select(Booking)).all()
+def get_all_bookings(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                     after: Optional[int] = None,
+                     status: Optional[str] = None,
+                     guest_id: Optional[int] = None,
+                     date_from: Optional[date] = None,
+                     date_to: Optional[date] = None,
+                     stream: bool = False,
+                     db: Session = Depends(get_db)):
+    query = build_query(Booking, after=after, status=status, guest_id=guest_id,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return page_response(db, query, limit)
+
+# Детали бронирований (объявлено до /bookings/{booking_id}, иначе маршрут недостижим)
+@app.get("/bookings/details")
+def get_booking_details_endpoint(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                                 after: Optional[int] = None,
+                                 status: Optional[str] = None,
+                                 guest_id: Optional[int] = None,
+                                 date_from: Optional[date] = None,
+                                 date_to: Optional[date] = None,
+                                 stream: bool = False,
+                                 db: Session = Depends(get_db)):
+    query = booking_details_query(after=after, status=status, guest_id=guest_id,
+                                  date_from=date_from, date_to=date_to)
+    if stream:
+        return stream_ndjson(query, serialize=booking_details_row, default=decimal_as_float)
+    return page_response(db, query, limit, cursor_field="booking_id",
+                         serialize=booking_details_row, default=decimal_as_float)
 
 @app.get("/bookings/{booking_id}", response_model=Booking)
-def get_booking(booking_id: int, db: Session = Depends(get_db)):
+def get_booking(booking_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
     booking = db.get(Booking, booking_id)
+    if not booking and include_archived:
+        booking = to_model(Booking, archived_row(db, Booking, booking_id))
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     return booking
 
+# Цена считается по правилам pricing.py; manual_price=true оставляет цену клиента.
+# hold_id подтверждает удержание из POST /holds (см. holds.py)
 @app.post("/bookings", response_model=Booking)
-def create_booking(booking_data: BookingCreate, db: Session = Depends(get_db)):
-    booking = Booking(**booking_data.dict())
-    db.add(booking)
-    db.commit()
-    db.refresh(booking)
+def create_booking(booking_data: BookingCreate, manual_price: bool = False, db: Session = Depends(get_db)):
+    room = cached_room(db, booking_data.room_id) if booking_data.room_id and not manual_price else None
+    values = price_booking(booking_data.dict(), room, manual_price)
+    with confirming_hold(values):
+        booking = Booking(**values)
+        db.add(booking)
+        try:
+            db.commit()
+        except IntegrityError as error:
+            booking_conflict(db, error)
+        db.refresh(booking)
+        availability_index.upsert(booking)
+    refresh_rollups(db, [booking_stay(booking)])
     return booking
 
 @app.put("/bookings/{booking_id}", response_model=Booking)
 def update_booking(booking_id: int, booking_data: BookingUpdate, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
+    values = booking_data.dict(exclude_unset=True)
+    check_stay_update(db, booking_id, values)
+    ranges = booking_ranges(db, [booking_id]) if BOOKING_FIELDS & values.keys() else None
+    try:
+        booking = update_returning(db, Booking, booking_id, values)
+    except IntegrityError as error:
+        booking_conflict(db, error)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    booking_data_dict = booking_data.dict(exclude_unset=True)
-    for key, value in booking_data_dict.items():
-        setattr(booking, key, value)
-    
-    db.add(booking)
-    db.commit()
-    db.refresh(booking)
+    availability_index.upsert(booking)
+    if "total_price" in values:
+        booking.payment_status = refresh_payment_status(db, [booking.id]).get(booking.id, booking.payment_status)
+    if ranges is not None:
+        refresh_rollups(db, ranges + [booking_stay(booking)])
     return booking
 
+# Массовая смена статуса одним UPDATE (например, выезд 50 броней)
+@app.patch("/bookings/status", response_model=BookingStatusResult)
+def update_bookings_status(status_data: BookingStatusUpdate, db: Session = Depends(get_db)):
+    try:
+        bookings = bulk_status_returning(db, Booking, status_data.ids, status_data.status)
+    except IntegrityError as error:
+        # отмена отмены может столкнуться с бронью, занявшей номер за это время
+        booking_conflict(db, error)
+    for booking in bookings:
+        availability_index.upsert(booking)
+    refresh_rollups(db, [booking_stay(booking) for booking in bookings])
+    updated = {booking.id for booking in bookings}
+    return {"updated": sorted(updated), "not_found": [i for i in status_data.ids if i not in updated]}
+
 @app.delete("/bookings/{booking_id}")
 def delete_booking(booking_id: int, db: Session = Depends(get_db)):
-    booking = db.get(Booking, booking_id)
-    if not booking:
+    ranges = booking_ranges(db, [booking_id])
+    if not delete_returning(db, Booking, booking_id):
         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    db.delete(booking)
-    db.commit()
+    availability_index.remove(booking_id)
+    refresh_rollups(db, ranges)
     return {"message": "Booking deleted successfully"}
 
 @app.get("/guests/{guest_id}/bookings", response_model=List[Booking])
-def get_bookings_by_guest(guest_id: int, db: Session = Depends(get_db)):
-    bookings = db.exec(
-        select(Booking).where(Booking.guest_id == guest_id)
-    ).all()
+def get_bookings_by_guest(guest_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
+    bookings = db.execute(history_query(Booking, lambda table: table.c.guest_id == guest_id, include_archived)).all()
     if not bookings:
         raise HTTPException(status_code=404, detail="Bookings not found")
-    return bookings
+    return rows_response(bookings)
 
 # Rooms
+# Каталог номеров читается через room_cache; объекты отсоединяются от сессии перед кэшированием
+def load_active_rooms(db: Session):
+    rooms = db.exec(select(RoomModel).where(RoomModel.is_active == True).order_by(RoomModel.id)).all()
+    for room in rooms:
+        db.expunge(room)
+    return tuple(rooms)
+
+def load_room(db: Session, room_id: int):
+    room = db.get(RoomModel, room_id)
+    if room:
+        db.expunge(room)
+    return room
+
+def cached_room(db: Session, room_id: int):
+    return room_cache.get_or_load(("room", room_id), lambda: load_room(db, room_id))
+
+def cached_active_rooms(db: Session):
+    return room_cache.get_or_load(("active",), lambda: load_active_rooms(db))
+
 @app.get("/rooms", response_model=List[RoomModel])
 def get_available_rooms(db: Session = Depends(get_db)):
-    return db.exec(select(RoomModel).where(RoomModel.is_active == True)).all()
+    return cached_active_rooms(db)
+
+def check_range(check_in: date, check_out: date):
+    if check_out <= check_in:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
+
+def active_rooms(db: Session, guests: Optional[int]):
+    return [room for room in cached_active_rooms(db) if fits_guests(room.max_guests, guests)]
+
+# Свободные номера на даты [from, to) по индексу занятости
+@app.get("/rooms/availability", response_model=List[RoomModel])
+def get_room_availability(check_in: date = Query(..., alias="from"),
+                          check_out: date = Query(..., alias="to"),
+                          guests: Optional[int] = Query(None, ge=1),
+                          db: Session = Depends(get_db)):
+    check_range(check_in, check_out)
+    rooms = active_rooms(db, guests)
+    free_ids = set(unheld_rooms([room.id for room in rooms], [(check_in, check_out)])[0])
+    return [room for room in rooms if room.id in free_ids]
+
+# Пакетный режим для календаря: id свободных номеров на каждый диапазон
+@app.post("/rooms/availability/batch")
+def get_room_availability_batch(batch_data: AvailabilityBatch, db: Session = Depends(get_db)):
+    for item in batch_data.ranges:
+        check_range(item.check_in, item.check_out)
+    room_ids = [room.id for room in active_rooms(db, batch_data.guests)]
+    ranges = [(item.check_in, item.check_out) for item in batch_data.ranges]
+    free = unheld_rooms(room_ids, ranges)
+    return [
+        {"check_in": item.check_in, "check_out": item.check_out, "room_ids": room_ids}
+        for item, room_ids in zip(batch_data.ranges, free)
+    ]
+
+# Цены номеров на много диапазонов сразу (см. pricing.py): по диапазону — цена каждого
+# номера и его занятость; only_available оставляет только свободные
+@app.post("/quotes/batch")
+def get_quotes_batch(batch_data: QuoteBatch, db: Session = Depends(get_db)):
+    for item in batch_data.ranges:
+        check_range(item.check_in, item.check_out)
+    rooms = active_rooms(db, batch_data.guests)
+    if batch_data.room_ids is not None:
+        wanted = set(batch_data.room_ids)
+        rooms = [room for room in rooms if room.id in wanted]
+    if len(rooms) * len(batch_data.ranges) > MAX_QUOTES:
+        raise HTTPException(status_code=400, detail=f"Too many quotes requested (max {MAX_QUOTES})")
+    ranges = [(item.check_in, item.check_out) for item in batch_data.ranges]
+    free = unheld_rooms([room.id for room in rooms], ranges)
+    prices = pricing_rules.quote_batch([(room.id, room.price_per_night, room.type) for room in rooms],
+                                       ranges, batch_data.guests)
+    result = []
+    for (check_in, check_out), free_ids, totals in zip(ranges, free, prices):
+        free_ids = set(free_ids)
+        result.append({
+            "check_in": check_in, "check_out": check_out, "nights": (check_out - check_in).days,
+            "quotes": [{"room_id": room.id, "total_price": total, "available": room.id in free_ids}
+                       for room, total in zip(rooms, totals)
+                       if room.id in free_ids or not batch_data.only_available],
+        })
+    return dicts_response(result)
+
+# Holds
+# Удержание номера на время оформления; бронь по нему — POST /bookings с hold_id
+@app.post("/holds", status_code=201)
+def create_hold(hold_data: HoldCreate, db: Session = Depends(get_db)):
+    check_range(hold_data.check_in, hold_data.check_out)
+    room = cached_room(db, hold_data.room_id)
+    if not room or not room.is_active:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if not availability_index.free_rooms([room.id], hold_data.check_in, hold_data.check_out):
+        raise HTTPException(status_code=409, detail="Room is already booked for these dates")
+    ttl = min(hold_data.ttl_seconds or HOLD_TTL_SECONDS, MAX_HOLD_TTL_SECONDS)
+    hold = hold_store.place(room.id, hold_data.check_in, hold_data.check_out, ttl)
+    if hold is None:
+        raise HTTPException(status_code=409, detail="Room is held by another checkout")
+    return hold_dict(hold)
+
+@app.get("/holds/{hold_id}")
+def get_hold(hold_id: str):
+    hold = hold_store.get(hold_id)
+    if not hold:
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return hold_dict(hold)
+
+@app.delete("/holds/{hold_id}")
+def delete_hold(hold_id: str):
+    if not hold_store.release(hold_id):
+        raise HTTPException(status_code=404, detail="Hold not found")
+    return {"message": "Hold released successfully"}
 
 @app.get("/rooms/{room_id}", response_model=RoomModel)
 def get_room(room_id: int, db: Session = Depends(get_db)):
-    room = db.get(RoomModel, room_id)
+    room = cached_room(db, room_id)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     return room
@@ -230,37 +447,82 @@ def create_room(room_data: RoomCreate, db: Session = Depends(get_db)):
     db.add(room)
     db.commit()
     db.refresh(room)
+    room_cache.invalidate()
     return room
 
 @app.put("/rooms/{room_id}", response_model=RoomModel)
 def update_room(room_id: int, room_data: RoomUpdate, db: Session = Depends(get_db)):
-    room = db.get(RoomModel, room_id)
+    values = room_data.dict(exclude_unset=True)
+    room = update_returning(db, RoomModel, room_id, values)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    room_data_dict = room_data.dict(exclude_unset=True)
-    for key, value in room_data_dict.items():
-        setattr(room, key, value)
-    
-    db.add(room)
-    db.commit()
-    db.refresh(room)
+    room_cache.invalidate()
+    if ROOM_FIELDS & values.keys():
+        refresh_rollups(db, room_ranges(db, room_id))
     return room
 
 @app.delete("/rooms/{room_id}")
 def delete_room(room_id: int, db: Session = Depends(get_db)):
-    room = db.get(RoomModel, room_id)
-    if not room:
+    ranges = room_ranges(db, room_id)
+    if not delete_returning(db, RoomModel, room_id):
         raise HTTPException(status_code=404, detail="Room not found")
-    
-    db.delete(room)
-    db.commit()
+    room_cache.invalidate()
+    refresh_rollups(db, ranges)
     return {"message": "Room deleted successfully"}
 
 # Services
 @app.get("/services", response_model=List[Service])
-def get_all_services(db: Session = Depends(get_db)):
-    return db.exec(select(Service)).all()
+def get_all_services(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                     after: Optional[int] = None,
+                     status: Optional[str] = None,
+                     guest_id: Optional[int] = None,
+                     date_from: Optional[date] = None,
+                     date_to: Optional[date] = None,
+                     stream: bool = False,
+                     db: Session = Depends(get_db)):
+    query = build_query(Service, after=after, status=status, guest_id=guest_id,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return page_response(db, query, limit)
+
+# Расписание сотрудников: день или неделя (с понедельника) из индекса в памяти;
+# дни старше горизонта индекса читаются из БД. Объявлено раньше /services/{service_id}
+@app.get("/services/schedule")
+def get_service_schedule(day: date = Query(..., alias="date"),
+                         employee: Optional[str] = None,
+                         view: str = Query("day", pattern="^(day|week)$"),
+                         db: Session = Depends(get_db)):
+    if view == "week":
+        day -= timedelta(days=day.weekday())
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=7 if view == "week" else 1)
+    if schedule_index.covers(start):
+        items = schedule_index.schedule(employee, start, end)
+    else:
+        items = schedule_from_db(db, employee, start, end)
+    return dicts_response([schedule_row(item) for item in items])
+
+# Свободные промежутки рабочего дня для пачки запросов; без сотрудника — по всем известным
+@app.post("/services/free-slots")
+def find_free_slots(batch: FreeSlotsBatch):
+    results = []
+    for query in batch.queries:
+        if query.duration_minutes:
+            duration = timedelta(minutes=query.duration_minutes)
+        else:
+            duration = service_duration(query.type)
+        employees = [query.employee] if query.employee else schedule_index.employee_names()
+        results.append({
+            "date": query.date,
+            "duration_minutes": int(duration.total_seconds() // 60),
+            "employees": {
+                employee: [{"start": start, "end": end}
+                           for start, end in schedule_index.free_slots(employee, query.date, duration)]
+                for employee in employees
+            },
+        })
+    return dicts_response(results)
 
 @app.get("/services/{service_id}", response_model=Service)
 def get_service(service_id: int, db: Session = Depends(get_db)):
@@ -271,50 +533,59 @@ def get_service(service_id: int, db: Session = Depends(get_db)):
 
 @app.post("/services", response_model=Service)
 def create_service(service_data: ServiceCreate, db: Session = Depends(get_db)):
-    service = Service(**service_data.dict())
-    db.add(service)
-    db.commit()
-    db.refresh(service)
+    values = service_data.dict()
+    with reserved_slot(values):
+        service = Service(**values)
+        db.add(service)
+        db.commit()
+        db.refresh(service)
+        schedule_index.upsert(service)
     return service
 
 @app.put("/services/{service_id}", response_model=Service)
 def update_service(service_id: int, service_data: ServiceUpdate, db: Session = Depends(get_db)):
-    service = db.get(Service, service_id)
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-    
-    service_data_dict = service_data.dict(exclude_unset=True)
-    for key, value in service_data_dict.items():
-        setattr(service, key, value)
-    
-    db.add(service)
-    db.commit()
-    db.refresh(service)
+    values = service_data.dict(exclude_unset=True)
+    merged = {}
+    if SCHEDULE_FIELDS & values.keys():
+        current = db.get(Service, service_id)
+        if not current:
+            raise HTTPException(status_code=404, detail="Service not found")
+        merged = {**current.dict(), **values}
+    with reserved_slot(merged, service_id):
+        service = update_returning(db, Service, service_id, values)
+        if not service:
+            raise HTTPException(status_code=404, detail="Service not found")
+        schedule_index.upsert(service)
     return service
 
 @app.delete("/services/{service_id}")
 def delete_service(service_id: int, db: Session = Depends(get_db)):
-    service = db.get(Service, service_id)
-    if not service:
+    if not delete_returning(db, Service, service_id):
         raise HTTPException(status_code=404, detail="Service not found")
-    
-    db.delete(service)
-    db.commit()
+    schedule_index.remove(service_id)
     return {"message": "Service deleted successfully"}
 
 @app.get("/guests/{guest_id}/services", response_model=List[Service])
-def get_services_by_guest(guest_id: int, db: Session = Depends(get_db)):
-    services = db.exec(
-        select(Service).where(Service.guest_id == guest_id)
-    ).all()
+def get_services_by_guest(guest_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
+    services = db.execute(history_query(Service, lambda table: table.c.guest_id == guest_id, include_archived)).all()
     if not services:
         raise HTTPException(status_code=404, detail="Services not found")
-    return services
+    return rows_response(services)
 
 # Payments
 @app.get("/payments", response_model=List[PaymentModel])
-def get_all_payments(db: Session = Depends(get_db)):
-    return db.exec(select(PaymentModel)).all()
+def get_all_payments(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                     after: Optional[int] = None,
+                     status: Optional[str] = None,
+                     date_from: Optional[date] = None,
+                     date_to: Optional[date] = None,
+                     stream: bool = False,
+                     db: Session = Depends(get_db)):
+    query = build_query(PaymentModel, after=after, status=status,
+                        date_from=date_from, date_to=date_to, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return page_response(db, query, limit)
 
 @app.get("/payments/{payment_id}", response_model=PaymentModel)
 def get_payment(payment_id: int, db: Session = Depends(get_db)):
@@ -323,67 +594,112 @@ def get_payment(payment_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Payment not found")
     return payment
 
+# Повтор transaction_id (повторный callback шлюза) -> 409; пакетная загрузка повторов — /payments/ingest
+def payment_conflict(db: Session, error: IntegrityError, transaction_id: Optional[str]):
+    db.rollback()
+    if transaction_exists(db, transaction_id):
+        raise HTTPException(status_code=409, detail="Payment with this transaction_id already exists")
+    raise error
+
+def check_transaction_free(db: Session, transaction_id: Optional[str]):
+    if transaction_archived(db, transaction_id):
+        raise HTTPException(status_code=409, detail="Payment with this transaction_id already exists")
+
 @app.post("/payments", response_model=PaymentModel)
 def create_payment(payment_data: PaymentCreate, db: Session = Depends(get_db)):
+    check_transaction_free(db, payment_data.transaction_id)
     payment = PaymentModel(**payment_data.dict())
     db.add(payment)
-    db.commit()
+    try:
+        db.flush()
+        set_payment_status(db, [payment.booking_id])
+        db.commit()
+    except IntegrityError as error:
+        payment_conflict(db, error, payment_data.transaction_id)
     db.refresh(payment)
+    refresh_rollups(db, [payment_day(payment)])
     return payment
 
 @app.put("/payments/{payment_id}", response_model=PaymentModel)
 def update_payment(payment_id: int, payment_data: PaymentUpdate, db: Session = Depends(get_db)):
-    payment = db.get(PaymentModel, payment_id)
+    values = payment_data.dict(exclude_unset=True)
+    check_transaction_free(db, values.get("transaction_id"))
+    ranges = payment_ranges(db, [payment_id]) if PAYMENT_FIELDS & values.keys() else None
+    booking_ids = payment_booking_ids(db, [payment_id]) if PAYMENT_STATUS_FIELDS & values.keys() else None
+    try:
+        payment = update_returning(db, PaymentModel, payment_id, values)
+    except IntegrityError as error:
+        payment_conflict(db, error, values.get("transaction_id"))
     if not payment:
         raise HTTPException(status_code=404, detail="Payment not found")
-    
-    payment_data_dict = payment_data.dict(exclude_unset=True)
-    for key, value in payment_data_dict.items():
-        setattr(payment, key, value)
-    
-    db.add(payment)
-    db.commit()
-    db.refresh(payment)
+    if booking_ids is not None:
+        refresh_payment_status(db, booking_ids + [payment.booking_id])
+    if ranges is not None:
+        refresh_rollups(db, ranges + [payment_day(payment)])
     return payment
 
 @app.delete("/payments/{payment_id}")
 def delete_payment(payment_id: int, db: Session = Depends(get_db)):
-    payment = db.get(PaymentModel, payment_id)
-    if not payment:
+    ranges = payment_ranges(db, [payment_id])
+    booking_ids = payment_booking_ids(db, [payment_id])
+    if not delete_returning(db, PaymentModel, payment_id):
         raise HTTPException(status_code=404, detail="Payment not found")
-    
-    db.delete(payment)
-    db.commit()
+    refresh_payment_status(db, booking_ids)
+    refresh_rollups(db, ranges)
     return {"message": "Payment deleted successfully"}
 
 @app.get("/bookings/{booking_id}/payments", response_model=List[PaymentModel])
-def get_payments_by_booking(booking_id: int, db: Session = Depends(get_db)):
-    payments = db.exec(
-        select(PaymentModel).where(PaymentModel.booking_id == booking_id)
-    ).all()
+def get_payments_by_booking(booking_id: int, include_archived: bool = False, db: Session = Depends(get_db)):
+    payments = db.execute(history_query(PaymentModel, lambda table: table.c.booking_id == booking_id,
+                                        include_archived)).all()
     if not payments:
         raise HTTPException(status_code=404, detail="Payments not found")
-    return payments
+    return rows_response(payments)
+
+# Reports
+# Отчёты по дневным итогам daily_rollup (rollups.py): по дням или месяцам, по типам номеров или общим итогом
+OCCUPANCY_FIELDS = ["period", "room_type", "room_nights", "available_room_nights", "occupancy", "arrivals"]
+REVENUE_FIELDS = ["period", "room_type", "room_nights", "room_revenue", "payments", "adr", "revpar"]
+
+def report_response(db: Session, fields: List[str], date_from: date, date_to: date,
+                    group: str, room_type: Optional[str], by_type: bool):
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to must not be before date_from")
+    rows = report(db, date_from, date_to, group, room_type, by_type)
+    return dicts_response([{field: row[field] for field in fields if field in row} for row in rows],
+                          default=decimal_as_float)
+
+@app.get("/reports/occupancy")
+def get_occupancy_report(date_from: date, date_to: date,
+                         group: str = Query("day", pattern="^(day|month)$"),
+                         room_type: Optional[str] = None,
+                         by_type: bool = True,
+                         db: Session = Depends(get_db)):
+    return report_response(db, OCCUPANCY_FIELDS, date_from, date_to, group, room_type, by_type)
+
+@app.get("/reports/revenue")
+def get_revenue_report(date_from: date, date_to: date,
+                       group: str = Query("day", pattern="^(day|month)$"),
+                       room_type: Optional[str] = None,
+                       by_type: bool = True,
+                       db: Session = Depends(get_db)):
+    return report_response(db, REVENUE_FIELDS, date_from, date_to, group, room_type, by_type)
+
+# Счётчики кэша каталога номеров
+@app.get("/cache/stats")
+def get_cache_stats():
+    return [room_cache.stats()]
 
 # Administrators
 @app.get("/administrators", response_model=List[Administrator])
-def get_all_administrators(db: Session = Depends(get_db)):
-    return db.exec(select(Administrator)).all()
-
-# Детали бронирований
-@app.get("/bookings/details")
-def get_booking_details_endpoint(db: Session = Depends(get_db)):
-    bookings = db.exec(select(Booking)).all()
-    details = []
-    for b in bookings:
-        details.append({
-            "booking_id": b.id,
-            "guest": f"{b.guest.first_name} {b.guest.last_name}" if b.guest else None,
-            "room_number": b.room.number if b.room else None,
-            "status": b.status,
-            "total_price": b.total_price
-        })
-    return details
+def get_all_administrators(limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                           after: Optional[int] = None,
+                           stream: bool = False,
+                           db: Session = Depends(get_db)):
+    query = build_query(Administrator, after=after, rows=True)
+    if stream:
+        return stream_ndjson(query)
+    return page_response(db, query, limit)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Response
+from sqlalchemy import event
+
+from db import env_bool, env_int
+
+# Метрики включаются METRICS_ENABLED=1; выключенные не ставят ни middleware, ни событий движка
+METRICS_ENABLED = env_bool("METRICS_ENABLED", False)
+# Порог медленного запроса в миллисекундах, 0 — журнал выключен
+SLOW_REQUEST_MS = env_int("SLOW_REQUEST_MS", 0)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+slow_log = logging.getLogger("hotel.slow")
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> List[str]:
+        out = []
+        cumulative = 0
+        prefix = labels + "," if labels else ""
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            out.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        out.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        out.append(f"{name}_sum{suffix} {self.sum}")
+        out.append(f"{name}_count{suffix} {self.count}")
+        return out
+
+
+# Статистика одного HTTP-запроса, заполняется событиями движка
+class RequestStats:
+    def __init__(self, record_sql: bool):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements: Optional[List[Tuple[str, float]]] = [] if record_sql else None
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar("current_stats", default=None)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_time: Dict[Tuple[str, str], float] = {}
+        self.response_bytes: Dict[Tuple[str, str], int] = {}
+        self.in_flight = 0
+        self.pool_wait = Histogram(WAIT_BUCKETS)
+        self.pool = None
+        # Дополнительные источники строк метрик (например, счётчики кэшей)
+        self.collectors = []
+
+    def record(self, method: str, route: str, status: int, duration: float,
+               size: int, stats: RequestStats):
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(duration)
+            self.queries.setdefault(key, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.db_time[key] = self.db_time.get(key, 0.0) + stats.db_time
+            self.response_bytes[key] = self.response_bytes.get(key, 0) + size
+
+    # Текст в формате Prometheus
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            lines.append("# TYPE http_requests_total counter")
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {value}')
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (method, route), hist in sorted(self.latency.items()):
+                lines.extend(hist.lines("http_request_duration_seconds", f'method="{method}",route="{route}"'))
+            lines.append("# TYPE http_response_size_bytes_total counter")
+            for (method, route), value in sorted(self.response_bytes.items()):
+                lines.append(f'http_response_size_bytes_total{{method="{method}",route="{route}"}} {value}')
+            lines.append("# TYPE http_requests_in_flight gauge")
+            lines.append(f"http_requests_in_flight {self.in_flight}")
+            lines.append("# TYPE db_queries_per_request histogram")
+            for (method, route), hist in sorted(self.queries.items()):
+                lines.extend(hist.lines("db_queries_per_request", f'method="{method}",route="{route}"'))
+            lines.append("# TYPE db_query_duration_seconds_total counter")
+            for (method, route), value in sorted(self.db_time.items()):
+                lines.append(f'db_query_duration_seconds_total{{method="{method}",route="{route}"}} {value}')
+            lines.append("# TYPE db_pool_checkout_wait_seconds histogram")
+            lines.extend(self.pool_wait.lines("db_pool_checkout_wait_seconds", ""))
+        if self.pool is not None and hasattr(self.pool, "checkedout"):
+            lines.append("# TYPE db_pool_checked_out gauge")
+            lines.append(f"db_pool_checked_out {self.pool.checkedout()}")
+            lines.append("# TYPE db_pool_size gauge")
+            lines.append(f"db_pool_size {self.pool.size()}")
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# Чистый ASGI middleware: задержка, размер ответа, запросы в работе
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(record_sql=SLOW_REQUEST_MS > 0)
+        token = current_stats.set(stats)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        with registry.lock:
+            registry.in_flight += 1
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            with registry.lock:
+                registry.in_flight -= 1
+            current_stats.reset(token)
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            registry.record(scope["method"], route_path, status, duration, size, stats)
+            if SLOW_REQUEST_MS and duration * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(scope, duration, stats)
+
+
+def log_slow_request(scope, duration: float, stats: RequestStats):
+    sql = "\n".join(f"  [{elapsed * 1000:.1f} ms] {statement}" for statement, elapsed in stats.statements)
+    slow_log.warning("slow request %s %s: %.1f ms, %d queries, %.1f ms in db\n%s",
+                     scope["method"], scope["path"], duration * 1000,
+                     stats.queries, stats.db_time * 1000, sql)
+
+
+# Подписка на события движка: число и время запросов, ожидание соединения из пула
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_stats.get()
+        if stats is None:
+            return
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.statements is not None:
+            stats.statements.append((statement, elapsed))
+
+    pool = engine.pool
+    if registry.pool is None:
+        registry.pool = pool
+    pool_connect = pool.connect
+
+    def timed_connect():
+        start = time.perf_counter()
+        try:
+            return pool_connect()
+        finally:
+            wait = time.perf_counter() - start
+            with registry.lock:
+                registry.pool_wait.observe(wait)
+
+    pool.connect = timed_connect
+
+
+def metrics_endpoint():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# Подключить метрики к приложению и движкам (только при METRICS_ENABLED)
+def setup_metrics(app, *engines):
+    if not METRICS_ENABLED:
+        return
+    for engine in engines:
+        instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics_endpoint, methods=["GET"], include_in_schema=False)
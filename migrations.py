@@ -0,0 +1,286 @@
+import argparse
+import json
+import sys
+from datetime import datetime, date
+
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Table, func, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, SQLModel
+
+import models  # регистрирует таблицы в SQLModel.metadata
+import rollups
+
+# Версионированные миграции схемы. Применённые версии хранятся в таблице schema_version;
+# каждая миграция выполняется в своей транзакции вместе с записью о ней.
+#
+#   python migrations.py upgrade       # применить недостающие
+#   python migrations.py status
+#   python migrations.py check-plans   # EXPLAIN ключевых запросов, ошибка при Seq Scan
+
+version_metadata = MetaData()
+schema_version = Table(
+    "schema_version", version_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str):
+    def register(func):
+        MIGRATIONS.append((version, name, func))
+        return func
+    return register
+
+
+@migration(1, "baseline")
+def baseline(conn):
+    SQLModel.metadata.create_all(conn)
+
+
+# Индексы внешних ключей, статуса и дат брони; имена совпадают с объявленными в models.py
+PERFORMANCE_INDEXES = [
+    ("ix_booking_guest_id", "booking", "guest_id"),
+    ("ix_booking_status", "booking", "status"),
+    ("ix_booking_check_in_date", "booking", "check_in_date"),
+    ("ix_booking_room_dates", "booking", "room_id, check_in_date, check_out_date"),
+    ("ix_payment_booking_id", "payment", "booking_id"),
+    ("ix_services_guest_id", "services", "guest_id"),
+    ("ix_services_booking_id", "services", "booking_id"),
+]
+
+
+@migration(2, "performance indexes")
+def performance_indexes(conn):
+    for name, table, columns in PERFORMANCE_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# Запрет пересекающихся броней одного номера (только PostgreSQL).
+# Отменённые брони не учитываются; уже существующие пересечения нужно устранить до миграции.
+@migration(3, "booking overlap exclusion constraint")
+def booking_no_overlap(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    conn.execute(text(
+        "ALTER TABLE booking ADD CONSTRAINT booking_no_overlap EXCLUDE USING gist ("
+        " room_id WITH =, daterange(check_in_date, check_out_date, '[)') WITH &&"
+        ") WHERE (status IS NULL OR status NOT IN ('cancelled', 'canceled'))"
+    ))
+
+
+# Нормализованные колонки для поиска гостей (search.py): генерируются самой БД.
+# В PostgreSQL — STORED с COLLATE "C" (префикс диапазоном по btree) и триграммные индексы
+# для нечёткого поиска по имени и подстроке телефона; SQLite умеет добавлять только VIRTUAL.
+GUEST_SEARCH_COLUMNS = {
+    "search_name": "lower(coalesce(first_name, '') || ' ' || coalesce(last_name, ''))",
+    "search_name_rev": "lower(coalesce(last_name, '') || ' ' || coalesce(first_name, ''))",
+    "search_email": "lower(trim(email))",
+    "search_phone": {
+        "postgresql": "regexp_replace(phone_number, '[^0-9]', '', 'g')",
+        "sqlite": "replace(replace(replace(replace(replace(replace("
+                  "phone_number, '+', ''), ' ', ''), '-', ''), '(', ''), ')', ''), '.', '')",
+    },
+    "search_passport": "lower(replace(replace(passport_data, ' ', ''), '-', ''))",
+}
+
+
+@migration(4, "guest search columns")
+def guest_search(conn):
+    postgres = conn.dialect.name == "postgresql"
+    for column, expression in GUEST_SEARCH_COLUMNS.items():
+        if isinstance(expression, dict):
+            expression = expression["postgresql" if postgres else "sqlite"]
+        if postgres:
+            definition = f'text COLLATE "C" GENERATED ALWAYS AS ({expression}) STORED'
+        else:
+            definition = f"TEXT GENERATED ALWAYS AS ({expression}) VIRTUAL"
+        conn.execute(text(f"ALTER TABLE guest ADD COLUMN {column} {definition}"))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_guest_{column} ON guest ({column})"))
+    if postgres:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_guest_search_name_trgm "
+                          "ON guest USING gist (search_name gist_trgm_ops)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_guest_search_phone_trgm "
+                          "ON guest USING gin (search_phone gin_trgm_ops)"))
+
+
+# Расписание сотрудника за прошлые дни (schedule.py) читается диапазоном по этому индексу
+@migration(5, "services schedule index")
+def services_schedule_index(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_services_employee_time ON services (employee, service_time)"))
+
+
+# Дневные итоги для отчётов (rollups.py) и индексы для пересчёта дней: брони,
+# ещё не выехавшие к дате, и платежи за дату. Таблица сразу заполняется из данных.
+@migration(6, "daily rollup")
+def daily_rollup(conn):
+    models.DailyRollup.__table__.create(conn, checkfirst=True)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_booking_check_out_date ON booking (check_out_date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_paid_at ON payment (paid_at)"))
+    # пересборка читает и архив броней и платежей (миграция 9)
+    for table in (models.BookingArchive, models.PaymentArchive):
+        table.create(conn, checkfirst=True)
+    with Session(bind=conn) as session:
+        rollups.rebuild(session, commit=False)
+
+
+# Статус оплаты брони (payments.py); в новой БД колонку уже создал baseline
+@migration(7, "booking payment status")
+def booking_payment_status(conn):
+    import payments  # payments импортирует db, а db — этот модуль
+    if "payment_status" not in {column["name"] for column in inspect(conn).get_columns("booking")}:
+        conn.execute(text("ALTER TABLE booking ADD COLUMN payment_status VARCHAR DEFAULT 'unpaid'"))
+    with Session(bind=conn) as session:
+        payments.set_payment_status(session)
+
+
+# Журнал изменений для /changes (changes.py): таблица, триггеры на таблицах моделей
+# и по записи на каждую уже существующую строку
+@migration(8, "change log")
+def change_log(conn):
+    import changes  # changes импортирует db, а db — этот модуль
+    models.ChangeLog.__table__.create(conn, checkfirst=True)
+    changes.install_triggers(conn)
+    changes.backfill(conn)
+
+
+# Архив завершённых броней, их платежей и услуг (archive.py); перенос — python archive.py run
+@migration(9, "archive tables")
+def archive_tables(conn):
+    for table in (models.BookingArchive, models.PaymentArchive, models.ServiceArchive):
+        table.create(conn, checkfirst=True)
+
+
+# Курсор журнала изменений — (txid, seq): txid заполняется и в SQLite (0), строки
+# журнала из миграции 8 получают 0 — они видны раньше любых новых транзакций
+@migration(10, "change log txid cursor")
+def change_log_txid(conn):
+    import changes  # changes импортирует db, а db — этот модуль
+    changes.install_triggers(conn)
+    conn.execute(text("UPDATE change_log SET txid = 0 WHERE txid IS NULL"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_change_log_txid_seq ON change_log (txid, seq)"))
+
+
+def applied_versions(conn) -> set:
+    if not inspect(conn).has_table("schema_version"):
+        return set()
+    return set(conn.execute(select(schema_version.c.version)).scalars())
+
+
+# Дешёвая проверка при старте: один SELECT, без рефлексии схемы
+def current_version(engine) -> int:
+    with engine.connect() as conn:
+        try:
+            return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+        except DBAPIError:
+            return 0
+
+
+def latest_version() -> int:
+    return max(version for version, _, _ in MIGRATIONS)
+
+
+def upgrade(engine, verbose: bool = False):
+    version_metadata.create_all(engine)
+    with engine.connect() as conn:
+        done = applied_versions(conn)
+    for version, name, apply in sorted(MIGRATIONS):
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            apply(conn)
+            conn.execute(schema_version.insert().values(version=version, name=name, applied_at=datetime.utcnow()))
+        if verbose:
+            print(f"applied {version}: {name}")
+
+
+# Ключевые запросы для проверки планов; параметры — типичные значения
+KEY_QUERIES = {
+    "bookings by guest": ("SELECT * FROM booking WHERE guest_id = :id", {"id": 1}),
+    "payments by booking": ("SELECT * FROM payment WHERE booking_id = :id", {"id": 1}),
+    "services by guest": ("SELECT * FROM services WHERE guest_id = :id", {"id": 1}),
+    "services by booking": ("SELECT * FROM services WHERE booking_id = :id", {"id": 1}),
+    "bookings by status": ("SELECT * FROM booking WHERE status = :status", {"status": "checked_in"}),
+    "room overlap": (
+        "SELECT id FROM booking WHERE room_id = :id AND check_in_date < :check_out AND check_out_date > :check_in",
+        {"id": 1, "check_in": date(2025, 1, 1), "check_out": date(2025, 1, 5)},
+    ),
+    "bookings by check-in range": (
+        "SELECT * FROM booking WHERE check_in_date >= :date_from AND check_in_date < :date_to",
+        {"date_from": date(2025, 1, 1), "date_to": date(2025, 1, 2)},
+    ),
+    "changes after cursor": (
+        "SELECT * FROM change_log WHERE (txid, seq) > (:txid, :seq) ORDER BY txid, seq LIMIT 500",
+        {"txid": 0, "seq": 0},
+    ),
+    "guest search by name prefix": (
+        "SELECT id FROM guest WHERE search_name >= :prefix AND search_name < :upper ORDER BY search_name LIMIT 20",
+        {"prefix": "ivan", "upper": "ivan\U0010ffff"},
+    ),
+}
+
+
+def postgres_seq_scans(plan: dict):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from postgres_seq_scans(child)
+
+
+def sequential_scans(conn, sql: str, params: dict):
+    if conn.dialect.name == "postgresql":
+        raw = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+        plan = raw if isinstance(raw, list) else json.loads(raw)
+        return list(postgres_seq_scans(plan[0]["Plan"]))
+    # SQLite: строка "SCAN <таблица>" без индекса означает полный просмотр
+    rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql), params).all()
+    return [row[-1].split()[1] for row in rows
+            if row[-1].startswith("SCAN ") and "INDEX" not in row[-1]]
+
+
+def table_rows(conn, table: str) -> int:
+    if conn.dialect.name == "postgresql":
+        return int(conn.execute(text("SELECT reltuples FROM pg_class WHERE relname = :table"),
+                                {"table": table}).scalar() or 0)
+    return conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+# Возвращает список проблем: Seq Scan по таблицам больше min_rows строк
+def check_query_plans(engine, min_rows: int = 10000):
+    problems = []
+    with engine.connect() as conn:
+        for name, (sql, params) in KEY_QUERIES.items():
+            for table in sequential_scans(conn, sql, params):
+                rows = table_rows(conn, table)
+                if rows >= min_rows:
+                    problems.append(f"{name}: sequential scan on {table} ({rows} rows)")
+    return problems
+
+
+def main():
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Миграции схемы")
+    parser.add_argument("command", choices=["upgrade", "status", "check-plans"])
+    parser.add_argument("--min-rows", type=int, default=10000)
+    args = parser.parse_args()
+    if args.command == "upgrade":
+        upgrade(engine, verbose=True)
+        print(f"schema version {current_version(engine)}")
+    elif args.command == "status":
+        print(f"schema version {current_version(engine)} of {latest_version()}")
+    else:
+        problems = check_query_plans(engine, args.min_rows)
+        for problem in problems:
+            print("SEQ SCAN", problem)
+        if problems:
+            sys.exit(1)
+        print("all key queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
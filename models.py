@@ -2,7 +2,7 @@ from typing import Optional, List
 from decimal import Decimal
 from datetime import datetime, date
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, Numeric, Text, String
+from sqlalchemy import Column, Numeric, Text, String, Index, BigInteger, Integer, DateTime, Table, text
 
 class Guest(SQLModel, table=True):
     __tablename__ = "guest"
@@ -41,16 +41,21 @@ class RoomModel(SQLModel, table=True):
 
 class Booking(SQLModel, table=True):
     __tablename__ = "booking"
+    __table_args__ = (
+        Index("ix_booking_room_dates", "room_id", "check_in_date", "check_out_date"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
-    guest_id: Optional[int] = Field(default=None, foreign_key="guest.id")
+    guest_id: Optional[int] = Field(default=None, foreign_key="guest.id", index=True)
     room_id: Optional[int] = Field(default=None, foreign_key="room.id")
     admin_id: Optional[int] = Field(default=None, foreign_key="administrator.id")
-    check_in_date: date
-    check_out_date: date
-    status: Optional[str] = None
+    check_in_date: date = Field(index=True)
+    check_out_date: date = Field(index=True)
+    status: Optional[str] = Field(default=None, index=True)
     total_price: Decimal = Field(sa_column=Column(Numeric(10,2)))
     guests_count: Optional[int] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # unpaid / partial / paid — ведётся сервером по проведённым платежам (payments.py)
+    payment_status: Optional[str] = Field(default="unpaid")
 
     guest: Optional[Guest] = Relationship(back_populates="bookings")
     room: Optional[RoomModel] = Relationship(back_populates="bookings") 
@@ -61,25 +66,68 @@ class Booking(SQLModel, table=True):
 class PaymentModel(SQLModel, table=True): 
     __tablename__ = "payment"
     id: Optional[int] = Field(default=None, primary_key=True)
-    booking_id: Optional[int] = Field(default=None, foreign_key="booking.id")
+    booking_id: Optional[int] = Field(default=None, foreign_key="booking.id", index=True)
     amount: Decimal = Field(sa_column=Column(Numeric(10,2)))
     status: Optional[str] = None
     payment_method: Optional[str] = None
     transaction_id: Optional[str] = Field(default=None, sa_column=Column(String(100), unique=True))
-    paid_at: Optional[datetime] = None
+    paid_at: Optional[datetime] = Field(default=None, index=True)
 
     booking: Optional[Booking] = Relationship(back_populates="payments")
 
 class Service(SQLModel, table=True):
     __tablename__ = "services"
+    __table_args__ = (
+        Index("ix_services_employee_time", "employee", "service_time"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
     type: Optional[str] = None
     employee: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     status: Optional[str] = None
     service_time: Optional[datetime] = None
-    guest_id: Optional[int] = Field(default=None, foreign_key="guest.id")
-    booking_id: Optional[int] = Field(default=None, foreign_key="booking.id")
+    guest_id: Optional[int] = Field(default=None, foreign_key="guest.id", index=True)
+    booking_id: Optional[int] = Field(default=None, foreign_key="booking.id", index=True)
 
     guest: Optional[Guest] = Relationship(back_populates="services")
-    booking: Optional[Booking] = Relationship(back_populates="services")
\ No newline at end of file
+    booking: Optional[Booking] = Relationship(back_populates="services")
+
+# Дневные итоги для отчётов (rollups.py): проданные ночи и выручка по дате и типу номера
+class DailyRollup(SQLModel, table=True):
+    __tablename__ = "daily_rollup"
+    day: date = Field(primary_key=True)
+    room_type: str = Field(sa_column=Column(String(50), primary_key=True))
+    room_nights: int = 0
+    arrivals: int = 0
+    room_revenue: Decimal = Field(default=0, sa_column=Column(Numeric(12, 2), nullable=False))
+    payments: Decimal = Field(default=0, sa_column=Column(Numeric(12, 2), nullable=False))
+
+# Журнал изменений для /changes (changes.py): строки пишут триггеры БД на каждую вставку,
+# изменение и удаление; курсор потребителя — (txid, seq), txid — транзакция PostgreSQL
+# (в SQLite и для строк, внесённых миграцией, — 0)
+class ChangeLog(SQLModel, table=True):
+    __tablename__ = "change_log"
+    __table_args__ = (Index("ix_change_log_txid_seq", "txid", "seq"), {"sqlite_autoincrement": True})
+    seq: Optional[int] = Field(default=None, sa_column=Column(
+        BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True))
+    table_name: str = Field(sa_column=Column(String(50), nullable=False))
+    row_id: int
+    op: str = Field(sa_column=Column(String(10), nullable=False))
+    changed_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    txid: int = Field(default=0, sa_column=Column(BigInteger, nullable=False, server_default=text("0")))
+
+# Архив завершённых броней с их платежами и услугами (archive.py): те же колонки,
+# без внешних ключей и уникальности, плюс время переноса
+def archive_table(model, *indexed: str) -> Table:
+    name = f"{model.__tablename__}_archive"
+    return Table(
+        name, SQLModel.metadata,
+        *(Column(column.name, column.type, primary_key=column.primary_key, autoincrement=False)
+          for column in model.__table__.columns),
+        Column("archived_at", DateTime, nullable=False),
+        *(Index(f"ix_{name}_{column}", column) for column in indexed),
+    )
+
+BookingArchive = archive_table(Booking, "guest_id", "room_id", "check_in_date", "check_out_date")
+PaymentArchive = archive_table(PaymentModel, "booking_id", "transaction_id", "paid_at")
+ServiceArchive = archive_table(Service, "guest_id", "booking_id")
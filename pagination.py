@@ -0,0 +1,68 @@
+from typing import Optional
+from datetime import date, timedelta
+
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select
+
+import db as database
+from fastjson import dumps, decimal_as_str, dicts_response, row_dict, row_query
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_BATCH = 1000
+
+# Колонка даты, по которой фильтруется диапазон для каждой модели
+DATE_COLUMNS = {
+    "booking": "check_in_date",
+    "payment": "paid_at",
+    "services": "service_time",
+}
+
+# Собрать запрос с фильтрами и сортировкой по id (keyset);
+# rows=True — колонки таблицы вместо ORM-сущности (для быстрого JSON)
+def build_query(model, after: Optional[int] = None, status: Optional[str] = None,
+                guest_id: Optional[int] = None, date_from: Optional[date] = None,
+                date_to: Optional[date] = None, rows: bool = False):
+    query = row_query(model) if rows else select(model).order_by(model.id)
+    return apply_filters(query, model, after=after, status=status, guest_id=guest_id,
+                         date_from=date_from, date_to=date_to)
+
+# Те же фильтры поверх готового запроса (например, проекции с join)
+def apply_filters(query, model, after: Optional[int] = None, status: Optional[str] = None,
+                  guest_id: Optional[int] = None, date_from: Optional[date] = None,
+                  date_to: Optional[date] = None):
+    if after is not None:
+        query = query.where(model.id > after)
+    if status is not None and hasattr(model, "status"):
+        query = query.where(model.status == status)
+    if guest_id is not None and hasattr(model, "guest_id"):
+        query = query.where(model.guest_id == guest_id)
+    date_column = DATE_COLUMNS.get(model.__tablename__)
+    if date_column:
+        column = getattr(model, date_column)
+        if date_from is not None:
+            query = query.where(column >= date_from)
+        if date_to is not None:
+            # Включительно по дню, в том числе для колонок с datetime
+            query = query.where(column < date_to + timedelta(days=1))
+    return query
+
+# Одна страница строк сразу в JSON; курсор следующей страницы — в заголовке X-Next-Cursor
+def page_response(db: Session, query, limit: int, cursor_field: str = "id",
+                  serialize=row_dict, default=decimal_as_str) -> Response:
+    rows = db.exec(query.limit(limit)).all()
+    headers = {}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = str(getattr(rows[-1], cursor_field))
+    return dicts_response([serialize(row) for row in rows], default=default, headers=headers)
+
+# Потоковая выдача NDJSON через серверный курсор: память не растёт с размером таблицы
+def stream_ndjson(query, serialize=row_dict, default=decimal_as_str):
+    def generate():
+        # Отдельная сессия: зависимость get_db закрывается раньше, чем отдаётся тело
+        with Session(database.engine) as session:
+            result = session.exec(query.execution_options(yield_per=STREAM_BATCH))
+            for partition in result.partitions():
+                yield b"".join(dumps(serialize(row), default=default) + b"\n" for row in partition)
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
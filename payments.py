@@ -0,0 +1,175 @@
+import hashlib
+import math
+import threading
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session, select
+
+import db as database
+from db import env_int
+from models import Booking, PaymentModel, PaymentArchive
+from rollups import refresh_rollups, payment_range
+
+# Статус оплаты брони (booking.payment_status) по сумме проведённых платежей
+SETTLED_PAYMENT_STATUSES = {"paid", "completed"}
+UNPAID, PARTIAL, PAID = "unpaid", "partial", "paid"
+# Поля платежа, от которых зависит статус оплаты брони
+PAYMENT_STATUS_FIELDS = {"booking_id", "amount", "status"}
+# Ожидаемое число transaction_id для фильтра и доля ложных срабатываний
+PAYMENT_FILTER_CAPACITY = env_int("PAYMENT_FILTER_CAPACITY", 1_000_000)
+PAYMENT_FILTER_ERROR_RATE = 0.01
+LOOKUP_CHUNK = 500
+
+
+# Пересчитать payment_status броней одним UPDATE; booking_ids=None — все брони.
+# Коммит за вызывающим кодом, чтобы статус менялся в одной транзакции с платежами
+def set_payment_status(session: Session, booking_ids: Optional[Iterable[int]] = None) -> Dict[int, str]:
+    paid = (
+        select(func.coalesce(func.sum(PaymentModel.amount), 0))
+        .where(PaymentModel.booking_id == Booking.id, PaymentModel.status.in_(SETTLED_PAYMENT_STATUSES))
+        .scalar_subquery()
+    )
+    statement = update(Booking).values(payment_status=case(
+        (paid <= 0, UNPAID),
+        (paid >= Booking.total_price, PAID),
+        else_=PARTIAL,
+    ))
+    if booking_ids is not None:
+        booking_ids = [booking_id for booking_id in set(booking_ids) if booking_id is not None]
+        if not booking_ids:
+            return {}
+        statement = statement.where(Booking.id.in_(booking_ids))
+    rows = session.execute(statement.returning(Booking.id, Booking.payment_status)).all()
+    return dict(rows)
+
+
+# То же после обычных записей платежа или цены брони, отдельным коротким коммитом
+def refresh_payment_status(session: Session, booking_ids: Iterable[int]) -> Dict[int, str]:
+    statuses = set_payment_status(session, booking_ids)
+    session.commit()
+    return statuses
+
+
+def payment_booking_ids(session: Session, payment_ids: List[int]) -> List[int]:
+    return list(session.exec(select(PaymentModel.booking_id).where(PaymentModel.id.in_(payment_ids))).all())
+
+
+def transaction_exists(session: Session, transaction_id: Optional[str]) -> bool:
+    return transaction_id is not None and bool(existing_transactions(session, [transaction_id]))
+
+
+# Проверка перед записью одного платежа: повтор платежа из таблицы payment отсекает
+# уникальный индекс, а перенесённого в архив — только этот запрос
+def transaction_archived(session: Session, transaction_id: Optional[str]) -> bool:
+    return transaction_id is not None and session.execute(
+        select(PaymentArchive.c.id).where(PaymentArchive.c.transaction_id == transaction_id).limit(1)
+    ).first() is not None
+
+
+# Фильтр Блума по transaction_id: «точно нет» — платёж новый и идёт сразу в INSERT;
+# «возможно есть» — проверяется запросом. Ложные срабатывания стоят лишнего SELECT,
+# а пропуски (платежи, записанные мимо фильтра) ловит ON CONFLICT DO NOTHING,
+# поэтому от фильтра зависит только число запросов, но не результат
+class TransactionFilter:
+    def __init__(self, capacity: int = PAYMENT_FILTER_CAPACITY, error_rate: float = PAYMENT_FILTER_ERROR_RATE):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 64)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def _add(self, key: str):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def add_many(self, keys: Iterable[str]):
+        with self.lock:
+            for key in keys:
+                self._add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+    # Заполняется из таблицы при первой загрузке пачки, а не при старте приложения
+    def ensure_loaded(self, session: Session):
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            for table in (PaymentModel.__table__, PaymentArchive):
+                rows = session.execute(select(table.c.transaction_id)
+                                       .where(table.c.transaction_id != None)
+                                       .execution_options(yield_per=10000))
+                for transaction_id in rows.scalars():
+                    self._add(transaction_id)
+            self.loaded = True
+
+
+transaction_filter = TransactionFilter()
+
+
+# Уже записанные transaction_id, включая перенесённые в архив (archive.py): уникальность
+# в таблице payment архивные платежи не покрывает
+def existing_transactions(session: Session, transaction_ids: List[str]) -> set:
+    found = set()
+    for start in range(0, len(transaction_ids), LOOKUP_CHUNK):
+        chunk = transaction_ids[start:start + LOOKUP_CHUNK]
+        for table in (PaymentModel.__table__, PaymentArchive):
+            found.update(session.execute(select(table.c.transaction_id)
+                                         .where(table.c.transaction_id.in_(chunk))).scalars())
+    return found
+
+
+# INSERT ... ON CONFLICT (transaction_id) DO NOTHING RETURNING: повтор не вставляется и не
+# попадает в RETURNING (PostgreSQL и SQLite 3.35+)
+def insert_new(session: Session, rows: List[dict]) -> list:
+    table = PaymentModel.__table__
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    statement = (dialect.insert(table)
+                 .on_conflict_do_nothing(index_elements=[table.c.transaction_id])
+                 .returning(table.c.booking_id, table.c.paid_at))
+    return session.execute(statement, rows).all() if rows else []
+
+
+# Пачка платежей [(номер строки, значения колонок)] одной транзакцией: отсев повторов,
+# вставка новых и статус оплаты затронутых броней. Ошибка БД (например, несуществующая
+# бронь) — повтор построчно в SAVEPOINT, чтобы указать плохие строки
+def ingest_batch(batch: List[tuple]) -> dict:
+    unique = {}
+    for number, row in batch:
+        unique.setdefault(row["transaction_id"], (number, row))
+    errors, inserted = [], []
+    with Session(database.engine) as session:
+        transaction_filter.ensure_loaded(session)
+        known = existing_transactions(session, [key for key in unique if key in transaction_filter])
+        fresh = [item for key, item in unique.items() if key not in known]
+        try:
+            with session.begin_nested():
+                inserted = insert_new(session, [row for _, row in fresh])
+        except DBAPIError:
+            for number, row in fresh:
+                try:
+                    with session.begin_nested():
+                        inserted += insert_new(session, [row])
+                except DBAPIError as error:
+                    errors.append({"row": number, "error": str(error.orig).strip()})
+        statuses = set_payment_status(session, [booking_id for booking_id, _ in inserted])
+        session.commit()
+        failed = {error["row"] for error in errors}
+        transaction_filter.add_many(key for key, (number, _) in unique.items() if number not in failed)
+        refresh_rollups(session, [payment_range(paid_at) for _, paid_at in inserted])
+    return {
+        "inserted": len(inserted),
+        "duplicates": len(batch) - len(inserted) - len(errors),
+        "bookings_updated": len(statuses),
+        "errors": errors,
+    }
@@ -0,0 +1,174 @@
+import json
+import os
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from db import env_int
+from models import Booking
+
+# Расчёт цены проживания на сервере. Цена ночи = price_per_night × сезонный коэффициент ×
+# коэффициент дня недели, с округлением до копейки; плюс доплата за каждого гостя сверх
+# base_guests за ночь; итог уменьшается на скидку за длину проживания (наибольшую подходящую).
+# Правила по умолчанию ниже; PRICING_FILE=путь.json подменяет любые из ключей.
+DEFAULT_RULES = {
+    # [начало "MM-DD", конец "MM-DD" включительно, коэффициент, тип номера или null — для всех]
+    "seasons": [
+        ["06-01", "08-31", "1.25", None],
+        ["12-20", "01-08", "1.40", None],
+    ],
+    # понедельник .. воскресенье
+    "weekdays": ["1.00", "1.00", "1.00", "1.00", "1.10", "1.15", "1.00"],
+    "base_guests": 2,
+    "extra_guest_nightly": "15.00",
+    # [от скольких ночей, доля скидки]
+    "stay_discounts": [[7, "0.05"], [14, "0.10"], [28, "0.20"]],
+}
+CENT = Decimal("0.01")
+# Все дни года, включая 29 февраля: ключи сезонной таблицы
+YEAR_DAYS = [(day.month, day.day) for day in (date(2000, 1, 1) + timedelta(days=n) for n in range(366))]
+
+
+def month_day(value: str) -> Tuple[int, int]:
+    month, day = value.split("-")
+    return int(month), int(day)
+
+
+def in_season(key: Tuple[int, int], start: Tuple[int, int], end: Tuple[int, int]) -> bool:
+    if start <= end:
+        return start <= key <= end
+    return key >= start or key <= end  # сезон через Новый год
+
+
+class PricingRules:
+    def __init__(self, rules: dict):
+        self.seasons = [(month_day(start), month_day(end), Decimal(factor), room_type)
+                        for start, end, factor, room_type in rules["seasons"]]
+        self.weekdays = [Decimal(factor) for factor in rules["weekdays"]]
+        self.base_guests = int(rules["base_guests"])
+        self.extra_guest_cents = int(Decimal(rules["extra_guest_nightly"]) * 100)
+        self.stay_discounts = sorted((int(nights), Decimal(share)) for nights, share in rules["stay_discounts"])
+        self.season_tables: Dict[Optional[str], Dict[Tuple[int, int], Decimal]] = {}
+
+    # Сезонный коэффициент по дню года для типа номера; сезон типа важнее общего,
+    # из равных — последний в списке. Таблица строится один раз на тип
+    def season_table(self, room_type: Optional[str]) -> Dict[Tuple[int, int], Decimal]:
+        table = self.season_tables.get(room_type)
+        if table is None:
+            table = {}
+            for key in YEAR_DAYS:
+                factor, specific = Decimal(1), False
+                for start, end, season_factor, season_type in self.seasons:
+                    if season_type not in (None, room_type) or not in_season(key, start, end):
+                        continue
+                    if season_type is not None or not specific:
+                        factor, specific = season_factor, season_type is not None
+                table[key] = factor
+            self.season_tables[room_type] = table
+        return table
+
+    def day_factors(self, start: date, days: int, room_type: Optional[str]) -> List[Decimal]:
+        table = self.season_table(room_type)
+        factors = []
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            factors.append(table[(day.month, day.day)] * self.weekdays[day.weekday()])
+        return factors
+
+    # Префиксные суммы цен ночей (в копейках) одного номера на [start, start + days]
+    def nightly_prefix(self, price: Decimal, factors: List[Decimal]) -> List[int]:
+        prefix = [0]
+        for factor in factors:
+            prefix.append(prefix[-1] + int((price * factor).quantize(CENT, ROUND_HALF_UP) * 100))
+        return prefix
+
+    def discount(self, nights: int) -> Decimal:
+        share = Decimal(0)
+        for min_nights, stay_share in self.stay_discounts:
+            if nights >= min_nights:
+                share = stay_share
+        return share
+
+    # Итог из суммы ночей: доплата за гостей и скидка за длину проживания
+    def total(self, nightly_cents: int, nights: int, guests: Optional[int]) -> Decimal:
+        extra_guests = max((guests or 0) - self.base_guests, 0)
+        cents = nightly_cents + extra_guests * self.extra_guest_cents * nights
+        amount = Decimal(cents).scaleb(-2)
+        return (amount * (1 - self.discount(nights))).quantize(CENT, ROUND_HALF_UP)
+
+    # Цены для многих номеров и диапазонов дат. Коэффициенты дней считаются один раз
+    # на тип номера, массив цен ночей с префиксными суммами — один раз на (цену, тип);
+    # цена любого диапазона — разность двух префиксов, O(1)
+    def quote_batch(self, rooms: Sequence[Tuple[int, Decimal, Optional[str]]],
+                    ranges: Sequence[Tuple[date, date]], guests: Optional[int] = None) -> List[List[Decimal]]:
+        if not ranges:
+            return []
+        start = min(check_in for check_in, _ in ranges)
+        days = (max(check_out for _, check_out in ranges) - start).days
+        factors: Dict[Optional[str], List[Decimal]] = {}
+        prefixes: Dict[Tuple[Decimal, Optional[str]], List[int]] = {}
+        room_prefixes = []
+        for _, price, room_type in rooms:
+            key = (price, room_type)
+            if key not in prefixes:
+                if room_type not in factors:
+                    factors[room_type] = self.day_factors(start, days, room_type)
+                prefixes[key] = self.nightly_prefix(price, factors[room_type])
+            room_prefixes.append(prefixes[key])
+        result = []
+        for check_in, check_out in ranges:
+            first, last = (check_in - start).days, (check_out - start).days
+            nights = last - first
+            result.append([self.total(prefix[last] - prefix[first], nights, guests) for prefix in room_prefixes])
+        return result
+
+    def quote(self, price: Decimal, room_type: Optional[str], check_in: date, check_out: date,
+              guests: Optional[int] = None) -> Decimal:
+        return self.quote_batch([(0, price, room_type)], [(check_in, check_out)], guests)[0][0]
+
+
+def load_rules(path: Optional[str] = None) -> PricingRules:
+    rules = dict(DEFAULT_RULES)
+    if path:
+        with open(path, encoding="utf-8") as handle:
+            rules.update(json.load(handle))
+    return PricingRules(rules)
+
+
+pricing_rules = load_rules(os.getenv("PRICING_FILE"))
+# Предел номеров × диапазонов в одном запросе /quotes/batch
+MAX_QUOTES = env_int("MAX_QUOTES", 50000)
+
+
+# Цена новой брони считается по правилам; цена клиента принимается только с manual_price
+# или когда номер не указан. room — номер из кэша, загружается вызывающим кодом
+def price_booking(values: dict, room, manual: bool) -> dict:
+    if values["check_out_date"] <= values["check_in_date"]:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
+    if manual or values.get("room_id") is None:
+        if values.get("total_price") is None:
+            raise HTTPException(status_code=400, detail="total_price is required when the price is not quoted")
+        return values
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    values["total_price"] = pricing_rules.quote(room.price_per_night, room.type, values["check_in_date"],
+                                                values["check_out_date"], values.get("guests_count"))
+    return values
+
+
+# PUT с одной из дат: вторая берётся из текущей брони (обе сразу проверяет BookingUpdate).
+# Иначе обратный диапазон дошёл бы до БД — в PostgreSQL daterange падает с DataError
+def check_stay_update(session: Session, booking_id: int, values: dict):
+    if ("check_in_date" in values) == ("check_out_date" in values):
+        return
+    current = session.exec(select(Booking.check_in_date, Booking.check_out_date)
+                           .where(Booking.id == booking_id)).first()
+    if current is None:
+        return
+    check_in = values.get("check_in_date", current[0])
+    check_out = values.get("check_out_date", current[1])
+    if check_in is not None and check_out is not None and check_out <= check_in:
+        raise HTTPException(status_code=400, detail="Check-out must be after check-in")
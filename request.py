@@ -1,33 +1,69 @@
+from contextlib import contextmanager
 from sqlmodel import Session, select
-from db import engine
+import db as database
 from models import Guest, Administrator, RoomModel, Booking, PaymentModel, Service  # ИЗМЕНЕНО
 from datetime import date
+from typing import Optional
+from sqlalchemy import or_
+from availability import INACTIVE_STATUSES
+from details import booking_details_query, booking_details_row, load_guest_profile, guest_profile_dict, BOOKING_OPTIONS
+from pricing import pricing_rules
+
+# Сессия вызывающего кода или новая: несколько вызовов подряд могут идти через одну сессию
+@contextmanager
+def session_scope(session: Optional[Session] = None):
+    if session is not None:
+        yield session
+    else:
+        with Session(database.engine) as session:
+            yield session
 
 # Получить всех гостей
-def get_all_guests():
-    with Session(engine) as session:
+def get_all_guests(session: Optional[Session] = None):
+    with session_scope(session) as session:
         guests = session.exec(select(Guest)).all()
         return guests
 
-# Получить все бронирования конкретного гостя
-def get_bookings_by_guest(guest_id: int):
-    with Session(engine) as session:
+# Получить все бронирования конкретного гостя (с номерами и платежами, как в профиле)
+def get_bookings_by_guest(guest_id: int, session: Optional[Session] = None):
+    with session_scope(session) as session:
         bookings = session.exec(
-            select(Booking).where(Booking.guest_id == guest_id)
+            select(Booking).where(Booking.guest_id == guest_id).options(*BOOKING_OPTIONS)
         ).all()
         return bookings
 
-# Получить доступные комнаты 
-def get_available_rooms():
-    with Session(engine) as session:
-        rooms = session.exec(select(RoomModel).where(RoomModel.is_active == True)).all()  
+# Профиль гостя: гость, брони с номерами и платежами, услуги — фиксированное число запросов
+def get_guest_profile(guest_id: int, session: Optional[Session] = None):
+    with session_scope(session) as session:
+        guest = load_guest_profile(session, guest_id)
+        return guest_profile_dict(guest) if guest else None
+
+# Получить доступные комнаты (с датами — только свободные на [check_in, check_out))
+def get_available_rooms(check_in: Optional[date] = None, check_out: Optional[date] = None, guests: Optional[int] = None,
+                        session: Optional[Session] = None):
+    with session_scope(session) as session:
+        query = select(RoomModel).where(RoomModel.is_active == True)
+        if guests is not None:
+            query = query.where(or_(RoomModel.max_guests == None, RoomModel.max_guests >= guests))
+        if check_in is not None and check_out is not None:
+            busy = select(Booking.id).where(
+                Booking.room_id == RoomModel.id,
+                Booking.check_in_date < check_out,
+                Booking.check_out_date > check_in,
+                or_(Booking.status == None, Booking.status.not_in(INACTIVE_STATUSES)),
+            )
+            query = query.where(~busy.exists())
+        rooms = session.exec(query).all()  
         return rooms
 
-# Создать новое бронирование
-def create_booking(guest_id: int, room_id: int, admin_id: int, check_in: date, check_out: date, guests_count: int, total_price):
+# Создать новое бронирование; без total_price цена считается по правилам pricing.py
+def create_booking(guest_id: int, room_id: int, admin_id: int, check_in: date, check_out: date, guests_count: int, total_price=None):
     from models import Booking
     from decimal import Decimal
-    with Session(engine) as session:
+    with Session(database.engine) as session:
+        if total_price is None:
+            room = session.get(RoomModel, room_id)
+            total_price = pricing_rules.quote(room.price_per_night, room.type, check_in, check_out, guests_count)
         booking = Booking(
             guest_id=guest_id,
             room_id=room_id,
@@ -44,34 +80,25 @@ def create_booking(guest_id: int, room_id: int, admin_id: int, check_in: date, c
         return booking
 
 # Получить платежи по бронированию
-def get_payments_by_booking(booking_id: int):
-    with Session(engine) as session:
+def get_payments_by_booking(booking_id: int, session: Optional[Session] = None):
+    with session_scope(session) as session:
         payments = session.exec(
             select(PaymentModel).where(PaymentModel.booking_id == booking_id) 
         ).all()
         return payments
 
 # Получить услуги гостя
-def get_services_by_guest(guest_id: int):
-    with Session(engine) as session:
+def get_services_by_guest(guest_id: int, session: Optional[Session] = None):
+    with session_scope(session) as session:
         services = session.exec(
             select(Service).where(Service.guest_id == guest_id)
         ).all()
         return services
 
-# Пример бронирования с деталями гостя и комнаты
-def get_booking_details():
-    with Session(engine) as session:
-        bookings = session.exec(
-            select(Booking)
-        ).all()
-        details = []
-        for b in bookings:
-            details.append({
-                "booking_id": b.id,
-                "guest": f"{b.guest.first_name} {b.guest.last_name}" if b.guest else None,
-                "room_number": b.room.number if b.room else None,
-                "status": b.status,
-                "total_price": b.total_price
-            })
-        return details
\ No newline at end of file
+# Пример бронирования с деталями гостя и комнаты (один запрос вместо 2N+1)
+def get_booking_details(limit: Optional[int] = None, session: Optional[Session] = None, **filters):
+    with session_scope(session) as session:
+        query = booking_details_query(**filters)
+        if limit is not None:
+            query = query.limit(limit)
+        return [booking_details_row(row) for row in session.exec(query).all()]
@@ -0,0 +1,351 @@
+import argparse
+import logging
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, func, insert, or_, text
+from sqlmodel import Session, select
+
+from availability import INACTIVE_STATUSES
+from models import Booking, PaymentModel, RoomModel, DailyRollup, BookingArchive, PaymentArchive
+
+# Дневные итоги для отчётов по загрузке и выручке (таблица daily_rollup).
+# Запись брони или платежа пересчитывает затронутые дни из исходных строк, а не дельтами,
+# поэтому итоги сходятся с данными при любом порядке записей. Полная пересборка:
+#
+#   python rollups.py rebuild
+
+UNASSIGNED = "unassigned"
+# Платежи, не входящие в поступления
+EXCLUDED_PAYMENT_STATUSES = {"failed", "cancelled", "canceled", "refunded"}
+# Advisory-блокировки PostgreSQL: пересборка и архивация берут ключ ROLLUP_LOCK целиком,
+# пересчёт после записи — его же в разделяемом режиме и по дню (ROLLUP_LOCK, номер дня)
+ROLLUP_LOCK = 7017
+# Пересчёт большего числа дней берёт общую блокировку, а не по дню
+MAX_DAY_LOCKS = 62
+# Больше диапазонов за один пересчёт — считается один общий
+MAX_RANGES = 8
+INSERT_BATCH = 5000
+CENT = Decimal("0.01")
+
+# Поля, изменение которых требует пересчёта дней
+BOOKING_FIELDS = {"room_id", "check_in_date", "check_out_date", "total_price", "status"}
+PAYMENT_FIELDS = {"booking_id", "amount", "status", "paid_at"}
+ROOM_FIELDS = {"type"}
+
+logger = logging.getLogger("hotel.rollups")
+
+Range = Tuple[date, date]
+# Брони и платежи: рабочие таблицы и архив (archive.py); итоги считаются по обоим
+SOURCES = ((Booking.__table__, PaymentModel.__table__), (BookingArchive, PaymentArchive))
+
+
+def stay_range(check_in: Optional[date], check_out: Optional[date]) -> Optional[Range]:
+    if check_in is None or check_out is None or check_out <= check_in:
+        return None
+    return check_in, check_out
+
+
+def payment_range(paid_at: Optional[datetime]) -> Optional[Range]:
+    if paid_at is None:
+        return None
+    return paid_at.date(), paid_at.date() + timedelta(days=1)
+
+
+def booking_stay(booking) -> Optional[Range]:
+    return stay_range(booking.check_in_date, booking.check_out_date)
+
+
+def payment_day(payment) -> Optional[Range]:
+    return payment_range(payment.paid_at)
+
+
+# Дни, которые затрагивают брони сейчас (до изменения): проживание и даты их платежей
+def booking_ranges(session: Session, booking_ids: List[int]) -> List[Range]:
+    stays = session.exec(select(Booking.check_in_date, Booking.check_out_date)
+                         .where(Booking.id.in_(booking_ids))).all()
+    paid = session.exec(select(PaymentModel.paid_at)
+                        .where(PaymentModel.booking_id.in_(booking_ids), PaymentModel.paid_at != None)).all()
+    return [stay_range(*stay) for stay in stays] + [payment_range(paid_at) for paid_at in paid]
+
+
+def payment_ranges(session: Session, payment_ids: List[int]) -> List[Range]:
+    paid = session.exec(select(PaymentModel.paid_at).where(PaymentModel.id.in_(payment_ids))).all()
+    return [payment_range(paid_at) for paid_at in paid]
+
+
+# Тип номера влияет на все его брони и их платежи: общий диапазон дат
+def room_ranges(session: Session, room_id: int) -> List[Range]:
+    ranges = []
+    for bookings, payments in SOURCES:
+        first, last = session.execute(select(func.min(bookings.c.check_in_date), func.max(bookings.c.check_out_date))
+                                      .where(bookings.c.room_id == room_id)).one()
+        paid_first, paid_last = session.execute(
+            select(func.min(payments.c.paid_at), func.max(payments.c.paid_at))
+            .join(bookings, payments.c.booking_id == bookings.c.id)
+            .where(bookings.c.room_id == room_id)
+        ).one()
+        ranges.append(stay_range(first, last))
+        if paid_first is not None:
+            ranges.append((paid_first.date(), paid_last.date() + timedelta(days=1)))
+    return ranges
+
+
+def merge_ranges(ranges: Iterable[Optional[Range]]) -> List[Range]:
+    merged = []
+    for start, end in sorted(item for item in ranges if item is not None):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    if len(merged) > MAX_RANGES:
+        merged = [(merged[0][0], max(end for _, end in merged))]
+    return merged
+
+
+# Ночи, заезды и выручка разностными массивами: +x в день заезда, -x в день выезда;
+# префиксная сумма даёт значение на каждый день — O(броней + дней) без перебора ночей.
+# Выручка в копейках: total_price делится на ночи, остаток — по копейке на первые ночи,
+# поэтому значение дня не зависит от пересчитываемого диапазона, а сумма равна total_price
+class DayTotals:
+    def __init__(self, start: date, end: date):
+        self.start = start
+        self.days = (end - start).days
+        self.nights = defaultdict(lambda: [0] * (self.days + 1))
+        self.revenue = defaultdict(lambda: [0] * (self.days + 1))
+        self.arrivals = defaultdict(lambda: [0] * self.days)
+        self.payments = defaultdict(lambda: [Decimal(0)] * self.days)
+
+    def span(self, start: date, end: date) -> Tuple[int, int]:
+        return max((start - self.start).days, 0), min((end - self.start).days, self.days)
+
+    def add(self, deltas: List[int], start: date, end: date, value: int):
+        first, last = self.span(start, end)
+        if first < last:
+            deltas[first] += value
+            deltas[last] -= value
+
+    def add_stay(self, room_type: str, check_in: date, check_out: date, total_price):
+        nights = (check_out - check_in).days
+        first, last = self.span(check_in, check_out)
+        if nights <= 0 or first >= last:
+            return
+        base, extra = divmod(int((Decimal(total_price or 0) * 100).to_integral_value()), nights)
+        self.add(self.nights[room_type], check_in, check_out, 1)
+        self.add(self.revenue[room_type], check_in, check_out, base)
+        self.add(self.revenue[room_type], check_in, check_in + timedelta(days=extra), 1)
+        if check_in >= self.start:
+            self.arrivals[room_type][first] += 1
+
+    def add_payment(self, room_type: str, day: date, amount):
+        offset = (day - self.start).days
+        if 0 <= offset < self.days:
+            self.payments[room_type][offset] += Decimal(amount or 0)
+
+    def rows(self):
+        for room_type in sorted(set(self.nights) | set(self.payments)):
+            nights, cents = 0, 0
+            nights_delta, revenue_delta = self.nights.get(room_type), self.revenue.get(room_type)
+            arrivals, payments = self.arrivals.get(room_type), self.payments.get(room_type)
+            for offset in range(self.days):
+                if nights_delta is not None:
+                    nights += nights_delta[offset]
+                    cents += revenue_delta[offset]
+                row = {
+                    "day": self.start + timedelta(days=offset),
+                    "room_type": room_type,
+                    "room_nights": nights,
+                    "arrivals": arrivals[offset] if arrivals is not None else 0,
+                    "room_revenue": Decimal(cents).scaleb(-2),
+                    "payments": payments[offset].quantize(CENT) if payments is not None else Decimal("0.00"),
+                }
+                if row["room_nights"] or row["arrivals"] or row["room_revenue"] or row["payments"]:
+                    yield row
+
+
+def room_types(session: Session) -> Dict[int, str]:
+    return {room_id: room_type or UNASSIGNED
+            for room_id, room_type in session.exec(select(RoomModel.id, RoomModel.type)).all()}
+
+
+def midnight(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+# Несколько диапазонов (отсортированных, без пересечений) — одним проходом по общему охвату:
+# читаются только брони и платежи, задевающие диапазоны, и отдаются только их дни,
+# поэтому число запросов не растёт с числом диапазонов
+def compute(session: Session, ranges: List[Range]) -> List[dict]:
+    totals = DayTotals(ranges[0][0], max(end for _, end in ranges))
+    types = room_types(session)
+    for bookings, payments in SOURCES:
+        stays = (select(bookings.c.room_id, bookings.c.check_in_date, bookings.c.check_out_date,
+                        bookings.c.total_price, bookings.c.status)
+                 .where(or_(*(and_(bookings.c.check_out_date > start, bookings.c.check_in_date < end)
+                              for start, end in ranges)))
+                 .execution_options(yield_per=INSERT_BATCH))
+        for room_id, check_in, check_out, total_price, status in session.execute(stays):
+            if status not in INACTIVE_STATUSES:
+                totals.add_stay(types.get(room_id, UNASSIGNED), check_in, check_out, total_price)
+        paid = (select(payments.c.amount, payments.c.paid_at, payments.c.status, bookings.c.room_id)
+                .outerjoin(bookings, payments.c.booking_id == bookings.c.id)
+                .where(or_(*(and_(payments.c.paid_at >= midnight(start), payments.c.paid_at < midnight(end))
+                             for start, end in ranges)))
+                .execution_options(yield_per=INSERT_BATCH))
+        for amount, paid_at, status, room_id in session.execute(paid):
+            if status not in EXCLUDED_PAYMENT_STATUSES:
+                totals.add_payment(types.get(room_id, UNASSIGNED), paid_at.date(), amount)
+    if len(ranges) == 1:
+        return list(totals.rows())
+    return [row for row in totals.rows() if any(start <= row["day"] < end for start, end in ranges)]
+
+
+def lock(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ROLLUP_LOCK})
+
+
+# Пересчёты разных дней идут параллельно: каждый ждёт только пересчётов тех же дней
+# (блокировки по возрастанию дня, без взаимных ожиданий) и целиком — пересборку и архивацию
+def lock_days(session: Session, ranges: List[Range]):
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    if sum((end - start).days for start, end in ranges) > MAX_DAY_LOCKS:
+        lock(session)
+        return
+    days = sorted(day for start, end in ranges for day in range(start.toordinal(), end.toordinal()))
+    session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": ROLLUP_LOCK})
+    session.execute(text("SELECT count(pg_advisory_xact_lock(:key, day)) FROM unnest(CAST(:days AS integer[])) AS day"),
+                    {"key": ROLLUP_LOCK, "days": days})
+
+
+def write(session: Session, rows: List[dict], ranges: Optional[List[Range]] = None):
+    table = DailyRollup.__table__
+    if ranges is None:
+        session.execute(delete(table))
+    else:
+        session.execute(delete(table).where(or_(*(and_(table.c.day >= start, table.c.day < end)
+                                                  for start, end in ranges))))
+    for offset in range(0, len(rows), INSERT_BATCH):
+        session.execute(insert(table), rows[offset:offset + INSERT_BATCH])
+
+
+# Пересчитать дни после записи. Запись уже закоммичена, поэтому ошибка пересчёта
+# не ломает запрос: итоги догонит следующий пересчёт этих дней или rebuild.
+# Итоги пишутся Core-запросами, и объекты сессии (только что записанная бронь,
+# которую вернёт эндпоинт) при этом коммите не должны устаревать.
+def refresh_rollups(session: Session, ranges: Iterable[Optional[Range]]):
+    merged = merge_ranges(ranges)
+    if not merged:
+        return
+    expire_on_commit, session.expire_on_commit = session.expire_on_commit, False
+    try:
+        lock_days(session, merged)
+        write(session, compute(session, merged), merged)
+        session.commit()
+    except Exception:
+        session.rollback()
+        logger.exception("daily rollup refresh failed for %s", merged)
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+# Полная пересборка одной транзакцией
+def rebuild(session: Session, commit: bool = True) -> int:
+    lock(session)
+    bounds = []
+    for bookings, payments in SOURCES:
+        first, last = session.execute(select(func.min(bookings.c.check_in_date),
+                                             func.max(bookings.c.check_out_date))).one()
+        paid_first, paid_last = session.execute(select(func.min(payments.c.paid_at),
+                                                       func.max(payments.c.paid_at))).one()
+        bounds += [day for day in (first, last) if day is not None]
+        if paid_first is not None:
+            bounds += [paid_first.date(), paid_last.date() + timedelta(days=1)]
+    rows = compute(session, [(min(bounds), max(bounds))]) if bounds else []
+    write(session, rows)
+    if commit:
+        session.commit()
+    return len(rows)
+
+
+def period_key(day: date, group: str) -> str:
+    return day.strftime("%Y-%m") if group == "month" else day.isoformat()
+
+
+def period_days(date_from: date, date_to: date, group: str) -> Dict[str, int]:
+    days = defaultdict(int)
+    day = date_from
+    while day <= date_to:
+        days[period_key(day, group)] += 1
+        day += timedelta(days=1)
+    return days
+
+
+def ratio(numerator, denominator, digits: int = 4):
+    if not denominator:
+        return None
+    return round(float(numerator) / float(denominator), digits)
+
+
+# Отчёт по периодам [date_from, date_to] включительно. Доступные номера — активные сейчас,
+# по типам; ADR = выручка / проданные ночи, RevPAR = выручка / доступные ночи
+def report(session: Session, date_from: date, date_to: date, group: str = "day",
+           room_type: Optional[str] = None, by_type: bool = True) -> List[dict]:
+    table = DailyRollup.__table__
+    query = (select(table.c.day, table.c.room_type, table.c.room_nights, table.c.arrivals,
+                    table.c.room_revenue, table.c.payments)
+             .where(table.c.day >= date_from, table.c.day <= date_to))
+    rooms_query = select(RoomModel.type, func.count(RoomModel.id)).where(RoomModel.is_active == True)
+    if room_type:
+        query = query.where(table.c.room_type == room_type)
+        rooms_query = rooms_query.where(RoomModel.type == room_type)
+    rooms = defaultdict(int)
+    for type_name, count in session.exec(rooms_query.group_by(RoomModel.type)).all():
+        rooms[(type_name or UNASSIGNED) if by_type else None] += count
+
+    days = period_days(date_from, date_to, group)
+    totals = defaultdict(lambda: {"room_nights": 0, "arrivals": 0,
+                                  "room_revenue": Decimal(0), "payments": Decimal(0)})
+    for day, type_name, nights, arrivals, revenue, payments in session.execute(query):
+        item = totals[(period_key(day, group), type_name if by_type else None)]
+        item["room_nights"] += nights
+        item["arrivals"] += arrivals
+        item["room_revenue"] += revenue
+        item["payments"] += payments
+    # Периоды без продаж тоже попадают в отчёт (с нулевой загрузкой)
+    for period in days:
+        for type_name in rooms:
+            totals[(period, type_name)]
+
+    result = []
+    for (period, type_name), item in sorted(totals.items(), key=lambda entry: (entry[0][0], entry[0][1] or "")):
+        available = rooms.get(type_name, 0) * days[period]
+        row = {"period": period}
+        if by_type:
+            row["room_type"] = type_name
+        row.update(item, available_room_nights=available,
+                   occupancy=ratio(item["room_nights"], available),
+                   adr=ratio(item["room_revenue"], item["room_nights"], 2),
+                   revpar=ratio(item["room_revenue"], available, 2))
+        result.append(row)
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    import db
+
+    parser = argparse.ArgumentParser(description="Дневные итоги для отчётов")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args(argv)
+    started = time.perf_counter()
+    with Session(db.engine) as session:
+        rows = rebuild(session)
+    print(f"daily_rollup: {rows} rows in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
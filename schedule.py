@@ -0,0 +1,249 @@
+import itertools
+import threading
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from availability import INACTIVE_STATUSES
+from db import env_int
+from models import Service
+
+# Расписание сотрудников: услуги с длительностью по типу (в модели Service её нет),
+# рабочий день и глубина истории, которую индекс держит в памяти
+SERVICE_DURATIONS = {
+    "spa": 90, "massage": 60, "cleaning": 60, "laundry": 30, "room_service": 30, "transfer": 60,
+}
+DEFAULT_SERVICE_MINUTES = env_int("SERVICE_DEFAULT_MINUTES", 60)
+WORK_DAY_START = env_int("WORK_DAY_START", 8)
+WORK_DAY_END = env_int("WORK_DAY_END", 22)
+SCHEDULE_HISTORY_DAYS = env_int("SCHEDULE_HISTORY_DAYS", 31)
+MAX_SERVICE_DURATION = timedelta(minutes=max(DEFAULT_SERVICE_MINUTES, *SERVICE_DURATIONS.values()))
+ALTERNATIVES = 3
+ALTERNATIVE_DAYS = 7
+
+
+def service_duration(service_type: Optional[str]) -> timedelta:
+    return timedelta(minutes=SERVICE_DURATIONS.get(service_type, DEFAULT_SERVICE_MINUTES))
+
+
+class ScheduledService(NamedTuple):
+    id: int
+    employee: str
+    type: Optional[str]
+    status: Optional[str]
+    start: datetime
+    end: datetime
+    guest_id: Optional[int]
+    booking_id: Optional[int]
+
+
+def scheduled(service) -> Optional[ScheduledService]:
+    if not service.employee or service.service_time is None or service.status in INACTIVE_STATUSES:
+        return None
+    return ScheduledService(service.id, service.employee, service.type, service.status, service.service_time,
+                            service.service_time + service_duration(service.type),
+                            service.guest_id, service.booking_id)
+
+
+# Услуги одного сотрудника, отсортированные по началу. Длительность ограничена сверху,
+# поэтому пересекающиеся с [start, end) услуги лежат в срезе начал (start - max_duration, end)
+class EmployeeTimeline:
+    def __init__(self):
+        self.entries: List[Tuple[datetime, int]] = []
+        self.services: Dict[int, ScheduledService] = {}
+        self.max_duration = timedelta(0)
+
+    def add(self, item: ScheduledService):
+        insort(self.entries, (item.start, item.id))
+        self.services[item.id] = item
+        self.max_duration = max(self.max_duration, item.end - item.start)
+
+    def remove(self, item: ScheduledService):
+        idx = bisect_left(self.entries, (item.start, item.id))
+        if idx < len(self.entries) and self.entries[idx] == (item.start, item.id):
+            del self.entries[idx]
+        self.services.pop(item.id, None)
+
+    def between(self, start: datetime, end: datetime,
+                exclude_id: Optional[int] = None) -> List[ScheduledService]:
+        low = bisect_left(self.entries, (start - self.max_duration,))
+        high = bisect_left(self.entries, (end,))
+        return [self.services[service_id] for _, service_id in self.entries[low:high]
+                if self.services[service_id].end > start and service_id != exclude_id]
+
+    # Свободные промежутки внутри [start, end)
+    def gaps(self, start: datetime, end: datetime,
+             exclude_id: Optional[int] = None) -> List[Tuple[datetime, datetime]]:
+        gaps, cursor = [], start
+        for item in self.between(start, end, exclude_id):
+            if item.start > cursor:
+                gaps.append((cursor, item.start))
+            cursor = max(cursor, item.end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+
+def work_day(day: date) -> Tuple[datetime, datetime]:
+    return datetime.combine(day, time(WORK_DAY_START)), datetime.combine(day, time(WORK_DAY_END))
+
+
+# Индекс расписания по всем сотрудникам; живёт в памяти процесса, как индекс занятости номеров
+class ScheduleIndex:
+    def __init__(self):
+        self.employees: Dict[str, EmployeeTimeline] = {}
+        self.services: Dict[int, ScheduledService] = {}
+        self.since: Optional[datetime] = None
+        self.lock = threading.Lock()
+        # временные записи занятых до коммита слотов — с отрицательными id
+        self.reservations = itertools.count(-1, -1)
+
+    # Загрузить услуги за последние SCHEDULE_HISTORY_DAYS и будущие одним запросом
+    def load(self, session: Session, now: Optional[datetime] = None):
+        since = datetime.combine((now or datetime.utcnow()).date() - timedelta(days=SCHEDULE_HISTORY_DAYS), time())
+        rows = session.exec(
+            select(Service.id, Service.employee, Service.type, Service.status, Service.service_time,
+                   Service.guest_id, Service.booking_id)
+            .where(Service.employee != None, Service.service_time >= since)
+        ).all()
+        with self.lock:
+            self.employees.clear()
+            self.services.clear()
+            self.since = since
+            for row in rows:
+                self._add(scheduled(row))
+
+    def _add(self, item: Optional[ScheduledService]):
+        if item is None:
+            return
+        self.employees.setdefault(item.employee, EmployeeTimeline()).add(item)
+        self.services[item.id] = item
+
+    def _remove(self, service_id: int):
+        item = self.services.pop(service_id, None)
+        if item is not None:
+            self.employees[item.employee].remove(item)
+
+    # Добавить или обновить услугу после коммита
+    def upsert(self, service):
+        with self.lock:
+            self._remove(service.id)
+            self._add(scheduled(service))
+
+    def remove(self, service_id: int):
+        with self.lock:
+            self._remove(service_id)
+
+    def covers(self, start: datetime) -> bool:
+        return self.since is not None and start >= self.since
+
+    def conflicts(self, employee: str, start: datetime, end: datetime,
+                  exclude_id: Optional[int] = None) -> List[ScheduledService]:
+        with self.lock:
+            timeline = self.employees.get(employee)
+            if timeline is None:
+                return []
+            return timeline.between(start, end, exclude_id)
+
+    # Проверить слот и сразу занять его временной записью под одной блокировкой: два запроса
+    # на одно время не пройдут проверку оба. Возвращает (id записи, None) или (None, конфликты)
+    def reserve(self, employee: str, start: datetime, duration: timedelta, service_type: Optional[str],
+                exclude_id: Optional[int] = None) -> Tuple[Optional[int], List[ScheduledService]]:
+        with self.lock:
+            timeline = self.employees.get(employee)
+            conflicts = timeline.between(start, start + duration, exclude_id) if timeline else []
+            if conflicts:
+                return None, conflicts
+            item = ScheduledService(next(self.reservations), employee, service_type, None,
+                                    start, start + duration, None, None)
+            self._add(item)
+            return item.id, []
+
+    def schedule(self, employee: Optional[str], start: datetime, end: datetime) -> List[ScheduledService]:
+        with self.lock:
+            names = [employee] if employee else sorted(self.employees)
+            items = [item for name in names if name in self.employees
+                     for item in self.employees[name].between(start, end) if item.id > 0]
+        return sorted(items, key=lambda item: (item.start, item.employee, item.id))
+
+    # Свободные промежутки рабочего дня не короче duration
+    def free_slots(self, employee: str, day: date, duration: timedelta,
+                   exclude_id: Optional[int] = None) -> List[Tuple[datetime, datetime]]:
+        day_start, day_end = work_day(day)
+        with self.lock:
+            timeline = self.employees.get(employee)
+            if timeline is None:
+                gaps = [(day_start, day_end)]
+            else:
+                gaps = timeline.gaps(day_start, day_end, exclude_id)
+        return [(start, end) for start, end in gaps if end - start >= duration]
+
+    def employee_names(self) -> List[str]:
+        with self.lock:
+            return sorted(self.employees)
+
+    # Ближайшие к запрошенному свободные начала: в тот же день, затем в следующие дни
+    def alternatives(self, employee: str, start: datetime, duration: timedelta,
+                     exclude_id: Optional[int] = None, count: int = ALTERNATIVES) -> List[datetime]:
+        candidates = []
+        for offset in range(ALTERNATIVE_DAYS):
+            for gap_start, gap_end in self.free_slots(employee, start.date() + timedelta(days=offset),
+                                                      duration, exclude_id):
+                candidates.append(min(max(start, gap_start), gap_end - duration))
+            if len(candidates) >= count:
+                break
+        return sorted(candidates, key=lambda candidate: (abs(candidate - start), candidate))[:count]
+
+
+schedule_index = ScheduleIndex()
+
+
+# Запись услуги внутри блока: слот занят в индексе до коммита (иначе 409 с занятыми
+# услугами и ближайшими свободными слотами) и освобождается после выхода — при успехе
+# его место уже заняла записанная услуга, при ошибке он просто снимается
+@contextmanager
+def reserved_slot(values: dict, service_id: Optional[int] = None):
+    employee, start = values.get("employee"), values.get("service_time")
+    if not employee or start is None or values.get("status") in INACTIVE_STATUSES:
+        yield
+        return
+    duration = service_duration(values.get("type"))
+    reservation, conflicts = schedule_index.reserve(employee, start, duration, values.get("type"), service_id)
+    if conflicts:
+        raise HTTPException(status_code=409, detail={
+            "message": "Employee is already booked at this time",
+            "conflicts": [item.id for item in conflicts],
+            "alternatives": [candidate.isoformat() for candidate in
+                             schedule_index.alternatives(employee, start, duration, service_id)],
+        })
+    try:
+        yield
+    finally:
+        schedule_index.remove(reservation)
+
+
+# Поля, от которых зависит расписание: при их изменении проверка нужна и для PUT
+SCHEDULE_FIELDS = {"employee", "service_time", "type", "status"}
+
+
+def schedule_row(item: ScheduledService) -> dict:
+    return {"service_id": item.id, "employee": item.employee, "type": item.type, "status": item.status,
+            "start": item.start, "end": item.end, "guest_id": item.guest_id, "booking_id": item.booking_id}
+
+
+# Дни старше горизонта индекса читаются из БД по индексу (employee, service_time)
+def schedule_from_db(session: Session, employee: Optional[str], start: datetime, end: datetime):
+    query = (select(Service.id, Service.employee, Service.type, Service.status, Service.service_time,
+                    Service.guest_id, Service.booking_id)
+             .where(Service.employee != None,
+                    Service.service_time >= start - MAX_SERVICE_DURATION,
+                    Service.service_time < end)
+             .order_by(Service.service_time, Service.employee, Service.id))
+    if employee:
+        query = query.where(Service.employee == employee)
+    items = [scheduled(row) for row in session.exec(query).all()]
+    return [item for item in items if item is not None and item.end > start]
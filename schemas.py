@@ -0,0 +1,203 @@
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Optional, List
+from datetime import date, datetime, timezone
+from decimal import Decimal
+
+from models import RoomModel, PaymentModel, Service
+
+class GuestCreate(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    passport_data: Optional[str] = None
+
+class GuestUpdate(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    passport_data: Optional[str] = None
+
+class GuestSearchResult(BaseModel):
+    id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    passport_data: Optional[str] = None
+    match: str
+    score: float
+
+class ProfileBooking(BaseModel):
+    id: int
+    guest_id: Optional[int] = None
+    room_id: Optional[int] = None
+    admin_id: Optional[int] = None
+    check_in_date: date
+    check_out_date: date
+    status: Optional[str] = None
+    total_price: Decimal
+    guests_count: Optional[int] = None
+    payment_status: str
+    created_at: datetime
+    room: Optional[RoomModel] = None
+    payments: List[PaymentModel]
+
+class GuestProfile(BaseModel):
+    id: int
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    passport_data: Optional[str] = None
+    bookings: List[ProfileBooking]
+    services: List[Service]
+
+class RoomCreate(BaseModel):
+    number: str
+    type: Optional[str] = None
+    description: Optional[str] = None
+    price_per_night: Decimal
+    max_guests: Optional[int] = None
+    is_active: bool = True
+
+class RoomUpdate(BaseModel):
+    number: Optional[str] = None
+    type: Optional[str] = None
+    description: Optional[str] = None
+    price_per_night: Optional[Decimal] = None
+    max_guests: Optional[int] = None
+    is_active: Optional[bool] = None
+
+# Выезд строго после заезда; None — дата не передана (частичное изменение)
+def check_stay_dates(check_in: Optional[date], check_out: Optional[date]):
+    if check_in is not None and check_out is not None and check_out <= check_in:
+        raise ValueError("Check-out must be after check-in")
+
+class BookingCreate(BaseModel):
+    guest_id: Optional[int] = None
+    room_id: Optional[int] = None
+    admin_id: Optional[int] = None
+    check_in_date: date
+    check_out_date: date
+    status: Optional[str] = None
+    total_price: Optional[Decimal] = None
+    guests_count: Optional[int] = None
+    # удержание из POST /holds на тот же номер и даты
+    hold_id: Optional[str] = None
+
+    @model_validator(mode="after")
+    def stay_dates(self):
+        check_stay_dates(self.check_in_date, self.check_out_date)
+        return self
+
+# Импорт переносит готовые брони: цена обязательна и не пересчитывается
+class BookingImport(BookingCreate):
+    total_price: Decimal
+
+class BookingUpdate(BaseModel):
+    guest_id: Optional[int] = None
+    room_id: Optional[int] = None
+    admin_id: Optional[int] = None
+    check_in_date: Optional[date] = None
+    check_out_date: Optional[date] = None
+    status: Optional[str] = None
+    total_price: Optional[Decimal] = None
+    guests_count: Optional[int] = None
+
+    @model_validator(mode="after")
+    def stay_dates(self):
+        check_stay_dates(self.check_in_date, self.check_out_date)
+        return self
+
+class BookingStatusUpdate(BaseModel):
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+    status: str
+
+class BookingStatusResult(BaseModel):
+    updated: List[int]
+    not_found: List[int]
+
+class DateRange(BaseModel):
+    check_in: date
+    check_out: date
+
+class AvailabilityBatch(BaseModel):
+    ranges: List[DateRange]
+    guests: Optional[int] = None
+
+class QuoteBatch(BaseModel):
+    ranges: List[DateRange] = Field(..., min_length=1, max_length=366)
+    room_ids: Optional[List[int]] = Field(None, max_length=1000)
+    guests: Optional[int] = Field(None, ge=1)
+    only_available: bool = False
+
+# ttl_seconds не задан — HOLD_TTL_SECONDS; верхняя граница — MAX_HOLD_TTL_SECONDS (holds.py)
+class HoldCreate(BaseModel):
+    room_id: int
+    check_in: date
+    check_out: date
+    ttl_seconds: Optional[int] = Field(None, ge=1)
+
+class FreeSlotQuery(BaseModel):
+    date: date
+    employee: Optional[str] = None
+    type: Optional[str] = None
+    duration_minutes: Optional[int] = Field(None, ge=5, le=720)
+
+class FreeSlotsBatch(BaseModel):
+    queries: List[FreeSlotQuery] = Field(..., min_length=1, max_length=100)
+
+class PaymentCreate(BaseModel):
+    booking_id: Optional[int] = None
+    amount: Decimal
+    status: Optional[str] = None
+    payment_method: Optional[str] = None
+    transaction_id: Optional[str] = None
+
+# Платёж из callback шлюза: transaction_id обязателен — по нему отсеиваются повторы
+class PaymentIngest(PaymentCreate):
+    transaction_id: str = Field(..., min_length=1, max_length=100)
+    paid_at: Optional[datetime] = None
+
+class PaymentUpdate(BaseModel):
+    booking_id: Optional[int] = None
+    amount: Optional[Decimal] = None
+    status: Optional[str] = None
+    payment_method: Optional[str] = None
+    transaction_id: Optional[str] = None
+    paid_at: Optional[datetime] = None
+
+# Время услуги хранится в UTC без часового пояса: время с поясом приводится к UTC,
+# иначе сравнение с записями индекса расписания падает
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+class ServiceCreate(BaseModel):
+    type: Optional[str] = None
+    employee: Optional[str] = None
+    status: Optional[str] = None
+    service_time: Optional[datetime] = None
+    guest_id: Optional[int] = None
+    booking_id: Optional[int] = None
+
+    @field_validator("service_time")
+    @classmethod
+    def service_time_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return naive_utc(value)
+
+class ServiceUpdate(BaseModel):
+    type: Optional[str] = None
+    employee: Optional[str] = None
+    status: Optional[str] = None
+    service_time: Optional[datetime] = None
+    guest_id: Optional[int] = None
+    booking_id: Optional[int] = None
+
+    @field_validator("service_time")
+    @classmethod
+    def service_time_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        return naive_utc(value)
@@ -0,0 +1,137 @@
+import re
+from typing import List
+
+from sqlalchemy import Column, Integer, MetaData, Table, Text, func, select
+
+from models import Guest
+
+# Поиск гостей для стойки регистрации. Нормализованные колонки guest.search_* —
+# генерируемые (миграция 4), поэтому их не нужно поддерживать при записи и их нет
+# в модели Guest и ответах API. Каждая ветка поиска — диапазон по индексу с LIMIT;
+# нечёткое совпадение (pg_trgm) запрашивается, только если точных и префиксных мало.
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+FUZZY_MIN_LENGTH = 3
+
+search_metadata = MetaData()
+guest_search = Table(
+    "guest", search_metadata,
+    Column("id", Integer, primary_key=True),
+    Column("search_name", Text),
+    Column("search_name_rev", Text),
+    Column("search_email", Text),
+    Column("search_phone", Text),
+    Column("search_passport", Text),
+)
+
+# Порядок ранжирования: точное совпадение email/телефона/паспорта, префикс
+# (внутри — по доле совпавшей длины), нечёткое совпадение имени или часть номера телефона
+EXACT, PREFIX, FUZZY = range(3)
+MATCH_NAMES = {EXACT: "exact", PREFIX: "prefix", FUZZY: "fuzzy"}
+
+
+# lower() в SQLite меняет регистр только у ASCII — запрос нормализуется так же, как колонки
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def lower_for(dialect: str):
+    if dialect == "sqlite":
+        return lambda value: value.translate(ASCII_LOWER)
+    return str.lower
+
+
+def normalize_text(value: str, lower=str.lower) -> str:
+    return " ".join(lower(value).split())
+
+
+def normalize_phone(value: str) -> str:
+    return re.sub(r"\D", "", value)
+
+
+def normalize_passport(value: str, lower=str.lower) -> str:
+    return re.sub(r"[\s-]", "", lower(value))
+
+
+# Префикс как диапазон [p, p + U+10FFFF): колонки с побайтовым порядком (COLLATE "C"
+# в PostgreSQL, BINARY в SQLite), поэтому хватает обычного btree-индекса и не нужно экранировать LIKE
+def prefix_range(column, prefix: str):
+    return (column >= prefix) & (column < prefix + "\U0010ffff")
+
+
+def prefix_ids(db, column, prefix: str, limit: int) -> List[tuple]:
+    query = (select(guest_search.c.id, column)
+             .where(prefix_range(column, prefix))
+             .order_by(column)
+             .limit(limit))
+    return db.execute(query).all()
+
+
+def fuzzy_name_ids(db, text: str, limit: int) -> List[tuple]:
+    column = guest_search.c.search_name
+    query = (select(guest_search.c.id, func.similarity(column, text))
+             .where(column.op("%")(text))
+             .order_by(column.op("<->")(text))
+             .limit(limit))
+    return db.execute(query).all()
+
+
+# Номер без кода страны или с середины: подстрока по триграммному индексу
+def phone_substring_ids(db, digits: str, limit: int) -> List[tuple]:
+    column = guest_search.c.search_phone
+    query = select(guest_search.c.id, column).where(column.like(f"%{digits}%")).limit(limit)
+    return db.execute(query).all()
+
+
+# Ветки поиска для строки запроса: (колонка, нормализованное значение, идентификатор ли)
+def search_branches(q: str, lower=str.lower):
+    text = normalize_text(q, lower)
+    digits = normalize_phone(q)
+    passport = normalize_passport(q, lower)
+    has_letters = any(char.isalpha() for char in q)
+    branches = []
+    if "@" in text or (has_letters and " " not in text):
+        branches.append((guest_search.c.search_email, text, True))
+    if len(digits) >= 3 and not has_letters:
+        branches.append((guest_search.c.search_phone, digits, True))
+    if passport and any(char.isdigit() for char in passport):
+        branches.append((guest_search.c.search_passport, passport, True))
+    if has_letters and "@" not in text:
+        branches.append((guest_search.c.search_name, text, False))
+        branches.append((guest_search.c.search_name_rev, text, False))
+    return text, digits, has_letters, branches
+
+
+# Возвращает [(guest_id, ранг, оценка)] — лучшие первыми, без повторов, не больше limit
+def rank_guests(db, q: str, limit: int = SEARCH_LIMIT) -> List[tuple]:
+    dialect = db.get_bind().dialect.name
+    text, digits, has_letters, branches = search_branches(q, lower_for(dialect))
+    best = {}
+
+    def add(guest_id, match, score):
+        if guest_id not in best or (match, -score) < best[guest_id]:
+            best[guest_id] = (match, -score)
+
+    for column, value, identifier in branches:
+        for guest_id, matched in prefix_ids(db, column, value, limit):
+            add(guest_id, EXACT if identifier and matched == value else PREFIX,
+                len(value) / max(len(matched), 1))
+    if len(best) < limit and dialect == "postgresql":
+        if has_letters and len(text) >= FUZZY_MIN_LENGTH:
+            for guest_id, similarity in fuzzy_name_ids(db, text, limit):
+                add(guest_id, FUZZY, float(similarity))
+        elif len(digits) >= FUZZY_MIN_LENGTH:
+            for guest_id, matched in phone_substring_ids(db, digits, limit):
+                add(guest_id, FUZZY, len(digits) / max(len(matched), 1))
+    ranked = sorted(best.items(), key=lambda item: (item[1], item[0]))[:limit]
+    return [(guest_id, match, -score) for guest_id, (match, score) in ranked]
+
+
+def search_guests(db, q: str, limit: int = SEARCH_LIMIT) -> List[dict]:
+    ranked = rank_guests(db, q, limit)
+    if not ranked:
+        return []
+    table = Guest.__table__
+    rows = {row.id: dict(row._mapping)
+            for row in db.execute(select(*table.columns).where(table.c.id.in_([item[0] for item in ranked])))}
+    return [dict(rows[guest_id], match=MATCH_NAMES[match], score=round(score, 4))
+            for guest_id, match, score in ranked if guest_id in rows]
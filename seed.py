@@ -1,50 +1,229 @@
-from sqlmodel import Session
-from db import engine
-from models import Guest, Administrator, RoomModel, Booking, PaymentModel, Service 
-from datetime import date, datetime
+import argparse
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
-def seed():
-    with Session(engine) as session:
-        admin = Administrator(username="admin", password_hash="123", role="manager")
-        guest = Guest(first_name="Иван", last_name="Иванов", email="ivan@example.com")
-        room = RoomModel(number="101", type="single", price_per_night=Decimal("50.00"), max_guests=1)  # ИЗМЕНЕНО
+from sqlalchemy import func, insert, text
+from sqlmodel import Session, select
 
-        session.add_all([admin, guest, room])
-        session.commit()
+import db as database
+from models import Guest, Administrator, RoomModel, Booking, PaymentModel, Service
+from bulk import copy_rows
+from payments import set_payment_status
+import rollups
 
-        booking = Booking(
-            guest_id=guest.id,
-            room_id=room.id,
-            admin_id=admin.id,
-            check_in_date=date(2025,9,25),
-            check_out_date=date(2025,9,28),
-            status="confirmed",
-            total_price=Decimal("150.00"),
-            guests_count=1
-        )
-        session.add(booking)
-        session.commit()
+# Генератор синтетических данных: номера, гости, непересекающиеся брони за N лет
+# с платежами и услугами. Детерминирован по --seed и --today; грузит пачками
+# через COPY (PostgreSQL) или многострочный INSERT.
+#
+#   python seed.py --rooms 300 --guests 200000 --years 5 --occupancy 0.75 --seed 42
+
+FIRST_NAMES = ["Иван", "Пётр", "Анна", "Мария", "Олег", "Елена", "Сергей", "Ольга", "Дмитрий", "Наталья",
+               "John", "Emma", "Liam", "Sofia", "Noah", "Mia", "Lucas", "Chloe", "Max", "Lea"]
+LAST_NAMES = ["Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов",
+              "Smith", "Brown", "Miller", "Davis", "Garcia", "Wilson", "Moore", "Taylor"]
+ROOM_TYPES = [
+    # тип, цена за ночь, вместимость, доля номеров
+    ("single", Decimal("50.00"), 1, 0.3),
+    ("double", Decimal("80.00"), 2, 0.45),
+    ("family", Decimal("120.00"), 4, 0.15),
+    ("suite", Decimal("250.00"), 3, 0.1),
+]
+SERVICE_TYPES = ["spa", "cleaning", "laundry", "room_service", "massage", "transfer"]
+EMPLOYEES = ["Olga", "Irina", "Pavel", "Svetlana", "Nikolai", "Anna", "Yuri", "Marina"]
+PAYMENT_METHODS = ["card", "cash", "transfer"]
+CANCEL_RATE = 0.05
+# Длина проживания: обычно 1-4 ночи, в LONG_STAY_SHARE случаев до MAX_STAY
+SHORT_STAY = 4
+MAX_STAY = 14
+LONG_STAY_SHARE = 0.3
+
+
+class Loader:
+    def __init__(self, session: Session, batch_size: int, use_copy: bool):
+        self.session = session
+        self.batch_size = batch_size
+        self.use_copy = use_copy and session.get_bind().dialect.name == "postgresql"
+        self.buffers = {}
+        self.counts = {}
+
+    def add(self, model, row: dict):
+        buffer = self.buffers.setdefault(model, [])
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush_all()
+
+    def flush(self, model):
+        rows = self.buffers.get(model)
+        if not rows:
+            return
+        table = model.__table__
+        if self.use_copy:
+            copy_rows(self.session, table, [column.name for column in table.columns], rows)
+        else:
+            self.session.execute(insert(table), rows)
+        self.counts[table.name] = self.counts.get(table.name, 0) + len(rows)
+        rows.clear()
+
+    # Порядок важен из-за внешних ключей
+    def flush_all(self):
+        for model in (Administrator, Guest, RoomModel, Booking, PaymentModel, Service):
+            self.flush(model)
+
+
+def next_id(session: Session, model) -> int:
+    return (session.exec(select(func.max(model.id))).one() or 0) + 1
+
+
+# Последовательности PostgreSQL после вставки с явными id
+def reset_sequences(session: Session):
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for model in (Administrator, Guest, RoomModel, Booking, PaymentModel, Service):
+        table = model.__table__.name
+        session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table}"
+        ))
 
-        payment = PaymentModel( 
-            booking_id=booking.id,
-            amount=Decimal("150.00"),
-            status="paid",
-            payment_method="card",
-            transaction_id="tx-0001",
-            paid_at=datetime.utcnow()
-        )
-        service = Service(
-            type="spa",
-            employee="Olga",
-            status="scheduled",
-            service_time=datetime.utcnow(),
-            guest_id=guest.id,
-            booking_id=booking.id
-        )
-        session.add_all([payment, service])
+
+def generate(rooms: int, guests: int, years: float, occupancy: float, services_per_stay: float,
+             seed: int, batch_size: int = 5000, use_copy: bool = True, today: date = None):
+    rng = random.Random(seed)
+    today = today or date.today()
+    start = today - timedelta(days=int(years * 365))
+    # Бронирование вперёд на полгода
+    end = today + timedelta(days=180)
+    mean_stay = LONG_STAY_SHARE * (1 + MAX_STAY) / 2 + (1 - LONG_STAY_SHARE) * (1 + SHORT_STAY) / 2
+    mean_gap = max(mean_stay * (1 - occupancy) / max(occupancy, 0.01), 0.0)
+    started = time.perf_counter()
+
+    with Session(database.engine) as session:
+        loader = Loader(session, batch_size, use_copy)
+        admin_id = next_id(session, Administrator)
+        guest_id = next_id(session, Guest)
+        room_id = next_id(session, RoomModel)
+        booking_id = next_id(session, Booking)
+        payment_id = next_id(session, PaymentModel)
+        service_id = next_id(session, Service)
+
+        admin_ids = list(range(admin_id, admin_id + 5))
+        for offset, admin in enumerate(admin_ids):
+            loader.add(Administrator, {
+                "id": admin, "role": "manager" if offset == 0 else "receptionist",
+                "username": f"admin{seed}_{admin}", "password_hash": "!",
+                "first_name": rng.choice(FIRST_NAMES), "last_name": rng.choice(LAST_NAMES),
+            })
+
+        guest_ids = range(guest_id, guest_id + guests)
+        for guest in guest_ids:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            loader.add(Guest, {
+                "id": guest, "first_name": first, "last_name": last,
+                "email": f"guest{guest}@example.com",
+                "phone_number": f"+7{rng.randrange(10**9, 10**10)}",
+                "passport_data": f"{rng.randrange(1000, 9999)} {rng.randrange(100000, 999999)}",
+            })
+
+        room_list = []
+        weights = [share for *_, share in ROOM_TYPES]
+        for offset in range(rooms):
+            room_type, price, capacity, _ = rng.choices(ROOM_TYPES, weights)[0]
+            room = room_id + offset
+            room_list.append((room, price, capacity))
+            loader.add(RoomModel, {
+                # номер из выделенного id: уникален при повторных запусках и умещается в String(10)
+                "id": room, "number": str(room),
+                "type": room_type, "description": None, "price_per_night": price,
+                "max_guests": capacity, "is_active": True,
+            })
+        loader.flush_all()
+
+        # Брони по каждому номеру идут подряд, поэтому не пересекаются
+        for room, price, capacity in room_list:
+            day = start + timedelta(days=int(rng.expovariate(1 / mean_gap))) if mean_gap else start
+            while day < end:
+                nights = rng.randint(1, MAX_STAY) if rng.random() < LONG_STAY_SHARE else rng.randint(1, SHORT_STAY)
+                check_in, check_out = day, day + timedelta(days=nights)
+                guest = rng.choice(guest_ids)
+                total = price * nights
+                if rng.random() < CANCEL_RATE:
+                    status = "cancelled"
+                elif check_out <= today:
+                    status = "checked_out"
+                elif check_in <= today:
+                    status = "checked_in"
+                else:
+                    status = "confirmed"
+                created_at = datetime.combine(check_in - timedelta(days=rng.randint(1, 90)), datetime.min.time())
+                loader.add(Booking, {
+                    "id": booking_id, "guest_id": guest, "room_id": room, "admin_id": rng.choice(admin_ids),
+                    "check_in_date": check_in, "check_out_date": check_out, "status": status,
+                    "total_price": total, "guests_count": rng.randint(1, capacity), "created_at": created_at,
+                })
+                if status != "cancelled":
+                    paid_at = datetime.combine(check_in, datetime.min.time()) + timedelta(hours=rng.randint(8, 20))
+                    loader.add(PaymentModel, {
+                        "id": payment_id, "booking_id": booking_id, "amount": total,
+                        "status": "paid" if check_in <= today else "pending",
+                        "payment_method": rng.choice(PAYMENT_METHODS),
+                        "transaction_id": f"tx-{seed}-{payment_id}",
+                        "paid_at": paid_at if check_in <= today else None,
+                    })
+                    payment_id += 1
+                    for _ in range(poisson(rng, services_per_stay)):
+                        service_time = (datetime.combine(check_in, datetime.min.time())
+                                        + timedelta(days=rng.randrange(nights), hours=rng.randint(9, 20)))
+                        loader.add(Service, {
+                            "id": service_id, "type": rng.choice(SERVICE_TYPES), "employee": rng.choice(EMPLOYEES),
+                            "created_at": created_at, "status": "done" if service_time.date() < today else "scheduled",
+                            "service_time": service_time, "guest_id": guest, "booking_id": booking_id,
+                        })
+                        service_id += 1
+                booking_id += 1
+                gap = int(rng.expovariate(1 / mean_gap)) if mean_gap else 0
+                day = check_out + timedelta(days=gap)
+        loader.flush_all()
+        reset_sequences(session)
+        set_payment_status(session)
         session.commit()
-    print("Данные добавлены.")
+        rollups.rebuild(session)
+
+    elapsed = time.perf_counter() - started
+    return loader.counts, elapsed
+
+
+# Число событий с заданным средним (алгоритм Кнута, среднее небольшое)
+def poisson(rng: random.Random, mean: float) -> int:
+    if mean <= 0:
+        return 0
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные для отеля")
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--guests", type=int, default=200)
+    parser.add_argument("--years", type=float, default=1.0)
+    parser.add_argument("--occupancy", type=float, default=0.7)
+    parser.add_argument("--services-per-stay", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--no-copy", action="store_true", help="многострочный INSERT вместо COPY")
+    parser.add_argument("--today", type=date.fromisoformat, default=None,
+                        help="дата YYYY-MM-DD, от которой строятся брони (по умолчанию сегодня)")
+    args = parser.parse_args()
+    counts, elapsed = generate(args.rooms, args.guests, args.years, args.occupancy, args.services_per_stay,
+                               args.seed, args.batch_size, use_copy=not args.no_copy, today=args.today)
+    for table, count in counts.items():
+        print(f"{table}: {count}")
+    print(f"Данные добавлены за {elapsed:.1f} с.")
 
 if __name__ == "__main__":
-    seed()
\ No newline at end of file
+    main()
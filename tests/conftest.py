@@ -0,0 +1,125 @@
+import os
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import pytest
+
+# Тесты идут на SQLite в памяти: настройки задаются до импорта db и main
+os.environ.update(SCHEMA_BOOTSTRAP="1", USE_ASYNC_DB="0", METRICS_ENABLED="0", HOLD_BACKEND="memory")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, create_engine
+
+import db as database
+
+TEST_DATABASE_URL = "sqlite://"
+database.use_engine(create_engine(TEST_DATABASE_URL, **database.engine_options(TEST_DATABASE_URL)))
+
+import main
+import rollups
+from cache import room_cache
+from models import Guest, Administrator, RoomModel, Booking, PaymentModel, Service
+from payments import set_payment_status
+
+GUESTS = 3
+BOOKINGS_PER_GUEST = 3
+PAYMENTS_PER_BOOKING = 2
+START = date(2030, 1, 1)
+
+
+# SQL-выражения, выполненные движком внутри record(); считается каждый вызов курсора,
+# включая SAVEPOINT и запросы после ответа (пересчёт итогов)
+class QueryLog:
+    def __init__(self, engine):
+        self.statements = []
+        self.active = False
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append(statement)
+
+    @contextmanager
+    def record(self):
+        self.statements = []
+        self.active = True
+        try:
+            yield self
+        finally:
+            self.active = False
+
+    def __len__(self):
+        return len(self.statements)
+
+    def report(self) -> str:
+        return "\n".join(f"  {number}. {' '.join(statement.split())}"
+                         for number, statement in enumerate(self.statements, 1))
+
+
+# Небольшой набор данных: у каждого гостя несколько броней, у брони — платежи и услуга,
+# так что N+1 по любой связи сразу превышает бюджет
+def seed(session: Session) -> dict:
+    admin = Administrator(username="admin", password_hash="x", role="manager")
+    rooms = [RoomModel(number=str(100 + number), type=kind, price_per_night=Decimal(price), max_guests=guests)
+             for number, (kind, price, guests) in enumerate([("single", "50", 1), ("double", "80", 2), ("suite", "150", 4)])]
+    guests = [Guest(first_name=f"Guest{number}", last_name="Test", email=f"guest{number}@example.com")
+              for number in range(GUESTS)]
+    session.add_all([admin, *rooms, *guests])
+    session.flush()
+    bookings = []
+    for number, guest in enumerate(guests):
+        for stay in range(BOOKINGS_PER_GUEST):
+            check_in = START + timedelta(days=10 * stay)
+            bookings.append(Booking(guest_id=guest.id, room_id=rooms[number].id, admin_id=admin.id,
+                                    check_in_date=check_in, check_out_date=check_in + timedelta(days=3),
+                                    status="confirmed", total_price=Decimal("300.00"), guests_count=1))
+    session.add_all(bookings)
+    session.flush()
+    payments = [PaymentModel(booking_id=booking.id, amount=Decimal("100.00"), status="paid",
+                             transaction_id=f"tx-{booking.id}-{number}", paid_at=datetime(2030, 1, 1, 12))
+                for booking in bookings for number in range(PAYMENTS_PER_BOOKING)]
+    services = [Service(guest_id=booking.guest_id, booking_id=booking.id, type="spa", employee="Anna",
+                        status="scheduled", service_time=datetime.combine(booking.check_in_date, time(10)))
+                for booking in bookings]
+    session.add_all([*payments, *services])
+    set_payment_status(session)
+    session.commit()
+    rollups.rebuild(session)
+    return {"admin": admin.id, "room": rooms[0].id, "guest": guests[0].id, "booking": bookings[0].id,
+            "payment": payments[0].id, "service": services[0].id}
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope="session")
+def data(client) -> dict:
+    with Session(database.engine) as session:
+        ids = seed(session)
+    main.preload_caches()
+    return ids
+
+
+@pytest.fixture(scope="session")
+def query_log(client) -> QueryLog:
+    return QueryLog(database.engine)
+
+
+# Вызов укладывается ровно в budget запросов; кэш номеров сбрасывается, чтобы считался
+# холодный путь. Больше — регрессия (например, N+1), меньше — бюджет пора уменьшить
+@pytest.fixture
+def assert_queries(query_log, data):
+    def check(budget: int, call, *args, **kwargs):
+        room_cache.invalidate()
+        with query_log.record():
+            result = call(*args, **kwargs)
+        assert len(query_log) == budget, (
+            f"expected {budget} queries, got {len(query_log)}:\n{query_log.report()}"
+        )
+        return result
+    return check
@@ -0,0 +1,20 @@
+from datetime import date
+
+from sqlmodel import Session
+
+import db as database
+from availability import availability_index
+
+
+# Индекс загружен с горизонтом после броней фикстуры: прошлые даты проверяются по БД
+def test_availability_before_horizon_reads_database(client, data, assert_queries):
+    with Session(database.engine) as session:
+        availability_index.load(session, today=date(2030, 1, 20))
+    try:
+        response = assert_queries(2, client.get, "/rooms/availability", params={"from": "2030-01-02", "to": "2030-01-05"})
+        assert data["room"] not in [room["id"] for room in response.json()]
+        response = assert_queries(1, client.get, "/rooms/availability", params={"from": "2030-01-25", "to": "2030-01-26"})
+        assert data["room"] in [room["id"] for room in response.json()]
+    finally:
+        with Session(database.engine) as session:
+            availability_index.load(session)
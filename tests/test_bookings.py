@@ -0,0 +1,62 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError
+
+import main
+from pricing import price_booking
+
+
+@pytest.mark.parametrize("url", ["/bookings", "/bookings?manual_price=true"])
+def test_create_booking_rejects_reversed_dates(client, data, url):
+    response = client.post(url, json={"guest_id": data["guest"], "room_id": data["room"], "total_price": "10.00",
+                                      "check_in_date": "2031-08-05", "check_out_date": "2031-08-05"})
+    assert response.status_code == 422, response.text
+
+
+def test_update_booking_rejects_reversed_dates(client, data):
+    booking = client.post("/bookings", json={"guest_id": data["guest"], "room_id": data["room"],
+                                             "check_in_date": "2031-08-10", "check_out_date": "2031-08-12"}).json()
+    url = f"/bookings/{booking['id']}"
+    response = client.put(url, json={"check_in_date": "2031-08-12", "check_out_date": "2031-08-10"})
+    assert response.status_code == 422, response.text
+    response = client.put(url, json={"check_out_date": "2031-08-09"})
+    assert response.status_code == 400, response.text
+    response = client.put(url, json={"check_in_date": "2031-08-12"})
+    assert response.status_code == 400, response.text
+    assert client.get(url).json()["check_out_date"] == "2031-08-12"
+    response = client.put(url, json={"check_out_date": "2031-08-14"})
+    assert response.status_code == 200, response.text
+
+
+# Цена клиента или бронь без номера не освобождают от проверки дат
+@pytest.mark.parametrize("room_id,manual", [(1, True), (None, False)])
+def test_price_booking_checks_dates_before_manual_price(room_id, manual):
+    values = {"room_id": room_id, "check_in_date": date(2031, 9, 2), "check_out_date": date(2031, 9, 1),
+              "total_price": Decimal("10.00")}
+    with pytest.raises(HTTPException) as error:
+        price_booking(values, None, manual)
+    assert error.value.status_code == 400
+
+
+def test_profile_bookings_include_payment_status(client, data):
+    profile = client.get(f"/guests/{data['guest']}/profile").json()
+    assert profile["bookings"] and all(booking["payment_status"] for booking in profile["bookings"])
+    schema = client.get("/openapi.json").json()["components"]["schemas"]["ProfileBooking"]
+    assert "payment_status" in schema["required"]
+
+
+class ExclusionViolation(Exception):
+    pgcode = "23P01"
+
+
+# Возврат брони из отмены на занятые даты: ограничение booking_no_overlap (PostgreSQL) -> 409
+def test_bookings_status_overlap_is_conflict(client, data, monkeypatch):
+    def overlap(db, model, ids, status):
+        raise IntegrityError("UPDATE booking", None, ExclusionViolation("booking_no_overlap"))
+
+    monkeypatch.setattr(main, "bulk_status_returning", overlap)
+    response = client.patch("/bookings/status", json={"ids": [data["booking"]], "status": "confirmed"})
+    assert response.status_code == 409, response.text
@@ -0,0 +1,147 @@
+import asyncio
+import csv
+import re
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+import bulk
+import db as database
+from models import ChangeLog, DailyRollup
+
+
+class ChunkedRequest:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def read_lines(chunks):
+    async def collect():
+        return [line async for line in bulk.iter_lines(ChunkedRequest(chunks))]
+    return asyncio.run(collect())
+
+
+# Кириллица занимает два байта; граница чанка проходит внутри символа
+def test_iter_lines_multibyte_split_across_chunks():
+    body = '{"first_name": "Иван"}\n{"first_name": "Пётр"}'.encode("utf-8")
+    split = body.index("И".encode("utf-8")) + 1
+    assert read_lines([body[:split], body[split:]]) == ['{"first_name": "Иван"}', '{"first_name": "Пётр"}']
+
+
+def test_iter_lines_rejects_invalid_utf8():
+    with pytest.raises(HTTPException) as error:
+        read_lines([b'{"first_name": "\xff"}\n'])
+    assert error.value.status_code == 400
+
+
+# COPY без PostgreSQL: курсор пишет строки, пока поток не остановят
+class EndlessCopy:
+    def __init__(self):
+        self.cancelled = False
+        self.closed = False
+        self.driver_connection = self
+
+    def cursor(self):
+        return self
+
+    def copy_expert(self, sql, writer):
+        while not self.cancelled:
+            writer.write("1,row\n")
+
+    def cancel(self):
+        self.cancelled = True
+
+    def close(self):
+        self.closed = True
+
+
+class CopyEngine:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def raw_connection(self):
+        return self.connection
+
+
+# Клиент отключился посреди выгрузки: поток COPY не остаётся висеть на полной очереди
+def test_copy_export_stops_when_client_disconnects(monkeypatch):
+    connection = EndlessCopy()
+    threads = bulk.threading.active_count()
+    monkeypatch.setattr(bulk.database, "engine", CopyEngine(connection))
+    chunks = bulk.copy_to_chunks(bulk.Guest.__table__)
+    assert next(chunks) == b"1,row\n"
+    chunks.close()
+    assert connection.cancelled and connection.closed
+    assert bulk.threading.active_count() == threads
+
+
+# COPY FROM STDIN на SQLite: строки CSV вставляются через тот же курсор драйвера,
+# так что нарушение ограничения приходит ошибкой драйвера, как от psycopg2
+class SqliteCopyCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def copy_expert(self, sql, buffer):
+        table, columns = re.match(r"COPY (\w+) \(([^)]*)\)", sql).groups()
+        marks = ", ".join("?" for _ in columns.split(", "))
+        for row in csv.reader(buffer):
+            self.cursor.execute(f"INSERT INTO {table} ({columns}) VALUES ({marks})",
+                                [None if value == bulk.COPY_NULL else value for value in row])
+
+
+def test_copy_import_reports_bad_rows(client, data, monkeypatch):
+    monkeypatch.setattr(bulk, "is_postgres", lambda session: True)
+    monkeypatch.setattr(bulk, "raw_cursor", lambda session: SqliteCopyCursor(
+        session.connection().connection.dbapi_connection.cursor()))
+    lines = "\n".join(f'{{"booking_id": {data["booking"]}, "amount": "1.00", "status": "paid", '
+                      f'"transaction_id": "{transaction}"}}' for transaction in ("copy-1", "copy-2", "copy-1"))
+    response = client.post("/payments/bulk?copy=true", content=lines)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (2, 1)
+    assert report["errors"][0]["row"] == 3 and "UNIQUE" in report["errors"][0]["error"]
+
+
+# Статус оплаты пересчитывается только у броней загруженных платежей
+def test_bulk_payments_touch_only_their_bookings(client, data):
+    with Session(database.engine) as session:
+        last_seq = session.exec(select(func.max(ChangeLog.seq))).one()
+    response = client.post("/payments/bulk", content=f'{{"booking_id": {data["booking"]}, "amount": "1.00", '
+                                                       f'"status": "paid", "transaction_id": "bulk-status-1"}}')
+    assert response.json()["inserted"] == 1, response.text
+    with Session(database.engine) as session:
+        bookings = session.exec(select(ChangeLog.row_id).where(ChangeLog.seq > last_seq,
+                                                               ChangeLog.table_name == "booking")).all()
+    assert set(bookings) <= {data["booking"]}
+
+
+# Импорт пересчитывает итоги только своих дней, без полной пересборки
+def test_bulk_import_refreshes_only_imported_days(client, data, monkeypatch):
+    def rebuild(session, commit=True):
+        raise AssertionError("bulk import must not rebuild all rollups")
+
+    monkeypatch.setattr(bulk.rollups, "rebuild", rebuild)
+    response = client.post("/bookings/bulk", content=f'{{"guest_id": {data["guest"]}, "room_id": {data["room"]}, '
+                                                       f'"check_in_date": "2032-05-01", "check_out_date": "2032-05-03", '
+                                                       f'"total_price": "100.00"}}')
+    assert response.json()["inserted"] == 1, response.text
+    booking = client.get("/bookings", params={"limit": 1000}).json()[-1]
+    response = client.post("/payments/bulk", content=f'{{"booking_id": {booking["id"]}, "amount": "40.00", '
+                                                       f'"status": "paid", "transaction_id": "bulk-rollup-1"}}')
+    assert response.json()["inserted"] == 1, response.text
+    assert client.get(f"/bookings/{booking['id']}").json()["payment_status"] == "partial"
+    with Session(database.engine) as session:
+        days = {row.day: row for row in session.exec(select(DailyRollup).where(DailyRollup.day >= date(2032, 5, 1),
+                                                                              DailyRollup.day < date(2032, 5, 3))
+                                                      .order_by(DailyRollup.day))}
+    assert sorted(days) == [date(2032, 5, 1), date(2032, 5, 2)]
+    assert days[date(2032, 5, 1)].arrivals == 1
+    assert [day.room_revenue for day in days.values()] == [Decimal("50.00"), Decimal("50.00")]
@@ -0,0 +1,78 @@
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, delete, text
+from sqlmodel import Session
+
+import changes
+import db as database
+from migrations import upgrade
+from models import ChangeLog
+
+# Сценарий: транзакция X пишет seq a, затем открывается Y и пишет seq c, затем X пишет seq b > c
+# и коммитит, пока Y ещё открыта. Курсор не должен уйти за c, иначе после коммита Y
+# её изменение не будет выдано никогда
+X, Y = 1000, 1001
+
+
+def log(session: Session, txid: int, row_id: int) -> int:
+    entry = ChangeLog(table_name="guest", row_id=row_id, op=changes.UPSERT, changed_at=datetime.utcnow(), txid=txid)
+    session.add(entry)
+    session.flush()
+    return entry.seq
+
+
+def test_cursor_waits_for_open_transaction(data, monkeypatch):
+    with Session(database.engine) as session:
+        a = log(session, X, data["guest"])
+        c = log(session, Y, data["guest"] + 1)
+        b = log(session, X, data["guest"] + 2)
+        session.commit()
+        try:
+            since = (X - 1, 0)
+            # Y ещё открыта: xmin снимка — её txid
+            monkeypatch.setattr(changes, "visible_horizon", lambda session: Y)
+            page = changes.read_changes(session, since, 100)
+            assert [change["seq"] for change in page["changes"]] == [a, b]
+            since = changes.parse_cursor(page["cursor"])
+            # Y закоммитилась: её запись идёт после курсора
+            monkeypatch.setattr(changes, "visible_horizon", lambda session: Y + 1)
+            page = changes.read_changes(session, since, 100)
+            assert [change["seq"] for change in page["changes"]] == [c]
+        finally:
+            session.execute(delete(ChangeLog).where(ChangeLog.txid.in_([X, Y])))
+            session.commit()
+
+
+def test_parse_cursor():
+    assert changes.parse_cursor("0") == (0, 0)
+    assert changes.parse_cursor("17") == (0, 17)
+    assert changes.parse_cursor(changes.format_cursor((734, 18))) == (734, 18)
+
+
+# То же на настоящих транзакциях PostgreSQL: TEST_POSTGRES_URL — пустая база для тестов
+@pytest.mark.skipif(not os.getenv("TEST_POSTGRES_URL"), reason="TEST_POSTGRES_URL is not set")
+def test_cursor_with_interleaved_postgres_transactions():
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    upgrade(engine)
+    with Session(engine) as session:
+        since = changes.parse_cursor(changes.read_changes(session, (0, 0), 1_000_000)["cursor"])
+    x, y = engine.connect(), engine.connect()
+    try:
+        x_tx, y_tx = x.begin(), y.begin()
+        first = x.execute(text("INSERT INTO guest (first_name) VALUES ('x') RETURNING id")).scalar()
+        other = y.execute(text("INSERT INTO guest (first_name) VALUES ('y') RETURNING id")).scalar()
+        x.execute(text("UPDATE guest SET last_name = 'x' WHERE id = :id"), {"id": first})
+        x_tx.commit()
+        with Session(engine) as session:
+            page = changes.read_changes(session, since, 100, ["guest"])
+        assert [change["id"] for change in page["changes"]] == [first]
+        y_tx.commit()
+        with Session(engine) as session:
+            page = changes.read_changes(session, changes.parse_cursor(page["cursor"]), 100, ["guest"])
+        assert [change["id"] for change in page["changes"]] == [other]
+    finally:
+        x.close()
+        y.close()
+        engine.dispose()
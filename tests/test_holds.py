@@ -0,0 +1,25 @@
+import itertools
+import time
+from datetime import date
+
+import holds
+from holds import SqliteHoldStore
+
+
+def test_sqlite_take_is_single_use(tmp_path):
+    store = SqliteHoldStore(str(tmp_path / "holds.sqlite3"))
+    hold = store.place(1, date(2031, 10, 1), date(2031, 10, 3), 60)
+    assert store.take(hold.id) == hold
+    assert store.take(hold.id) is None
+    store.restore(hold.id)
+    assert store.take(hold.id) == hold
+
+
+# Удержание истекает сразу после проверки срока: take возвращает его целиком, а не падает
+def test_sqlite_take_when_hold_expires_during_take(tmp_path, monkeypatch):
+    store = SqliteHoldStore(str(tmp_path / "holds.sqlite3"))
+    hold = store.place(1, date(2031, 10, 1), date(2031, 10, 3), 10)
+    clock = itertools.chain([time.time()], itertools.repeat(hold.expires_at + 1))
+    monkeypatch.setattr(holds.time, "time", lambda: next(clock))
+    assert store.take(hold.id) == hold
+    assert store.take(hold.id) is None
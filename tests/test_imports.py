@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+# Модули и CLI импортируются в чистом интерпретаторе, без main: циклический импорт
+# availability -> db -> migrations -> rollups -> availability здесь и проявляется
+SCRIPT = """
+import availability, schedule, holds
+import db
+db.create_db_and_tables()
+import rollups
+rollups.main(["rebuild"])
+"""
+
+
+def test_modules_and_rollups_cli_import_standalone(tmp_path):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / 'hotel.db'}",
+           "HOLD_SQLITE_PATH": str(tmp_path / "holds.sqlite3")}
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=env, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert "daily_rollup: 0 rows" in result.stdout
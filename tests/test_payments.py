@@ -0,0 +1,28 @@
+from datetime import date
+from decimal import Decimal
+
+from sqlmodel import Session
+
+import db as database
+from archive import archive_batch
+from models import Booking, PaymentModel
+
+TRANSACTION = "archived-tx-1"
+
+
+# Уникальность transaction_id в таблице payment не покрывает платежи, перенесённые в архив
+def test_archived_transaction_is_conflict(client, data):
+    with Session(database.engine) as session:
+        booking = Booking(guest_id=data["guest"], room_id=data["room"], check_in_date=date(2020, 3, 1),
+                          check_out_date=date(2020, 3, 3), status="checked_out", total_price=Decimal("100.00"))
+        session.add(booking)
+        session.flush()
+        session.add(PaymentModel(booking_id=booking.id, amount=Decimal("100.00"), status="paid",
+                                 transaction_id=TRANSACTION))
+        session.commit()
+        assert archive_batch(session, date(2020, 12, 31))["payment"] == 1
+    response = client.post("/payments", json={"booking_id": data["booking"], "amount": "1.00", "status": "paid",
+                                              "transaction_id": TRANSACTION})
+    assert response.status_code == 409, response.text
+    response = client.put(f"/payments/{data['payment']}", json={"transaction_id": TRANSACTION})
+    assert response.status_code == 409, response.text
@@ -0,0 +1,162 @@
+from datetime import date
+
+import pytest
+
+import request
+
+# Точное число SQL-запросов на вызов. Бюджет не зависит от объёма данных: у каждой брони
+# несколько платежей и услуга, поэтому ленивые загрузки связей (N+1) его превышают.
+# Шаблоны путей заполняются id из фикстуры data
+
+READ_BUDGETS = [
+    ("GET", "/guests", {}, 1),
+    ("GET", "/guests/search", {"params": {"q": "Guest"}}, 4),
+    ("GET", "/guests/{guest}", {}, 1),
+    ("GET", "/guests/{guest}/profile", {}, 4),
+    ("GET", "/guests/{guest}/bookings", {}, 1),
+    ("GET", "/guests/{guest}/bookings", {"params": {"include_archived": True}}, 1),
+    ("GET", "/guests/{guest}/services", {}, 1),
+    ("GET", "/bookings", {}, 1),
+    ("GET", "/bookings/details", {}, 1),
+    ("GET", "/bookings/details", {"params": {"guest_id": 1, "limit": 2}}, 1),
+    ("GET", "/bookings/{booking}", {}, 1),
+    ("GET", "/bookings/{booking}/payments", {}, 1),
+    ("GET", "/bookings/{booking}/payments", {"params": {"include_archived": True}}, 1),
+    ("GET", "/rooms", {}, 1),
+    ("GET", "/rooms/{room}", {}, 1),
+    ("GET", "/rooms/availability", {"params": {"from": "2030-01-02", "to": "2030-01-05"}}, 1),
+    ("POST", "/rooms/availability/batch", {"json": {"ranges": [{"check_in": "2030-01-02", "check_out": "2030-01-05"}]}}, 1),
+    ("POST", "/quotes/batch", {"json": {"ranges": [{"check_in": "2030-03-02", "check_out": "2030-03-05"}]}}, 1),
+    ("GET", "/services", {}, 1),
+    ("GET", "/services/{service}", {}, 1),
+    ("GET", "/services/schedule", {"params": {"date": "2030-01-01", "view": "week"}}, 0),
+    ("POST", "/services/free-slots", {"json": {"queries": [{"date": "2030-01-01"}]}}, 0),
+    ("GET", "/payments", {}, 1),
+    ("GET", "/payments/{payment}", {}, 1),
+    ("GET", "/reports/occupancy", {"params": {"date_from": "2030-01-01", "date_to": "2030-01-31"}}, 2),
+    ("GET", "/reports/revenue", {"params": {"date_from": "2030-01-01", "date_to": "2030-01-31", "group": "month"}}, 2),
+    ("GET", "/administrators", {}, 1),
+    ("GET", "/changes", {"params": {"since": 0}}, 7),
+    ("GET", "/bookings/export", {}, 1),
+]
+
+
+def request_id(method: str, path: str, options: dict) -> str:
+    query = "&".join(f"{key}={value}" for key, value in options.get("params", {}).items())
+    return f"{method} {path}" + (f"?{query}" if query else "")
+
+
+@pytest.mark.parametrize("method,path,options,budget", READ_BUDGETS,
+                         ids=[request_id(method, path, options) for method, path, options, _ in READ_BUDGETS])
+def test_read_budget(client, data, assert_queries, method, path, options, budget):
+    response = assert_queries(budget, client.request, method, path.format(**data), **options)
+    assert response.status_code == 200, response.text
+
+
+def test_create_booking_budget(client, data, assert_queries):
+    response = assert_queries(10, client.post, "/bookings", json={
+        "guest_id": data["guest"], "room_id": data["room"], "check_in_date": "2031-01-01",
+        "check_out_date": "2031-01-04", "guests_count": 1,
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_booking_with_hold_budget(client, data, assert_queries):
+    hold = client.post("/holds", json={"room_id": data["room"], "check_in": "2031-02-01",
+                                       "check_out": "2031-02-03"}).json()
+    response = assert_queries(9, client.post, "/bookings?manual_price=true", json={
+        "guest_id": data["guest"], "room_id": data["room"], "check_in_date": "2031-02-01",
+        "check_out_date": "2031-02-03", "total_price": "120.00", "hold_id": hold["hold_id"],
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_update_booking_budget(client, data, assert_queries):
+    booking = client.post("/bookings", json={"guest_id": data["guest"], "room_id": data["room"],
+                                             "check_in_date": "2031-03-01", "check_out_date": "2031-03-02"}).json()
+    # одна дата без другой: вторая читается для проверки диапазона
+    response = assert_queries(12, client.put, f"/bookings/{booking['id']}",
+                              json={"check_out_date": "2031-03-03", "total_price": "200.00"})
+    assert response.status_code == 200, response.text
+
+
+def test_bookings_status_budget(client, data, assert_queries):
+    ids = [client.post("/bookings", json={"guest_id": data["guest"], "room_id": data["room"],
+                                          "check_in_date": f"2031-04-{day:02d}",
+                                          "check_out_date": f"2031-04-{day + 1:02d}"}).json()["id"]
+           for day in (1, 3, 5)]
+    response = assert_queries(8, client.patch, "/bookings/status", json={"ids": ids, "status": "checked_out"})
+    assert sorted(response.json()["updated"]) == sorted(ids)
+
+
+def test_delete_booking_budget(client, data, assert_queries):
+    booking = client.post("/bookings", json={"guest_id": data["guest"], "room_id": data["room"],
+                                             "check_in_date": "2031-05-01", "check_out_date": "2031-05-02"}).json()
+    response = assert_queries(11, client.delete, f"/bookings/{booking['id']}")
+    assert response.status_code == 200, response.text
+
+
+def test_create_payment_budget(client, data, assert_queries):
+    # transaction_id проверяется и по архиву платежей
+    response = assert_queries(4, client.post, "/payments", json={
+        "booking_id": data["booking"], "amount": "10.00", "status": "paid", "transaction_id": "budget-create",
+    })
+    assert response.status_code == 200, response.text
+
+
+def test_ingest_payments_budget(client, data, assert_queries):
+    lines = "\n".join(f'{{"booking_id": {data["booking"]}, "amount": "1.00", "status": "paid", '
+                      f'"transaction_id": "budget-ingest-{number}"}}' for number in range(20))
+    response = assert_queries(6, client.post, "/payments/ingest", content=lines)
+    assert response.json()["inserted"] == 20, response.text
+
+
+def test_create_guest_budget(client, assert_queries):
+    response = assert_queries(2, client.post, "/guests", json={"first_name": "Budget"})
+    assert response.status_code == 200, response.text
+
+
+def test_create_hold_budget(client, data, assert_queries):
+    response = assert_queries(1, client.post, "/holds", json={"room_id": data["room"], "check_in": "2031-06-01",
+                                                               "check_out": "2031-06-03"})
+    assert response.status_code == 201, response.text
+
+
+# Функции request.py под теми же бюджетами. Результат разбирается внутри замера:
+# обращение к связи, которую функция не загрузила заранее, добавит запрос или упадёт
+# на отсоединённом объекте
+def booking_links(bookings):
+    return [(booking.room.number, [payment.amount for payment in booking.payments]) for booking in bookings]
+
+
+HELPER_BUDGETS = [
+    ("get_all_guests", lambda data: {}, None, 1),
+    ("get_bookings_by_guest", lambda data: {"guest_id": data["guest"]}, booking_links, 2),
+    ("get_guest_profile", lambda data: {"guest_id": data["guest"]}, None, 4),
+    ("get_available_rooms", lambda data: {}, None, 1),
+    ("get_available_rooms", lambda data: {"check_in": date(2030, 1, 5), "check_out": date(2030, 1, 8)}, None, 1),
+    ("get_payments_by_booking", lambda data: {"booking_id": data["booking"]}, None, 1),
+    ("get_services_by_guest", lambda data: {"guest_id": data["guest"]}, None, 1),
+    ("get_booking_details", lambda data: {}, None, 1),
+    ("get_booking_details", lambda data: {"limit": 2, "guest_id": data["guest"]}, None, 1),
+]
+
+
+@pytest.mark.parametrize("name,arguments,use,budget", HELPER_BUDGETS,
+                         ids=[f"{name}-{number}" for number, (name, *_) in enumerate(HELPER_BUDGETS)])
+def test_request_helper_budget(data, assert_queries, name, arguments, use, budget):
+    helper = getattr(request, name)
+
+    def call():
+        result = helper(**arguments(data))
+        if use is not None:
+            use(result)
+        return result
+
+    assert assert_queries(budget, call)
+
+
+def test_request_create_booking_budget(data, assert_queries):
+    booking = assert_queries(3, request.create_booking, data["guest"], data["room"], data["admin"],
+                             date(2031, 7, 1), date(2031, 7, 3), 1)
+    assert booking.total_price > 0
@@ -0,0 +1,35 @@
+from datetime import date
+
+import rollups
+
+
+# Сессия PostgreSQL, которая только записывает выполненные выражения
+class RecordingSession:
+    class bind:
+        class dialect:
+            name = "postgresql"
+
+    def __init__(self):
+        self.statements = []
+
+    def get_bind(self):
+        return self.bind
+
+    def execute(self, statement, parameters):
+        self.statements.append((" ".join(str(statement).split()), parameters))
+
+
+def test_refresh_locks_only_its_days():
+    session = RecordingSession()
+    rollups.lock_days(session, [(date(2031, 1, 5), date(2031, 1, 7)), (date(2031, 1, 1), date(2031, 1, 2))])
+    (shared, _), (days, parameters) = session.statements
+    assert "pg_advisory_xact_lock_shared" in shared
+    assert "pg_advisory_xact_lock(:key, day)" in days
+    assert parameters["days"] == [date(2031, 1, 1).toordinal(), date(2031, 1, 5).toordinal(),
+                                  date(2031, 1, 6).toordinal()]
+
+
+def test_refresh_of_many_days_takes_global_lock():
+    session = RecordingSession()
+    rollups.lock_days(session, [(date(2031, 1, 1), date(2031, 6, 1))])
+    assert session.statements == [("SELECT pg_advisory_xact_lock(:key)", {"key": rollups.ROLLUP_LOCK})]
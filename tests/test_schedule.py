@@ -0,0 +1,34 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from schedule import reserved_slot, schedule_index
+
+
+def test_service_time_with_timezone_is_stored_as_utc(client, data):
+    response = client.post("/services", json={"guest_id": data["guest"], "type": "massage", "employee": "Boris",
+                                              "service_time": "2032-01-01T13:30:00+03:00"})
+    assert response.status_code == 200, response.text
+    assert response.json()["service_time"] == "2032-01-01T10:30:00"
+    response = client.post("/services", json={"guest_id": data["guest"], "type": "massage", "employee": "Boris",
+                                              "service_time": "2032-01-01T11:00:00Z"})
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"]["alternatives"][0] == "2032-01-01T11:30:00"
+
+
+# Слот занят с проверки до выхода из блока: второй запрос на то же время получает 409,
+# а после отката первого слот снова свободен
+def test_reserved_slot_blocks_until_released():
+    values = {"employee": "Clara", "type": "spa", "service_time": datetime(2032, 2, 1, 10)}
+    with pytest.raises(RuntimeError):
+        with reserved_slot(values):
+            with pytest.raises(HTTPException) as error:
+                with reserved_slot({**values, "service_time": datetime(2032, 2, 1, 11)}):
+                    pass
+            assert error.value.status_code == 409
+            assert schedule_index.schedule("Clara", datetime(2032, 2, 1), datetime(2032, 2, 2)) == []
+            raise RuntimeError("commit failed")
+    with reserved_slot(values):
+        pass
+    assert not schedule_index.conflicts("Clara", datetime(2032, 2, 1), datetime(2032, 2, 2))
@@ -0,0 +1,84 @@
+from typing import List
+
+from sqlalchemy import update, delete, select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from models import Booking, PaymentModel, Service, BookingArchive, ServiceArchive
+
+# Изменение и удаление одним выражением с RETURNING вместо get + commit + refresh.
+# При удалении родителя ссылки дочерних строк обнуляются, как это делал ORM
+# (каскадного удаления в models.py нет). Архивные строки (archive.py) ссылаются так же.
+CHILD_REFERENCES = {
+    "guest": [(Booking.__table__, "guest_id"), (Service.__table__, "guest_id"),
+              (BookingArchive, "guest_id"), (ServiceArchive, "guest_id")],
+    "room": [(Booking.__table__, "room_id"), (BookingArchive, "room_id")],
+    "booking": [(PaymentModel.__table__, "booking_id"), (Service.__table__, "booking_id")],
+}
+
+
+def update_statement(model, object_id: int, values: dict):
+    table = model.__table__
+    if not values:
+        return select(table).where(table.c.id == object_id)
+    return update(table).where(table.c.id == object_id).values(**values).returning(*table.c)
+
+
+def delete_statements(model, object_id: int) -> list:
+    table = model.__table__
+    statements = [
+        update(child).where(child.c[column] == object_id).values({column: None})
+        for child, column in CHILD_REFERENCES.get(table.name, [])
+    ]
+    statements.append(delete(table).where(table.c.id == object_id).returning(table.c.id))
+    return statements
+
+
+def bulk_status_statement(model, ids: List[int], status: str):
+    table = model.__table__
+    return update(table).where(table.c.id.in_(ids)).values(status=status).returning(*table.c)
+
+
+# Строка RETURNING -> объект модели без привязки к сессии
+def to_model(model, row):
+    return model(**row._mapping) if row is not None else None
+
+
+def update_returning(db: Session, model, object_id: int, values: dict):
+    row = db.execute(update_statement(model, object_id, values)).first()
+    db.commit()
+    return to_model(model, row)
+
+
+def delete_returning(db: Session, model, object_id: int) -> bool:
+    for statement in delete_statements(model, object_id):
+        result = db.execute(statement)
+    row = result.first()
+    if row is None:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+
+def bulk_status_returning(db: Session, model, ids: List[int], status: str):
+    rows = db.execute(bulk_status_statement(model, ids, status)).all()
+    db.commit()
+    return [to_model(model, row) for row in rows]
+
+
+async def async_update_returning(db: AsyncSession, model, object_id: int, values: dict):
+    row = (await db.execute(update_statement(model, object_id, values))).first()
+    await db.commit()
+    return to_model(model, row)
+
+
+async def async_delete_returning(db: AsyncSession, model, object_id: int) -> bool:
+    for statement in delete_statements(model, object_id):
+        result = await db.execute(statement)
+    row = result.first()
+    if row is None:
+        await db.rollback()
+        return False
+    await db.commit()
+    return True